@@ -1,101 +1,143 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import copy
-
-
-def reasign(s):
-    """
-    Deep copy of s to bypass the "passing by reference" done by python
-    :param s: a state
-    :param grid_size: un tuple (x,y) représentant la taille de la grille 
-    :return new_state: la copie 
-    """
-    new_state = {}
-    for key in s.keys():
-        new_state[key] = copy.copy(s[key])
-
-    return new_state
+import collections
+
+# Liste figée des actions, l'indice d'une action sert de colonne dans les tables indexées par état encodé
+ACTIONS = ["clean", "load", "move_left", "move_right", "move_up", "move_down", "stay", "dead"]
+ACTION_INDEX = {action: index for index, action in enumerate(ACTIONS)}
+N_ACTIONS = len(ACTIONS)
+# Les actions possibles d'un état tiennent dans un masque de N_ACTIONS bits (bit i pour ACTIONS[i]), ces tables
+# donnent pour chaque masque les indices et les noms des actions possibles, dans l'ordre de ACTIONS
+MASK_INDICES = [tuple(a for a in range(N_ACTIONS) if mask >> a & 1) for mask in range(1 << N_ACTIONS)]
+MASK_ACTIONS = [tuple(ACTIONS[a] for a in indices) for indices in MASK_INDICES]
+
+
+def action_mask(actions):
+    """
+    :param actions: une liste d'actions
+    :return: le masque des actions
+    """
+    mask = 0
+    for action in actions:
+        mask |= 1 << ACTION_INDEX[action]
+    return mask
+
+
+class GridState(collections.namedtuple("GridState", ["battery_level", "robot", "base", "dirty"])):
+    """
+    Etat immuable et hachable: le niveau de batterie, les cases du robot et de la base (numérotées x + y * largeur
+    comme dans StateCodec) et le masque de bits des cases sales. Les composantes sont dans l'ordre de StateCodec.split,
+    GridState(*codec.split(index)) et codec.pack(*state) passent donc d'une représentation à l'autre.
+    Les actions retournent un nouvel état sans rien copier. La vue dict (to_dict) sert à l'affichage.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, state, grid_size):
+        """
+        :param state: un état sous forme de dict
+        :param grid_size: un tuple (x,y) représentant la taille de la grille
+        :return: l'état immuable
+        """
+        width = grid_size[0]
+        dirty = 0
+        for x, y in state["dirty_cells"]:
+            dirty |= 1 << (x + y * width)
+        robot_x, robot_y = state["robot_pos"]
+        base_x, base_y = state["base_pos"]
+        return cls(state["battery_level"], robot_x + robot_y * width, base_x + base_y * width, dirty)
+
+    def to_dict(self, grid_size):
+        """
+        Vue dict de l'état, une nouvelle à chaque appel, les cases sales sont triées par position
+        :param grid_size: un tuple (x,y) représentant la taille de la grille
+        :return: l'état sous forme de dict
+        """
+        width = grid_size[0]
+        return {
+            "base_pos": [self.base % width, self.base // width],
+            "robot_pos": [self.robot % width, self.robot // width],
+            "dirty_cells": sorted([[cell % width, cell // width] for cell in range(grid_size[0] * grid_size[1])
+                                   if self.dirty >> cell & 1]),
+            "battery_level": self.battery_level
+        }
 
 
 def move_up(s, grid_size):
     """
     Change la position du robot en décrementant la coordonnée y de 1
-    :param s: un état
+    :param s: un état (GridState)
     :param grid_size: un tuple (x,y) représentant la taille de la grille 
     :return new_state: le nouvel état
     """
-    new_state = unload(s)
-    if new_state["robot_pos"][1] != 0:
-        new_state["robot_pos"][1] -= 1
-    return new_state
+    battery_level, robot, base, dirty = s
+    if robot >= grid_size[0]:
+        robot -= grid_size[0]
+    return GridState(battery_level - 1, robot, base, dirty)
 
 
 def move_down(s, grid_size):
     """
     Change la position du robot en incrémentant la coordonnée y de 1   
-    :param s: un état 
+    :param s: un état (GridState)
     :param grid_size: un tuple (x,y) représentant la taille de la grille 
     :return new_state: le nouvel état
     """
-    new_state = unload(s)
-    if new_state["robot_pos"][1] != grid_size[1] - 1:
-        new_state["robot_pos"][1] += 1
-    return new_state
+    battery_level, robot, base, dirty = s
+    if robot // grid_size[0] != grid_size[1] - 1:
+        robot += grid_size[0]
+    return GridState(battery_level - 1, robot, base, dirty)
 
 
 def move_left(s, grid_size):
     """
     Change la position du robot en décrémentant la coordonnée x de 1    
-    :param s: un état
+    :param s: un état (GridState)
     :param grid_size: un tuple (x,y) représentant la taille de la grille 
     :return new_state: le nouvel état
     """
-    new_state = unload(s)
-    if new_state["robot_pos"][0] != 0:
-        new_state["robot_pos"][0] -= 1
-    return new_state
+    battery_level, robot, base, dirty = s
+    if robot % grid_size[0] != 0:
+        robot -= 1
+    return GridState(battery_level - 1, robot, base, dirty)
 
 
 def move_right(s, grid_size):
     """
     Change la position du robot en incrémentant la coordonnée x de 1    
-    :param s: un état
+    :param s: un état (GridState)
     :return new_state: le nouvel état
     """
-    new_state = unload(s)
-    if new_state["robot_pos"][0] != grid_size[0] - 1:
-        new_state["robot_pos"][0] += 1
-    return new_state
+    battery_level, robot, base, dirty = s
+    if robot % grid_size[0] != grid_size[0] - 1:
+        robot += 1
+    return GridState(battery_level - 1, robot, base, dirty)
 
 
 def clean(s):
     """
     Nettoie la case sur laquelle se trouve le robot    
-    :param s: un état
+    :param s: un état (GridState)
     :return new_state: le nouvel état
     """
-    new_state = unload(s)
-    new_state["dirty_cells"].remove(s["robot_pos"])
-    return new_state
+    battery_level, robot, base, dirty = s
+    return GridState(battery_level - 1, robot, base, dirty & ~(1 << robot))
 
 
 def load(s):
     """
     Charge la batterie    
-    :param s: un état
+    :param s: un état (GridState)
     :return new_state: le nouvel état
     """
-    new_state = reasign(s)
-    new_state["battery_level"] += 1
-    return new_state
+    battery_level, robot, base, dirty = s
+    return GridState(battery_level + 1, robot, base, dirty)
 
 
 def unload(s):
     """
     décharge la batterie    
-    :param s: un état
+    :param s: un état (GridState)
     """
-    new_state = reasign(s)
-    new_state["battery_level"] -= 1
-    return new_state
-
+    battery_level, robot, base, dirty = s
+    return GridState(battery_level - 1, robot, base, dirty)
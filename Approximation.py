@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Q learning à approximation linéaire, pour les grilles trop grandes pour des tables indexées par état (au-delà de 4x4
+le nombre d'états, et même leur index StateCodec sur 64 bits, explose). Les états sont des GridState manipulés par
+Simulator.get, la Qvaleur est Q(s, a) = somme des poids de l'action a sur les attributs binaires actifs de s: la
+mémoire ne dépend que de la taille de la grille et de la batterie.
+"""
+import time
+from random import choice
+import numpy as np
+import Actions
+import Learning
+import Metrics
+import Stats
+
+
+def direction(dx, dy):
+    """
+    :return: l'indice (0 à 8) de la direction (signe de dx, signe de dy)
+    """
+    return (dx > 0) - (dx < 0) + 1 + 3 * ((dy > 0) - (dy < 0) + 1)
+
+
+class Features:
+    """
+    Attributs binaires d'un état, par groupes:
+    - un biais, chaque case sale, le nombre de cases sales
+    - la position du robot relative à la base
+    - le niveau de batterie et la marge (batterie - distance à la base), en tile coding: plusieurs pavages décalés
+      d'intervalles, une tuile active par pavage
+    - la direction de la base croisée avec la marge (faible, moyenne, large), pour apprendre à rentrer à temps
+    - la direction et la distance de la case sale la plus proche, ou tout est propre
+    """
+
+    def __init__(self, grid_size, max_battery_level, battery_tile=4, margin_tile=2, n_tilings=2):
+        """
+        :param grid_size: un tuple (x,y) représentant la taille de la grille
+        :param max_battery_level: le niveau de batterie maximal
+        :param battery_tile: la largeur des tuiles du niveau de batterie
+        :param margin_tile: la largeur des tuiles de la marge
+        :param n_tilings: le nombre de pavages décalés
+        """
+        width, height = grid_size
+        self.grid_size = grid_size
+        self.n_cells = width * height
+        self.x = [cell % width for cell in range(self.n_cells)]
+        self.y = [cell // width for cell in range(self.n_cells)]
+        self.size = 0
+        self.bias = self.group(1)
+        self.dirty = self.group(self.n_cells)
+        self.n_dirty = self.group(self.n_cells)
+        self.relative = self.group((2 * width - 1) * (2 * height - 1))
+        self.battery = self.tiling(0, max_battery_level, battery_tile, n_tilings)
+        self.min_margin = -(width + height - 2)
+        self.margin = self.tiling(self.min_margin, max_battery_level, margin_tile, n_tilings)
+        self.home = self.group(3 * 9)
+        self.nearest = self.group(4 * 9)
+        self.clean = self.group(1)
+
+    def group(self, size):
+        """
+        Réserve un groupe d'attributs
+        :param size: le nombre d'attributs du groupe
+        :return: l'indice du premier
+        """
+        start = self.size
+        self.size += size
+        return start
+
+    def tiling(self, low, high, tile, n_tilings):
+        """
+        Réserve les attributs du tile coding d'une valeur entière de [low, high]
+        :param tile: la largeur des tuiles
+        :param n_tilings: le nombre de pavages, décalés chacun de tile / n_tilings
+        :return: pour chaque valeur de low à high, la liste des indices de ses tuiles
+        """
+        n_tiles = (high - low) // tile + 2
+        start = self.group(n_tilings * n_tiles)
+        return [[start + t * n_tiles + (value - low + t * tile // n_tilings) // tile for t in range(n_tilings)]
+                for value in range(low, high + 1)]
+
+    def active(self, state):
+        """
+        :param state: un état (GridState)
+        :return: le tableau des indices des attributs actifs
+        """
+        battery_level, robot, base, dirty = state
+        x, y = self.x[robot], self.y[robot]
+        dx, dy = self.x[base] - x, self.y[base] - y
+        width, height = self.grid_size
+        margin = battery_level - abs(dx) - abs(dy)
+        active = [self.bias, self.relative + (width - 1 - dx) * (2 * height - 1) + height - 1 - dy]
+        active += self.battery[battery_level]
+        active += self.margin[margin - self.min_margin]
+        active.append(self.home + 9 * (0 if margin <= 1 else 1 if margin <= 3 else 2) + direction(dx, dy))
+
+        count, nearest, distance = 0, None, None
+        while dirty:
+            bit = dirty & -dirty
+            dirty ^= bit
+            cell = bit.bit_length() - 1
+            active.append(self.dirty + cell)
+            count += 1
+            d = abs(self.x[cell] - x) + abs(self.y[cell] - y)
+            if nearest is None or d < distance:
+                nearest, distance = cell, d
+        active.append(self.n_dirty + count)
+        if nearest is None:
+            active.append(self.clean)
+        else:
+            far = 0 if distance == 0 else 1 if distance == 1 else 2 if distance <= 3 else 3
+            active.append(self.nearest + 9 * far + direction(self.x[nearest] - x, self.y[nearest] - y))
+        return np.array(active)
+
+
+class LinearPolicy:
+    """
+    Politique gloutonne d'une Qvaleur linéaire, calculée à la demande: policy[index] donne le nom de l'action comme
+    pour les autres politiques, sans table des états. Les égalités sont départagées comme dans les algorithmes: la
+    première action possible dans l'ordre de Actions.ACTIONS.
+    """
+
+    def __init__(self, simulator, features, weights):
+        """
+        :param simulator: le simulateur
+        :param features: les attributs (Features)
+        :param weights: les poids, un tableau (N_ACTIONS, features.size)
+        """
+        self.simulator = simulator
+        self.features = features
+        self.weights = weights
+
+    def legal(self, state):
+        """
+        :param state: un état (GridState)
+        :return: les indices des actions possibles, dans l'ordre de Actions.ACTIONS
+        """
+        return sorted(Actions.ACTION_INDEX[action] for action in self.simulator.get_actions(state))
+
+    def greedy(self, state, active=None, legal=None):
+        """
+        :param state: un état (GridState)
+        :param active: les attributs actifs de state s'ils sont déjà calculés
+        :param legal: les actions possibles de state si elles sont déjà calculées
+        :return a, q_value: l'indice de l'action gloutonne et sa Qvaleur
+        """
+        q_values = self.weights[:, self.features.active(state) if active is None else active].sum(axis=1)
+        a = max(self.legal(state) if legal is None else legal, key=q_values.__getitem__)
+        return a, q_values[a]
+
+    def value(self, state):
+        """
+        :param state: un état (GridState)
+        :return: max_a Q(state, a) sur les actions possibles
+        """
+        return self.greedy(state)[1]
+
+    def __getitem__(self, index):
+        """
+        :param index: un état encodé
+        :return: l'action de la politique
+        """
+        return Actions.ACTIONS[self.greedy(self.simulator.state(index))[0]]
+
+
+def linear_q_learning(simulator, time_limit, gamma, epsilon, alpha, initial_state, features=None, tables=None,
+                      recorder=None, record_every=Learning.RECORD_STEPS):
+    """
+    Q learning (cible max_a' Q(s', a')) à approximation linéaire: à chaque pas les poids de l'action jouée sur les
+    attributs actifs reçoivent alpha / (nombre d'attributs actifs) * delta, en une opération numpy. Comme q_learning,
+    un épisode repart de l'état initial à la mort, et aussi au but.
+    La seule récompense positive est celle du but, rarement atteint au hasard sur une grande grille: les poids du nombre
+    de cases sales partent de goal_reward, une Qvaleur optimiste qui pousse vers les états moins sales pas encore vus.
+    :param simulator: le simulateur
+    :param time_limit: la limite de temps en seconde
+    :param gamma: un hyperparamètre
+    :param epsilon: un autre hyperparamètre
+    :param alpha: encore un
+    :param initial_state: l'état initial
+    :param features: les attributs (Features), ceux de la grille du simulateur par défaut
+    :param tables: si donné, un dict dans lequel sont rangés les poids ("weights")
+    :param recorder: le Metrics.Recorder des courbes (Learning.Q_LEARNING_METRICS), un tampon seul par défaut
+    :param record_every: le nombre de pas entre deux points des courbes
+    :return policy: la politique (LinearPolicy)
+    """
+    if features is None:
+        features = Features(simulator.grid_size, simulator.max_battery_level)
+    weights = np.zeros((Actions.N_ACTIONS, features.size))
+    weights[:, features.n_dirty:features.n_dirty + features.n_cells] = simulator.goal_reward
+    policy = LinearPolicy(simulator, features, weights)
+    if recorder is None:
+        recorder = Metrics.Recorder(Learning.Q_LEARNING_METRICS)
+    s_initial = simulator.as_state(initial_state)
+    start = s_initial, features.active(s_initial), policy.legal(s_initial)
+    terminal = [simulator.dead_reward, simulator.goal_reward]
+    print("attributs:", features.size, "poids:", weights.size)
+
+    state, active, legal = start
+    start_time = time.time()
+    count = 1
+    steps = 0
+    total_steps = 0
+    next_record = record_every
+    while time.time() - start_time < time_limit:
+        for _ in range(Learning.CLOCK_STEPS):
+            q_values = weights[:, active].sum(axis=1)
+            if simulator.roll_dice(1 - epsilon + epsilon / len(legal)):
+                a = max(legal, key=q_values.__getitem__)
+            else:
+                a = choice(legal)
+            reward, future_state = simulator.get(Actions.ACTIONS[a], state)
+            future_active = features.active(future_state)
+            future_legal = policy.legal(future_state)
+            _, future_q_value = policy.greedy(future_state, future_active, future_legal)
+            delta = reward + gamma * future_q_value - q_values[a]
+            weights[a, active] += alpha / len(active) * delta
+
+            if reward in terminal:
+                state, active, legal = start
+            else:
+                state, active, legal = future_state, future_active, future_legal
+        steps += Learning.CLOCK_STEPS
+        total_steps += Learning.CLOCK_STEPS
+
+        time_spent = time.time() - start_time
+        if total_steps >= next_record:
+            next_record += record_every
+            recorder.record(total_steps, time_spent, policy.value(s_initial))
+        if time_spent > count:
+            count += 1
+            Stats.count("updates", steps)
+            steps = 0
+            Stats.report("linear_q_learning", elapsed=time_spent, q_value_s0=policy.value(s_initial))
+
+        if Learning.interrupt_flag:
+            break
+    Stats.count("updates", steps)
+    print("linear_q_learning: {} pas, {:.0f}/s".format(total_steps, total_steps / (time.time() - start_time)))
+
+    if tables is not None:
+        tables["weights"] = weights
+    return policy
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import random
+import threading
+import time
+import numpy as np
+
+
+class Checkpointer:
+    """
+    Points de reprise périodiques d'un apprentissage (monte_carlo, q_learning) dans un fichier .npz compressé: la
+    fonction de Qvaleur, la politique, l'état du générateur aléatoire et les valeurs de la boucle (epsilon, courbes...).
+    L'état est copié dans la boucle d'apprentissage puis compressé et écrit par un thread, sous un nom temporaire
+    renommé ensuite: le fichier est toujours un point de reprise complet.
+    """
+
+    def __init__(self, path, interval):
+        """
+        :param path: le fichier des points de reprise, réécrit à chaque fois
+        :param interval: le temps minimal en seconde entre deux points de reprise
+        """
+        self.path = path
+        self.interval = interval
+        self.last = time.time()
+        self.thread = None
+
+    def due(self):
+        """
+        :return: vrai si le dernier point de reprise date de plus de interval secondes
+        """
+        return time.time() - self.last >= self.interval
+
+    def save(self, q_function, policy, **values):
+        """
+        Copie l'état de l'apprentissage et lance son écriture en arrière-plan, après la fin de la précédente
+        :param q_function: la fonction de Qvaleur, dict état encodé -> liste de N_ACTIONS valeurs
+        :param policy: la politique (GreedyPolicy) de q_function
+        :param values: les valeurs de la boucle, des scalaires ou des listes de nombres
+        """
+        self.last = time.time()
+        version, internal, gauss = random.getstate()
+        arrays = {key: np.asarray(value) for key, value in values.items()}
+        arrays.update({
+            "states": np.fromiter(q_function, np.int64, len(q_function)),
+            "q_function": np.array(list(q_function.values())),
+            "best": np.fromiter(map(policy.best.__getitem__, q_function), np.int64, len(q_function)),
+            "random_version": np.asarray(version),
+            "random_internal": np.array(internal, dtype=np.uint32),
+            "random_gauss": np.asarray(np.nan if gauss is None else gauss),
+        })
+        self.close()
+        self.thread = threading.Thread(target=self.write, args=(arrays,), daemon=True)
+        self.thread.start()
+
+    def write(self, arrays):
+        """
+        Ecrit un point de reprise (dans le thread)
+        :param arrays: les tableaux à écrire
+        """
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, self.path)
+
+    def close(self):
+        """
+        Attend la fin de l'écriture en cours
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def load(path):
+    """
+    :param path: le fichier des points de reprise
+    :return: le dernier point de reprise (dict de tableaux), None s'il n'y en a pas
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as checkpoint:
+        return dict(checkpoint)
+
+
+def restore(checkpoint, q_function, policy):
+    """
+    Recharge la fonction de Qvaleur, la politique et l'état du générateur aléatoire d'un point de reprise
+    :param checkpoint: le point de reprise (voir load)
+    :param q_function: la fonction de Qvaleur, modifiée en place, sur les mêmes états que celle du point de reprise
+    :param policy: la politique (GreedyPolicy) de q_function, modifiée en place
+    """
+    states = checkpoint["states"].tolist()
+    if set(states) != set(q_function):
+        raise ValueError("le point de reprise ne porte pas sur les mêmes états")
+    for s, q_values, best in zip(states, checkpoint["q_function"].tolist(), checkpoint["best"].tolist()):
+        q_function[s][:] = q_values
+        policy.best[s] = best
+    gauss = float(checkpoint["random_gauss"])
+    random.setstate((int(checkpoint["random_version"]), tuple(checkpoint["random_internal"].tolist()),
+                     None if np.isnan(gauss) else gauss))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+class StateCodec:
+    """
+    Encode un état (dict) en un entier dense et inversement.
+
+    Les cases sont numérotées ligne par ligne (x + y * largeur) et les cases sales forment un masque de bits.
+    La base n'étant jamais sale, son bit est retiré du masque, ce qui rend l'encodage exactement dense:
+    index = ((battery_level * n_cells + robot) * n_cells + base) * 2 ** (n_cells - 1) + masque compacté
+    """
+
+    def __init__(self, grid_size, max_battery_level):
+        """
+        :param grid_size: un tuple (x,y) représentant la taille de la grille
+        :param max_battery_level: le niveau de batterie maximal
+        """
+        self.grid_size = grid_size
+        self.max_battery_level = max_battery_level
+        self.n_cells = grid_size[0] * grid_size[1]
+        self.mask_size = 1 << (self.n_cells - 1)
+        self.n_states = (max_battery_level + 1) * self.n_cells * self.n_cells * self.mask_size
+        self.positions = [[cell % grid_size[0], cell // grid_size[0]] for cell in range(self.n_cells)]
+
+    def cell(self, pos):
+        """
+        Etant donné une position [x, y] retourne le numéro de la case
+        :param pos: une position [x, y]
+        :return: le numéro de la case
+        """
+        x, y = pos
+        if not (0 <= x < self.grid_size[0] and 0 <= y < self.grid_size[1]):
+            raise ValueError("position hors de la grille: " + str(pos))
+        return x + y * self.grid_size[0]
+
+    def join(self, battery_level, robot, base, mask):
+        """
+        Assemble les composantes d'un état en un index
+        :param battery_level: le niveau de batterie
+        :param robot: le numéro de la case du robot
+        :param base: le numéro de la case de la base
+        :param mask: le masque des cases sales (un bit par case)
+        :return: l'index de l'état
+        """
+        if mask >> base & 1:
+            raise ValueError("la base ne peut pas être sale")
+        if not 0 <= battery_level <= self.max_battery_level:
+            raise ValueError("niveau de batterie invalide: " + str(battery_level))
+        return self.pack(battery_level, robot, base, mask)
+
+    def pack(self, battery_level, robot, base, mask):
+        """
+        Comme join mais sans vérification, fonctionne aussi sur des tableaux numpy d'entiers
+        :param battery_level: le niveau de batterie
+        :param robot: le numéro de la case du robot
+        :param base: le numéro de la case de la base
+        :param mask: le masque des cases sales (un bit par case)
+        :return: l'index de l'état
+        """
+        packed = (mask & ((1 << base) - 1)) | ((mask >> (base + 1)) << base)
+        return ((battery_level * self.n_cells + robot) * self.n_cells + base) * self.mask_size + packed
+
+    def split(self, index):
+        """
+        Décompose un index en ses composantes, fonctionne aussi sur des tableaux numpy d'entiers
+        :param index: l'index d'un état
+        :return battery_level, robot, base, mask: le niveau de batterie, la case du robot, la case de la base
+        et le masque des cases sales
+        """
+        rest, packed = divmod(index, self.mask_size)
+        rest, base = divmod(rest, self.n_cells)
+        battery_level, robot = divmod(rest, self.n_cells)
+        mask = (packed & ((1 << base) - 1)) | ((packed >> base) << (base + 1))
+        return battery_level, robot, base, mask
+
+    def encode(self, state):
+        """
+        Encode un état
+        :param state: un état
+        :return: l'index de l'état
+        """
+        mask = 0
+        for pos in state["dirty_cells"]:
+            mask |= 1 << self.cell(pos)
+        return self.join(state["battery_level"], self.cell(state["robot_pos"]), self.cell(state["base_pos"]), mask)
+
+    def decode(self, index):
+        """
+        Décode un index en un état, les cases sales sont triées par position
+        :param index: l'index d'un état
+        :return: l'état
+        """
+        battery_level, robot, base, mask = self.split(index)
+        return {
+            "base_pos": list(self.positions[base]),
+            "robot_pos": list(self.positions[robot]),
+            "dirty_cells": sorted([list(self.positions[cell]) for cell in range(self.n_cells) if mask >> cell & 1]),
+            "battery_level": battery_level
+        }
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Evaluation d'une politique sans affichage: des milliers d'épisodes simulés par lots (Simulator.step_batch), répartis
+sur plusieurs processus, résumés par les statistiques demandées dans Homework (pas cumulés, récompense moyenne, ...).
+Les politiques calculées sur des GridState (Approximation.LinearPolicy) sont évaluées épisode par épisode avec
+Simulator.get_distribution, sans index d'état: ceux des grandes grilles dépassent int64.
+
+Un épisode se termine au premier état mort (batterie vide) ou but (tout est propre et le robot sur la base), après
+avoir reçu la récompense de cet état (dead_reward ou goal_reward), ou au bout de horizon pas.
+"""
+import multiprocessing
+import numpy as np
+import Actions
+import Stats
+
+# nombre d'épisodes simulés ensemble par un lot, chaque lot a sa graine
+BATCH_SIZE = 1024
+
+# simulateur et politique des processus de evaluate_policy, hérités à leur création
+context = None
+
+
+def policy_arrays(policy):
+    """
+    :param policy: une politique, dict état encodé -> action ou StoredPolicy
+    :return states, actions: les index des états triés et les indices de leurs actions
+    """
+    if hasattr(policy, "states") and hasattr(policy, "actions"):
+        return np.asarray(policy.states, dtype=np.int64), np.asarray(policy.actions, dtype=np.int64)
+    states = np.array(sorted(policy), dtype=np.int64)
+    actions = np.array([Actions.ACTION_INDEX[policy[s]] for s in states.tolist()], dtype=np.int64)
+    return states, actions
+
+
+def run_episodes(simulator, states, actions, starts, horizon, rng):
+    """
+    Simule un lot d'épisodes en parallèle
+    :param simulator: le simulateur
+    :param states, actions: la politique (voir policy_arrays)
+    :param starts: les index des états initiaux, un par épisode
+    :param horizon: le nombre maximal de pas d'un épisode
+    :param rng: le générateur des tirages (numpy.random.Generator)
+    :return returns, steps, outcomes: la somme des récompenses, le nombre de pas et l'issue de chaque épisode
+    (1 but atteint, -1 mort, 0 horizon atteint)
+    """
+    current = np.asarray(starts, dtype=np.int64).copy()
+    n = len(current)
+    returns = np.zeros(n)
+    steps = np.zeros(n, dtype=np.int64)
+    outcomes = np.zeros(n, dtype=np.int64)
+    active = np.arange(n)
+    for _ in range(horizon):
+        if len(active) == 0:
+            break
+        s = current[active]
+        position = np.searchsorted(states, s)
+        if np.any(position == len(states)) or np.any(states[np.minimum(position, len(states) - 1)] != s):
+            raise KeyError("état absent de la politique")
+        a = actions[position]
+        battery_level, robot, base, mask = simulator.codec.split(s)
+        # mêmes branches que Simulator.get
+        dead = battery_level == 0
+        goal = ~dead & (mask == 0) & (robot == base)
+        rewards, current[active] = simulator.step_batch(s, a, rng)
+        returns[active] += rewards
+        steps[active] += 1
+        outcomes[active[dead]] = -1
+        outcomes[active[goal]] = 1
+        active = active[~dead & ~goal]
+    return returns, steps, outcomes
+
+
+def run_state_episodes(simulator, policy, starts, horizon, rng):
+    """
+    Comme run_episodes, un épisode après l'autre sur des GridState, pour une politique qui a une méthode greedy (voir
+    Approximation.LinearPolicy)
+    :param simulator: le simulateur
+    :param policy: la politique
+    :param starts: les états initiaux (GridState), un par épisode
+    :param horizon: le nombre maximal de pas d'un épisode
+    :param rng: le générateur des tirages (numpy.random.Generator)
+    :return returns, steps, outcomes: voir run_episodes
+    """
+    n = len(starts)
+    returns = np.zeros(n)
+    steps = np.zeros(n, dtype=np.int64)
+    outcomes = np.zeros(n, dtype=np.int64)
+    for i, state in enumerate(starts):
+        for _ in range(horizon):
+            # mêmes branches que Simulator.get
+            dead = state.battery_level == 0
+            goal = not dead and not state.dirty and state.robot == state.base
+            reward, proba, success, failure = simulator.get_distribution(Actions.ACTIONS[policy.greedy(state)[0]],
+                                                                         state)
+            returns[i] += reward
+            steps[i] += 1
+            if dead or goal:
+                outcomes[i] = -1 if dead else 1
+                break
+            state = success if rng.random() < proba else failure
+    return returns, steps, outcomes
+
+
+def initialize_worker(simulator, states, actions, horizon):
+    """
+    Initialisation d'un processus de evaluate_policy
+    """
+    global context
+    context = simulator, states, actions, horizon
+
+
+def run_batch(batch):
+    """
+    Lot d'épisodes d'un processus de evaluate_policy
+    :param batch: les états initiaux et la graine (numpy.random.SeedSequence) du lot
+    :return: voir run_episodes
+    """
+    simulator, states, actions, horizon = context
+    starts, seed = batch
+    if states is None:
+        return run_state_episodes(simulator, actions, starts, horizon, np.random.default_rng(seed))
+    return run_episodes(simulator, states, actions, starts, horizon, np.random.default_rng(seed))
+
+
+def evaluate_policy(simulator, policy, initial_states, n_episodes, horizon, seed=None, weights=None, n_workers=1):
+    """
+    Evalue une politique sur n_episodes épisodes. Les résultats ne dépendent que de la graine, pas de n_workers.
+    :param simulator: le simulateur
+    :param policy: la politique, voir policy_arrays, ou une politique qui a une méthode greedy (voir run_state_episodes)
+    :param initial_states: les index des états initiaux possibles
+    :param n_episodes: le nombre d'épisodes
+    :param horizon: le nombre maximal de pas d'un épisode
+    :param seed: la graine, None pour une graine tirée au hasard
+    :param weights: les probabilités des états initiaux, None pour des états équiprobables
+    :param n_workers: le nombre de processus
+    :return: un dict des statistiques
+    """
+    start_seed, *batch_seeds = np.random.SeedSequence(seed).spawn(1 + -(-n_episodes // BATCH_SIZE))
+    starts = np.random.default_rng(start_seed).choice(len(initial_states), n_episodes, p=weights)
+    if hasattr(policy, "greedy"):
+        # états initiaux décodés en Python, sans passer par des index int64
+        states, actions = None, policy
+        initial_states = [simulator.state(s) for s in initial_states]
+        starts = [initial_states[i] for i in starts.tolist()]
+    else:
+        if simulator.codec.n_states > np.iinfo(np.int64).max:
+            raise ValueError("les index des états de la grille {} dépassent int64".format(simulator.grid_size))
+        states, actions = policy_arrays(policy)
+        starts = np.asarray(initial_states, dtype=np.int64)[starts]
+    batches = [(starts[i * BATCH_SIZE:(i + 1) * BATCH_SIZE], batch_seed) for i, batch_seed in enumerate(batch_seeds)]
+
+    if n_workers > 1:
+        with multiprocessing.Pool(n_workers, initializer=initialize_worker,
+                                  initargs=(simulator, states, actions, horizon)) as pool:
+            results = pool.map(run_batch, batches)
+    else:
+        initialize_worker(simulator, states, actions, horizon)
+        results = [run_batch(batch) for batch in batches]
+    returns, steps, outcomes = [np.concatenate(result) for result in zip(*results)]
+
+    success = outcomes == 1
+    statistics = {
+        "episodes": n_episodes,
+        "mean_return": returns.mean(),
+        "std_return": returns.std(),
+        "success_rate": success.mean(),
+        "death_rate": (outcomes == -1).mean(),
+        "cumulative_steps": int(steps.sum()),
+        "mean_steps": steps.mean(),
+        # le pas qui reçoit goal_reward part de l'état but, il n'est pas compté
+        "mean_steps_to_goal": (steps[success] - 1).mean() if success.any() else float("nan"),
+        "mean_reward": returns.sum() / steps.sum(),
+    }
+    Stats.report("evaluation", **statistics)
+    return statistics
@@ -1,19 +1,34 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import itertools, os
+import collections
+import heapq
 import Actions
+from Codec import StateCodec
+from Policy import GreedyPolicy
+import Model
+import numpy as np
 import time
 import copy
 import signal
 from State import print_state
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from random import choice
-from Debug import Debug
+from random import choice, getrandbits
+import Stats
+import Checkpoint
+import Metrics
+from Replay import ReplayBuffer
 
-hasard_nb, policy_nb = 0, 0
 interrupt_flag = False
+# colonnes des courbes (Metrics.Recorder) de la programmation dynamique, de monte carlo et du q learning, et la
+# fréquence d'enregistrement par défaut des deux derniers
+DP_METRICS = ["iteration", "mean_value"]
+MONTE_CARLO_METRICS = ["episodes", "elapsed", "mean_reward", "v_s0"]
+Q_LEARNING_METRICS = ["steps", "elapsed", "q_value_s0"]
+RECORD_EPISODES = 1000
+RECORD_STEPS = 100000
+# q_learning ne lit l'horloge (limite de temps, affichages) que tous les CLOCK_STEPS pas
+CLOCK_STEPS = 1000
+# dyna_q_learning planifie en un lot tous les PLANNING_BLOCK pas réels (diviseur de CLOCK_STEPS)
+PLANNING_BLOCK = 100
 
 
 def signal_handler(signal, frame):
@@ -22,160 +37,433 @@ def signal_handler(signal, frame):
         interrupt_flag = True
 
 
-def get_possible_dirty_cells(grid_size, base_pos):
+def get_all_states(max_battery_level, grid_size):
     """
-    Etant donné une taille de grille et une position de la base dans la grille, retourne la liste de toutes les 
-    combinaisons de cellules salles possible
+    Tous les états, désignés par leur index: l'encodage StateCodec étant dense, c'est un range que les algorithmes
+    parcourent (ou que Model.index_array convertit en tableau) sans construire ni décoder d'état
+    :param max_battery_level: le niveau de batterie maximal
     :param grid_size: un tuple (x,y) représentant la taille de la grille
-    :param base_pos: [x, y] la position de la base
-    :return: 
+    :return: le range des index de tous les états
     """
-    possible_grid_list = [list(i) for i in itertools.product([0, 1], repeat=grid_size[0] * grid_size[1]) if
-                          list(i)[base_pos[0] + base_pos[1] * grid_size[0]] == 0]
-
-    possible_dirty_cells = list()
-    for possible in possible_grid_list:
-        l = list()
-        for index, case in enumerate(possible):
-            if case == 1:
-                l.append([index % grid_size[0], index // grid_size[0]])
-        possible_dirty_cells.append(l)
-
-    return possible_dirty_cells
-
-
-def get_all_states(max_battery_level, grid_size):
-    states = list()
-    coords = [[x, y] for x in range(grid_size[0]) for y in range(grid_size[1])]
-    for level in range(max_battery_level + 1):
-        for robot_pos in coords:
-            for base_pos in coords:
-                for dirty_cells in get_possible_dirty_cells(grid_size, base_pos):
-                    state = {
-                        "base_pos": base_pos,
-                        "robot_pos": robot_pos,
-                        "dirty_cells": sorted(dirty_cells),
-                        "battery_level": level
-                    }
-
-                    states.append(state)
-
-    return states
+    return range(StateCodec(grid_size, max_battery_level).n_states)
 
 
-def dynamic_programming(all_states, simulator, gamma, epsilon):
+def get_reachable_indices(simulator, initial_state):
+    """
+    Parcours en largeur des transitions du simulateur (celles de get et de get_with_model) depuis initial_state
+    :param simulator: le simulateur
+    :param initial_state: l'état initial
+    :return: la liste triée des index des états atteignables
+    """
+    start = simulator.codec.encode(initial_state)
+    reachable = {start}
+    queue = collections.deque([start])
+    while queue:
+        s = queue.popleft()
+        for action in simulator.get_actions_encoded(s):
+            future = [future_state for _, future_state in simulator.get_with_model_encoded(action, s)[1]]
+            _, proba, success, failure = simulator.get_distribution_encoded(action, s)
+            future += [success, failure] if proba < 1 else [success]
+            for future_state in future:
+                if future_state not in reachable:
+                    reachable.add(future_state)
+                    queue.append(future_state)
+    return sorted(reachable)
+
+
+def dynamic_programming(all_states, simulator, gamma, epsilon, tables=None, recorder=None):
     """
     Implémentation de l'optimisation de la politique par dynamic programming
-    :param all_states: la liste de tous les états
+    :param all_states: les index de tous les états (voir get_all_states)
     :param simulator: le simulateur
     :param gamma:
     :param epsilon:
-    :return policy: la politique optimale 
+    :param tables: si donné, un dict dans lequel est rangée la fonction de valeur ("value_function")
+    :param recorder: le Metrics.Recorder de la courbe des valeurs moyennes (DP_METRICS), un tampon seul par défaut
+    :return policy: la politique optimale, indexée par état encodé
     """
 
-    # Initialisation de la politique et de la fonction de valeur
-    value_function = dict()
-    value_function_bis = dict()
-    policy = dict()
-    for state in all_states:
-        value_function[str(state)] = 0
-        value_function_bis[str(state)] = 1
-        policy[str(state)] = "stay"
-
-    stop_criteria = max([abs(value_function[i] - value_function_bis[i]) for i in value_function.keys()])
-    mean_values = [0.]
-    x = [0]
+    # Initialisation de la politique et de la fonction de valeur, indexées par état encodé
+    simulator.precompute_legal_masks(all_states)
+    value_function = dict.fromkeys(all_states, 0.)
+    value_function_bis = dict.fromkeys(all_states, 1.)
+    policy = dict.fromkeys(all_states, "stay")
+
+    stop_criteria = max([abs(value_function[s] - value_function_bis[s]) for s in all_states])
+    if recorder is None:
+        recorder = Metrics.Recorder(DP_METRICS)
+    iteration = 0
+    recorder.record(iteration, 0.)
     while stop_criteria > epsilon:
-        value_function_bis = Actions.reasign(value_function)
+        value_function_bis = dict(value_function)
 
         mean_value = 0.
-        for state in all_states:
+        sweep_start = time.perf_counter()
+        simulator_calls = 0
+        for s in all_states:
             to_maximize = []
-            action_list = simulator.get_actions(state)
-            for i, action in enumerate(action_list):
-                reward, future = simulator.get_with_model(action, state)
+            action_list = simulator.get_legal_actions(s)
+            simulator_calls += len(action_list)
+            for i, a in enumerate(action_list):
+                reward, future = simulator.get_with_model_encoded(Actions.ACTIONS[a], s)
                 to_maximize.append(reward)
 
                 for proba, future_state in future:
-                    to_maximize[i] += gamma * proba * value_function[str(future_state)]
+                    to_maximize[i] += gamma * proba * value_function[future_state]
+
+            value_function[s] = max(to_maximize)
+            mean_value += value_function[s]
+
+            opti_action = action_list[to_maximize.index(value_function[s])]
+            policy[s] = Actions.ACTIONS[opti_action]
+
+        stop_criteria = max([abs(value_function[s] - value_function_bis[s]) for s in all_states])
+        Stats.add_time("sweep", time.perf_counter() - sweep_start)
+        Stats.count("backups", len(all_states))
+        Stats.count("simulator_calls", simulator_calls)
+        Stats.snapshot()
+        print("dynamic programming iteration:", stop_criteria, "<", epsilon, "?")
+
+        # for plotting
+        iteration += 1
+        recorder.record(iteration, mean_value / len(all_states))
+
+    print("dynamic programming:", iteration * len(all_states), "backups")
 
-            value_function[str(state)] = max(to_maximize)
-            mean_value += value_function[str(state)]
+    if tables is not None:
+        tables["value_function"] = value_function
+    return policy
 
-            opti_action = action_list[to_maximize.index(value_function[str(state)])]
-            policy[str(state)] = opti_action
 
-        stop_criteria = max([abs(value_function[i] - value_function_bis[i]) for i in value_function.keys()])
+def vectorized_dynamic_programming(all_states, simulator, gamma, epsilon, model=None, tables=None, recorder=None):
+    """
+    Programmation dynamique vectorisée: le modèle est compilé une fois en tableaux (Model) puis les backups de Bellman
+    portent sur tous les états d'un niveau de batterie à la fois (Model.q_values).
+    Toute action autre que load fait baisser la batterie et les seules transitions à batterie constante bouclent sur
+    l'état lui même, les mises à jour par niveau de batterie croissant reproduisent donc exactement le balayage en place
+    de dynamic_programming (même politique, même courbe de valeurs moyennes).
+    :param all_states: les index de tous les états (voir get_all_states)
+    :param simulator: le simulateur
+    :param gamma:
+    :param epsilon:
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de valeur ("value_function")
+    :param recorder: le Metrics.Recorder de la courbe des valeurs moyennes (DP_METRICS), un tampon seul par défaut
+    :return policy: la politique optimale, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    battery_level = simulator.codec.split(model.states)[0]
+    bounds = np.searchsorted(battery_level, np.arange(simulator.max_battery_level + 2))
+    blocks = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+
+    value_function = np.zeros(len(model.states))
+    best_actions = np.zeros(len(model.states), dtype=np.int64)
+    stop_criteria = 1.
+    if recorder is None:
+        recorder = Metrics.Recorder(DP_METRICS)
+    iteration = 0
+    recorder.record(iteration, 0.)
+    while stop_criteria > epsilon:
+        value_function_bis = value_function.copy()
+        with Stats.timer("sweep"):
+            for start, stop in blocks:
+                q_values = model.q_values(value_function, gamma, start, stop)
+                best_actions[start:stop] = q_values.argmax(axis=1)
+                value_function[start:stop] = q_values.max(axis=1)
+        Stats.count("backups", len(model.states))
+        Stats.snapshot()
+
+        stop_criteria = np.abs(value_function - value_function_bis).max()
         print("dynamic programming iteration:", stop_criteria, "<", epsilon, "?")
 
         # for plotting
-        x.append(x[-1] + 1)
-        mean_value = mean_value / len(all_states)
-        mean_values.append(mean_value)
+        iteration += 1
+        recorder.record(iteration, value_function.mean())
+
+    print("dynamic programming:", iteration * len(model.states), "backups")
+
+    policy = dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in best_actions.tolist()]))
+    if tables is not None:
+        tables["value_function"] = value_function
+    return policy
+
+
+def prioritized_sweeping(all_states, simulator, gamma, epsilon, model=None, tables=None):
+    """
+    Value iteration asynchrone par prioritized sweeping: une file de priorité contient les états dont l'erreur de
+    Bellman |max_a Q(s, a) - v(s)| dépasse epsilon. On met à jour l'état d'erreur maximale, puis on recalcule l'erreur
+    de ses seuls prédécesseurs (liens tirés du modèle compilé), jusqu'à ce que la file soit vide. Le nombre de backups
+    est affiché pour comparaison avec les balayages complets de dynamic_programming.
+    :param all_states: les index de tous les états (voir get_all_states)
+    :param simulator: le simulateur
+    :param gamma:
+    :param epsilon: l'erreur de Bellman en dessous de laquelle un état n'est plus mis à jour
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de valeur ("value_function")
+    :return policy: la politique optimale, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    n_states = len(model.states)
+    legal = np.asarray(model.legal)
+
+    # prédécesseurs de chaque état: les états dont une action possible y mène avec une probabilité non nulle
+    s, a, k = np.nonzero(legal[:, :, None] & (np.asarray(model.probas) > 0))
+    links = np.unique(np.stack([model.successors[s, a, k], s], axis=1), axis=0)
+    bounds = np.searchsorted(links[:, 0], np.arange(n_states + 1)).tolist()
+    sources = links[:, 1].tolist()
+    predecessors = [sources[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    # pour chaque action possible de chaque état: (récompense, issues vers d'autres états, proba de rester sur place).
+    # La boucle sur soi-même est résolue exactement, v(s) = max_a (r + gamma * somme p v(s')) / (1 - gamma * p_boucle):
+    # les états qui bouclent (but, chargement raté, mort) sont réglés en un backup au lieu de converger
+    # géométriquement au fil des balayages
+    rewards, probas, successors = model.rewards.tolist(), model.probas.tolist(), model.successors.tolist()
+    outcomes = []
+    for s in range(n_states):
+        outcomes.append([])
+        for a in np.flatnonzero(legal[s]).tolist():
+            others = [(p, s1) for p, s1 in zip(probas[s][a], successors[s][a]) if p > 0 and s1 != s]
+            loop = sum(p for p, s1 in zip(probas[s][a], successors[s][a]) if s1 == s)
+            outcomes[s].append((rewards[s][a], others, 1 - gamma * loop))
+        predecessors[s] = [p for p in predecessors[s] if p != s]
+
+    def backup(s):
+        return max((reward + gamma * sum(p * value_function[s1] for p, s1 in others)) / scale
+                   for reward, others, scale in outcomes[s])
+
+    value_function = [0.] * n_states
+    errors = [abs(backup(s)) for s in range(n_states)]
+    queue = [(-error, s) for s, error in enumerate(errors) if error >= epsilon]
+    heapq.heapify(queue)
+    backups, evaluations = 0, n_states
+    while queue:
+        error, s = heapq.heappop(queue)
+        if -error != errors[s]:
+            # entrée périmée, l'erreur de s a changé depuis
+            continue
+        value_function[s] = backup(s)
+        errors[s] = 0.
+        backups += 1
+        for p in predecessors[s]:
+            error = abs(backup(p) - value_function[p])
+            evaluations += 1
+            if error != errors[p]:
+                errors[p] = error
+                if error >= epsilon:
+                    heapq.heappush(queue, (-error, p))
+
+    Stats.count("backups", backups)
+    Stats.count("evaluations", evaluations)
+    print("prioritized sweeping:", backups, "backups et", evaluations, "calculs d'erreur,",
+          "soit {:.1f} balayages complets".format((backups + evaluations) / n_states))
+
+    value_function = np.array(value_function)
+    best_actions = greedy_actions(model.q_values(value_function, gamma), legal)
+    policy = dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in best_actions.tolist()]))
+    if tables is not None:
+        tables["value_function"] = value_function
+    return policy
+
 
-    # plot
-    dirname = os.path.dirname(os.path.abspath(__file__))
-    # plt.figure()
+def ordered_dynamic_programming(all_states, simulator, gamma, epsilon, model=None, tables=None):
+    """
+    Programmation dynamique ordonnée par la structure du modèle. Seul load fait monter la batterie et les cases sales
+    ne font que disparaître: le graphe des transitions est presque sans cycle, ses composantes fortement connexes
+    non triviales sont les petites boucles de chargement (à cases sales égales, les états d'où le robot peut revenir
+    à la base). Les niveaux de composantes (Model.scc_levels) sont résolus l'un après l'autre, ceux dont dépendent
+    les autres d'abord, et ne sont plus jamais mis à jour:
+    - un niveau d'états isolés en un seul backup, la boucle d'un état sur lui-même (mort, but, chargement raté) étant
+      résolue exactement comme dans prioritized_sweeping:
+      v(s) = max_a (r + gamma * somme p v(s')) / (1 - gamma * p_boucle)
+    - un niveau de boucles de chargement par policy iteration sur ses seuls états (systèmes creux par blocs, les
+      valeurs des niveaux inférieurs étant connues), comme policy_iteration.
+    :param all_states: les index de tous les états (voir get_all_states)
+    :param simulator: le simulateur
+    :param gamma:
+    :param epsilon:
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de valeur ("value_function")
+    :return policy: la politique optimale, indexée par état encodé
+    """
+    from scipy import sparse
+    from scipy.sparse import linalg
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    n_states = len(model.states)
+    legal = np.asarray(model.legal)
+    components, levels = model.scc_levels()
+    tolerance = epsilon * (1 - gamma)
+    local = np.full(n_states, -1, dtype=np.int64)
+
+    value_function = np.zeros(n_states)
+    backups, evaluations = 0, 0
+    for level in range(levels.max() + 1):
+        positions = np.flatnonzero(levels == level)
+        rewards, successors, probas = model.rewards[positions], model.successors[positions], model.probas[positions]
+        # les transitions d'un niveau restent dans leurs composantes, les autres mènent à des valeurs déjà calculées
+        local[positions] = np.arange(len(positions))
+        inner = local[successors] >= 0
+        outer = rewards + gamma * np.where(inner, 0., probas * value_function[successors]).sum(axis=2)
+        loop = successors == positions[:, None, None]
+        q_values = outer / (1 - gamma * np.where(loop, probas, 0.).sum(axis=2))
+        q_values[~legal[positions]] = -np.inf
+        best_actions = q_values.argmax(axis=1)
+        value_function[positions] = q_values.max(axis=1)
+        backups += len(positions)
+        if np.unique(components[positions]).size < len(positions):
+            rows = np.arange(len(positions))
+            while True:
+                inner_probas = np.where(inner, probas, 0.)[rows, best_actions]
+                transitions = sparse.csr_matrix((inner_probas.ravel(), (np.repeat(rows, 2),
+                                                 np.maximum(local[successors[rows, best_actions]], 0).ravel())),
+                                                shape=(len(rows), len(rows)))
+                value_function[positions] = linalg.spsolve(
+                    (sparse.identity(len(rows)) - gamma * transitions).tocsc(), outer[rows, best_actions])
+                evaluations += 1
+                q_values = outer + gamma * np.where(inner, probas * value_function[successors], 0.).sum(axis=2)
+                q_values[~legal[positions]] = -np.inf
+                greedy = q_values.argmax(axis=1)
+                improve = q_values[rows, greedy] - q_values[rows, best_actions] > tolerance
+                backups += len(positions)
+                if not improve.any():
+                    break
+                best_actions[improve] = greedy[improve]
+        local[positions] = -1
+
+    Stats.count("backups", backups)
+    Stats.count("evaluations", evaluations)
+    print("ordered dynamic programming:", levels.max() + 1, "niveaux,", evaluations, "évaluations de politique,",
+          backups, "backups, soit {:.2f} balayages complets".format(backups / n_states))
+
+    best_actions = greedy_actions(model.q_values(value_function, gamma), legal)
+    policy = dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in best_actions.tolist()]))
+    if tables is not None:
+        tables["value_function"] = value_function
+    return policy
 
-    plt.plot(x, mean_values)
 
-    title = 'DP, EPSILON=' + "{:3}".format(epsilon) + " GRID=" + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(
-        simulator.max_battery_level) + " - mean_values of policy"
-    plt.title(title)
-    plt.ylabel('Mean value')
-    plt.xlabel('Iteration')
-    plt.draw()
-    plt.savefig(dirname + "/plots/" + title + ".png")
+def policy_iteration(all_states, simulator, gamma, epsilon, evaluation_sweeps=None, model=None, tables=None):
+    """
+    Policy iteration: la politique courante est évaluée, exactement en résolvant le système creux
+    (I - gamma P_pi) v = r_pi ou par evaluation_sweeps balayages v = r_pi + gamma P_pi v (modified policy iteration),
+    puis améliorée en prenant l'action gloutonne là où elle gagne plus de epsilon * (1 - gamma). On s'arrête quand
+    l'erreur de Bellman passe sous ce seuil, la politique est alors à moins de epsilon de l'optimum.
+    :param all_states: les index de tous les états (voir get_all_states)
+    :param simulator: le simulateur
+    :param gamma:
+    :param epsilon:
+    :param evaluation_sweeps: None pour l'évaluation exacte, sinon le nombre de balayages par évaluation
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de valeur ("value_function")
+    :return policy: la politique optimale, indexée par état encodé
+    """
+    from scipy import sparse
+    from scipy.sparse import linalg
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    n_states = len(model.states)
+    legal = np.asarray(model.legal)
+    positions = np.arange(n_states)
+    tolerance = epsilon * (1 - gamma)
+
+    value_function = np.zeros(n_states)
+    best_actions = greedy_actions(model.q_values(value_function, gamma), legal)
+    iteration = 0
+    while True:
+        iteration += 1
+        # évaluation de la politique
+        evaluation_start = time.perf_counter()
+        rewards = model.rewards[positions, best_actions]
+        transitions = sparse.csr_matrix((model.probas[positions, best_actions].ravel(),
+                                         (np.repeat(positions, 2), model.successors[positions, best_actions].ravel())),
+                                        shape=(n_states, n_states))
+        if evaluation_sweeps is None:
+            value_function = linalg.spsolve((sparse.identity(n_states) - gamma * transitions).tocsc(), rewards)
+        else:
+            for _ in range(evaluation_sweeps):
+                value_function = rewards + gamma * (transitions @ value_function)
+        Stats.add_time("policy_evaluation", time.perf_counter() - evaluation_start)
+
+        # amélioration
+        with Stats.timer("policy_improvement"):
+            q_values = model.q_values(value_function, gamma)
+            greedy = greedy_actions(q_values, legal)
+            improve = q_values[positions, greedy] - q_values[positions, best_actions] > tolerance
+            best_actions[improve] = greedy[improve]
+            stop_criteria = np.abs(q_values[positions, greedy] - value_function).max()
+        Stats.count("improvements", improve.sum())
+        Stats.snapshot()
+        print("policy iteration:", iteration, "-", improve.sum(), "actions changées,", stop_criteria, "<", tolerance,
+              "?")
+        if stop_criteria < tolerance and not improve.any():
+            break
 
+    policy = dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in best_actions.tolist()]))
+    if tables is not None:
+        tables["value_function"] = value_function
     return policy
 
 
-def a_epsilon_greedy(simulator, state, epsilon, policy):
+def a_epsilon_greedy(simulator, state, epsilon, policy, counts):
     """
     Etant donnée un état, et un hyperparamètre epsilon retourne en fonction d'un tirage dépendant de epsilon
     une action pris au hasard dans la liste des actions possibles, ou celles prescrite par la politique
     :param simulator: le simulateur
-    :param state: un état
+    :param state: un état encodé
     :param epsilon: un hyperparamètre
-    :param policy: la politique
-    :return: une action
+    :param policy: la politique (GreedyPolicy)
+    :param counts: les compteurs locaux [exploitation, exploration] de l'appelant (voir flush_exploration)
+    :return: l'indice d'une action
     """
-    global policy_nb, hasard_nb
-    action_list = simulator.get_actions(state)
+    action_list = simulator.get_legal_actions(state)
     if simulator.roll_dice(1 - epsilon + epsilon/len(action_list)):
-        policy_nb += 1
-        return policy[str(state)]
+        counts[0] += 1
+        return policy.action_index(state)
     else:
-        hasard_nb += 1
+        counts[1] += 1
         a = choice(action_list)
         return a
 
 
-def q_epsilon_greedy(simulator, state, epsilon, action_list, q_function):
+def q_epsilon_greedy(simulator, state, epsilon, action_list, policy, counts):
     """
     Fonction epsillon greedy qui renvoit l'action de la fonction de Qvaleur associée à un état
     :param simulator: Notre simulateur comprenant des focntionnalités de tirage aléatoire
-    :param state: Etat du système actuel
+    :param state: Etat du système actuel (encodé)
     :param epsillon: Paramètre de convergence
-    :param action_list: Liste des actions possibles pour l'état state
-    :param q_function: Représentation de notre fonction de Qvaleur
-    :return: l'action de la fonction de Qvaleur associée à un état selon la loie epsilon greedy
+    :param action_list: Liste des indices des actions possibles pour l'état state
+    :param policy: la politique gloutonne (GreedyPolicy) de notre fonction de Qvaleur
+    :param counts: les compteurs locaux [exploitation, exploration] de l'appelant (voir flush_exploration)
+    :return: l'indice de l'action de la fonction de Qvaleur associée à un état selon la loie epsilon greedy
     """
     if simulator.roll_dice(1 - epsilon + epsilon/len(action_list)):
-        q_action_list = [q_function[str(state), action] for action in action_list]
-        action_index = q_action_list.index(max(q_action_list))
         # print(1 - epsilon + epsilon / len(action_list), "Qvaleur maximisée")
-        return action_list[action_index]
+        counts[0] += 1
+        return policy.greedy(state)
     else:
+        counts[1] += 1
         a = choice(action_list)
         # print(1 - epsilon + epsilon / len(action_list), "Qvaleur hasard")
         return a
 
 
-def monte_carlo(all_states, simulator, time_limit, T, gamma, epsilon, alpha, initial_state, step=1):
+def flush_exploration(counts):
+    """
+    Ajoute aux compteurs de Stats les choix comptés localement par a_epsilon_greedy et q_epsilon_greedy, puis les
+    remet à zéro
+    :param counts: les compteurs locaux [exploitation, exploration]
+    """
+    Stats.count("exploitation", counts[0])
+    Stats.count("exploration", counts[1])
+    counts[0] = counts[1] = 0
+
+def monte_carlo(all_states, simulator, time_limit, T, gamma, epsilon, alpha, initial_state, step=1, tables=None,
+                checkpointer=None, resume=None, recorder=None, record_every=RECORD_EPISODES):
     """
     Implémentation de l'optimisation de la politique par monte_carlo control
-    :param all_states: la liste de tous les états
+    :param all_states: les index de tous les états (voir get_all_states)
     :param simulator: le simulateur
     :param time_limit: la limite de temps en seconde
     :param T: la longueur des épisodes générés
@@ -183,51 +471,68 @@ def monte_carlo(all_states, simulator, time_limit, T, gamma, epsilon, alpha, ini
     :param epsilon: un autre hyperparamètre 
     :param alpha: encore un
     :param initial_state: l'état initial
-    :return policy: la politique 
+    :param tables: si donné, un dict dans lequel est rangée la fonction de Qvaleur ("q_function")
+    :param checkpointer: si donné, le Checkpointer qui enregistre périodiquement l'apprentissage
+    :param resume: si donné, le point de reprise (voir Checkpoint.load) d'où repartir, time_limit comprenant le temps
+    déjà passé
+    :param recorder: si donné, le Metrics.Recorder des courbes (colonnes MONTE_CARLO_METRICS), sinon un en mémoire
+    :param record_every: le nombre d'épisodes entre deux points des courbes
+    :return policy: la politique, indexée par état encodé
     """
-    global policy_nb, hasard_nb
-    # Initialisation de la q_function et la policy
+    # Initialisation de la q_function et la policy, indexées par état encodé
+    codec = simulator.codec
     q_function = dict()
     policy = dict()
-    for state in all_states:
-        possible_actions = simulator.get_actions(state)
-        policy[str(state)] = choice(possible_actions)
-        for action in possible_actions:
-            q_function[str(state), action] = 0
+    simulator.precompute_legal_masks(all_states)
+    for s in all_states:
+        policy[s] = Actions.ACTIONS[choice(simulator.get_legal_actions(s))]
+        q_function[s] = [0.] * Actions.N_ACTIONS
+    initial_index = codec.encode(initial_state)
+    # la politique est l'action gloutonne des états mis à jour, maintenue incrémentalement
+    policy = GreedyPolicy(simulator, q_function, policy)
+    if recorder is None:
+        recorder = Metrics.Recorder(MONTE_CARLO_METRICS)
 
     start_time = time.time()
     time_spent, count = 0, 1
     iter = 0
-    mean_rewards, x = [], []
-    v_s0 = []
     episode = []
     stop = True
+    episodes = 0
+    total_episodes = 0
+    # choix exploitation / exploration, comptés localement et ajoutés à Stats avec les épisodes
+    choices = [0, 0]
+    total_reward = 0
+    if resume is not None:
+        Checkpoint.restore(resume, q_function, policy)
+        start_time -= float(resume["elapsed"])
+        count, epsilon, total_reward = int(resume["count"]), float(resume["epsilon"]), float(resume["total_reward"])
+        total_episodes = int(resume["episodes"])
+        recorder.restore(resume["metrics"])
     while time.time() - start_time < time_limit:
-        s0 = Actions.reasign(initial_state)
+        s0 = initial_index
 
         # on print toutes les 10 secondes pour ne pas polluer la console
         time_spent = time.time() - start_time
         if time_spent > step * count:
             count += 1
-            action_list = simulator.get_actions(s0)
-            q_values_s0 = [q_function[str(s0), action] for action in action_list]
-            Debug("monte_carlo iteration, elapsed time", time.time() - start_time, v_s0=max(q_values_s0))
-            # Debug(policy_nb=policy_nb, hasard_nb=hasard_nb, epsilon=epsilon,
-            #       policy_proba=1 - epsilon + epsilon/len(action_list))
-
-            # add value to vector for plot
-            mean_reward = total_reward/T
-            mean_rewards.append(mean_reward)
-            v_s0.append(max(q_values_s0))
-            x.append(step * count)
+            Stats.count("episodes", episodes)
+            Stats.count("updates", episodes * (T + 1))
+            flush_exploration(choices)
+            episodes = 0
+            Stats.report("monte_carlo", elapsed=time_spent, v_s0=policy.value(s0), epsilon=epsilon)
+            if checkpointer is not None and checkpointer.due():
+                checkpointer.save(q_function, policy, elapsed=time_spent, count=count, epsilon=epsilon,
+                                  total_reward=total_reward, episodes=total_episodes, metrics=recorder.rows())
 
         # generation d'un episode
         episode = []
-        policy_nb, hasard_nb = 0, 0
+        episodes += 1
+        total_episodes += 1
         for t in range(T + 1):
-            a0 = a_epsilon_greedy(simulator, s0, epsilon, policy)
+            a0 = a_epsilon_greedy(simulator, s0, epsilon, policy, choices)
             # print(s0, a0)
-            reward, future_state = simulator.get(a0, s0)
+            reward, future_state = simulator.get_encoded(Actions.ACTIONS[a0], s0)
             episode.append((s0, a0, reward))
             s0 = future_state
 
@@ -239,110 +544,400 @@ def monte_carlo(all_states, simulator, time_limit, T, gamma, epsilon, alpha, ini
                 retour += (gamma ** (k - t)) * episode[k][2]
             total_reward += event[2]
 
-            # maj q _value
-            q_function[str(event[0]), event[1]] += alpha * (retour - q_function[str(event[0]), event[1]])
-
-            # maj politique
-            q_action_list = [q_function[str(event[0]), action] for action in simulator.get_actions(event[0])]
-            action_index = q_action_list.index(max(q_action_list))
-            policy[str(event[0])] = simulator.get_actions(event[0])[action_index]
+            # maj q _value et politique
+            q_value = q_function[event[0]][event[1]]
+            policy.update(event[0], event[1], q_value + alpha * (retour - q_value))
         if epsilon > 0.1:
             epsilon /= 1.00001
 
+        # points des courbes, tous les record_every épisodes
+        if total_episodes % record_every == 0:
+            recorder.record(total_episodes, time.time() - start_time, total_reward / T, policy.value(initial_index))
+
         if interrupt_flag:
             break
+    Stats.count("episodes", episodes)
+    Stats.count("updates", episodes * (T + 1))
+    flush_exploration(choices)
+    if checkpointer is not None:
+        checkpointer.save(q_function, policy, elapsed=time.time() - start_time, count=count, epsilon=epsilon,
+                          total_reward=total_reward, episodes=total_episodes, metrics=recorder.rows())
+        checkpointer.close()
 
     # Print final
     print("### FIN du calcul ###")
+    q_values_s0 = [q_function[initial_index][Actions.ACTION_INDEX[action]]
+                   for action in simulator.get_actions(initial_state)]
     print("actions en s0:", simulator.get_actions(initial_state))
-    print("q_val associées:",
-          ["{:05.2f}".format(q_function[str(initial_state), action]) for action in simulator.get_actions(initial_state)])
+    print("q_val associées:", ["{:05.2f}".format(q_value) for q_value in q_values_s0])
     print("monte_carlo iteration, elapsed time: {:05.2f},".format(time.time() - start_time),
-          "v(s0) = {:6.2f}".format(max([q_function[str(initial_state), action] for action in simulator.get_actions(initial_state)])))
-
-    dirname = os.path.dirname(os.path.abspath(__file__))
-    print(dirname)
-    # plt.figure()
-    plt.plot(x, mean_rewards)
-    title = 'MC, T=' + "{:3}".format(T) + " GRID=" + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(simulator.max_battery_level) + " T_LIMIT:" + "{:5}".format(time_limit) + " - mean_reward"
-    plt.title(title)
-    plt.ylabel('Récompense moyenne')
-    plt.xlabel('Time(s)')
-    plt.draw()
-    print(os.path.join(dirname, "/plots/", title + ".png"))
-    plt.savefig(dirname + "/plots/" + title + ".png")
-
-    plt.clf()
-    plt.plot(x, v_s0)
-    title = 'MC, T=' + "{:3}".format(T) + " GRID=" + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(simulator.max_battery_level) + " T_LIMIT:" + "{:5}".format(time_limit) + " - v_s0(t)"
-    plt.ylabel('v(s0)')
-    plt.xlabel('Time(s)')
-    plt.draw()
-    plt.savefig(dirname + "/plots/" + title + ".png")
+          "v(s0) = {:6.2f}".format(max(q_values_s0)))
 
-    return policy
+    if tables is not None:
+        tables["q_function"] = q_function
+    return policy.extract()
 
+def random_legal_actions(legal, dice):
+    """
+    Tire pour chaque ligne une action uniformément parmi les actions possibles
+    :param legal: un tableau de booléens (n, N_ACTIONS) des actions possibles
+    :param dice: n tirages uniformes dans [0, 1)
+    :return: les indices des actions choisies
+    """
+    n_legal = legal.sum(axis=1)
+    rank = (dice * n_legal).astype(np.int64)
+    return np.argmax(np.cumsum(legal, axis=1) > rank[:, None], axis=1)
 
-def q_learning(all_states, simulator, time_limit, gamma, epsilon, alpha, initial_state):
 
-    # Initialisation de la q_function et la policy
-    q_function = dict()
-    policy = dict()
-    for state in all_states:
-        policy[str(state)] = choice(simulator.get_actions(state))
-        for action in simulator.get_actions(state):
-            q_function[str(state), action] = 0
+def greedy_actions(q_values, legal):
+    """
+    :param q_values: un tableau (n, N_ACTIONS) de Qvaleurs
+    :param legal: un tableau de booléens (n, N_ACTIONS) des actions possibles
+    :return: pour chaque ligne l'indice de la première action possible de Qvaleur maximale
+    """
+    return np.argmax(np.where(legal, q_values, -np.inf), axis=1)
 
-    s0 = Actions.reasign(initial_state)
-    a0 = a_epsilon_greedy(simulator, s0, epsilon, policy)
 
-    # Algorithme de Q Learning
+def sequential_updates(q_function, keys, targets, alpha):
+    """
+    Applique q[k] += alpha * (g - q[k]) pour chaque (k, g) de (keys, targets), dans l'ordre, sans boucle python:
+    après n mises à jour d'une même entrée, q = (1 - alpha) ** n * q + somme des alpha * (1 - alpha) ** (n - 1 - i) * g_i
+    :param q_function: un tableau 1D modifié en place
+    :param keys: les indices des entrées mises à jour
+    :param targets: les cibles de chaque mise à jour
+    :param alpha: le pas d'apprentissage
+    """
+    order = np.argsort(keys, kind="stable")
+    keys, targets = keys[order], targets[order]
+    unique_keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    remaining = np.repeat(first + counts, counts) - 1 - np.arange(len(keys))
+    weighted = alpha * (1 - alpha) ** remaining * targets
+    q_function[unique_keys] = (1 - alpha) ** counts * q_function[unique_keys] + np.add.reduceat(weighted, first)
+
+
+def generate_episodes(model, policy, epsilon, s_initial, rng, states, actions, rewards):
+    """
+    Génère des épisodes epsilon-greedy en parallèle sur les tableaux de Model.compile_samples, un par colonne de
+    states, de longueur le nombre de lignes
+    :param model: le modèle compilé
+    :param policy: l'indice de l'action gloutonne de chaque position
+    :param epsilon: un hyperparamètre
+    :param s_initial: la position de l'état initial
+    :param rng: le générateur numpy
+    :param states: tableau (T + 1, n) rempli avec les positions visitées
+    :param actions: tableau (T + 1, n) rempli avec les actions choisies
+    :param rewards: tableau (T + 1, n) rempli avec les récompenses reçues
+    """
+    n_envs = states.shape[1]
+    s = np.full(n_envs, s_initial)
+    for t in range(len(states)):
+        legal = model.legal[s]
+        exploit = rng.random(n_envs) < 1 - epsilon + epsilon / legal.sum(axis=1)
+        a = np.where(exploit, policy[s], random_legal_actions(legal, rng.random(n_envs)))
+        states[t], actions[t], rewards[t] = s, a, model.sample_rewards[s, a]
+        success = rng.random(n_envs) < model.sample_probas[s, a]
+        s = model.sample_successors[s, a, np.where(success, 0, 1)]
+
+
+def discounted_returns(rewards, gamma, returns):
+    """
+    Calcule les retours de chaque épisode (une colonne par épisode) par une somme cumulée actualisée à rebours
+    :param rewards: tableau (T + 1, n) des récompenses
+    :param gamma: le facteur d'actualisation
+    :param returns: tableau (T + 1, n) rempli avec les retours
+    """
+    retour = np.zeros(rewards.shape[1])
+    for t in range(len(rewards) - 1, -1, -1):
+        retour = rewards[t] + gamma * retour
+        returns[t] = retour
+
+
+def batched_monte_carlo(all_states, simulator, time_limit, T, gamma, epsilon, alpha, initial_state, n_envs, step=1,
+                        model=None, tables=None, recorder=None):
+    """
+    Monte carlo control avec n_envs épisodes générés en même temps sur des tableaux (Model.compile_samples).
+    Les mises à jour sont celles de monte_carlo appliquées épisode après épisode, seule différence: les n_envs
+    épisodes d'un lot suivent la politique du début du lot.
+    :param all_states: les index de tous les états (voir get_all_states)
+    :param simulator: le simulateur
+    :param time_limit: la limite de temps en seconde
+    :param T: la longueur des épisodes générés
+    :param gamma: un hyperparamètre
+    :param epsilon: un autre hyperparamètre
+    :param alpha: encore un
+    :param initial_state: l'état initial
+    :param n_envs: le nombre d'épisodes générés en parallèle
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de Qvaleur ("q_function")
+    :param recorder: le Metrics.Recorder des courbes (MONTE_CARLO_METRICS), un point tous les step secondes, un tampon
+    seul par défaut
+    :return policy: la politique, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    model.compile_samples(simulator)
+    rng = np.random.default_rng()
+    if recorder is None:
+        recorder = Metrics.Recorder(MONTE_CARLO_METRICS)
+    legal = np.asarray(model.legal)
+
+    # Initialisation de la q_function et la policy, indexées par position dans le modèle
+    q_function = np.zeros((len(model.states), Actions.N_ACTIONS))
+    policy = random_legal_actions(legal, rng.random(len(model.states)))
+    s_initial = model.position(simulator.codec.encode(initial_state))
+
     start_time = time.time()
     count = 1
-    q_values_s0, t = [], []
+    total_reward = 0.
+    total_episodes = 0
+    states = np.empty((T + 1, n_envs), dtype=np.int64)
+    actions = np.empty((T + 1, n_envs), dtype=np.int64)
+    rewards = np.empty((T + 1, n_envs))
+    returns = np.empty((T + 1, n_envs))
     while time.time() - start_time < time_limit:
-        global interrupt_flag
-        # print("q_Learning iteration, elapsed time:", time.time() - start_time)
+        time_spent = time.time() - start_time
+        if time_spent > step * count:
+            count += 1
+            v = greedy_q_value(q_function, legal, s_initial)
+            Stats.report("batched_monte_carlo", elapsed=time_spent, v_s0=v, epsilon=epsilon)
+            recorder.record(total_episodes, time_spent, total_reward / T, v)
+
+        # generation de n_envs episodes et calcul des retours
+        generate_episodes(model, policy, epsilon, s_initial, rng, states, actions, rewards)
+        discounted_returns(rewards, gamma, returns)
+        total_reward = rewards.sum(axis=0).mean()
+
+        # maj q_value, épisode après épisode, puis politique des états visités
+        sequential_updates(q_function.reshape(-1), (states * Actions.N_ACTIONS + actions).T.ravel(), returns.T.ravel(),
+                           alpha)
+        visited = np.unique(states)
+        policy[visited] = greedy_actions(q_function[visited], legal[visited])
+        Stats.count("episodes", n_envs)
+        Stats.count("updates", states.size)
+        total_episodes += n_envs
+        for _ in range(n_envs):
+            if epsilon > 0.1:
+                epsilon /= 1.00001
+
+        if interrupt_flag:
+            break
+
+    # Print final
+    print("### FIN du calcul ###")
+    print("actions en s0:", [Actions.ACTIONS[a] for a in np.flatnonzero(legal[s_initial])])
+    print("q_val associées:", ["{:05.2f}".format(q_value) for q_value in q_function[s_initial, legal[s_initial]]])
+    print("batched_monte_carlo iteration, elapsed time: {:05.2f},".format(time.time() - start_time),
+          "v(s0) = {:6.2f}".format(greedy_q_value(q_function, legal, s_initial)))
+
+    if tables is not None:
+        tables["q_function"] = q_function
+    return dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in policy.tolist()]))
+
+
+def greedy_q_value(q_function, legal, s):
+    """
+    :param q_function: un tableau (nombre d'états, N_ACTIONS) de Qvaleurs
+    :param legal: un tableau de booléens (nombre d'états, N_ACTIONS) des actions possibles
+    :param s: la position d'un état
+    :return: max_a Q(s, a) sur les actions possibles
+    """
+    return q_function[s, legal[s]].max()
 
-        reward, future_state = simulator.get(a0, s0)
-        future_action = q_epsilon_greedy(simulator, future_state, epsilon, simulator.get_actions(future_state), q_function)
-        delta = reward + gamma * q_function[str(future_state), future_action] - q_function[str(s0), a0]
+def q_learning(all_states, simulator, time_limit, gamma, epsilon, alpha, initial_state, tables=None, checkpointer=None,
+               resume=None, recorder=None, record_every=RECORD_STEPS):
 
-        # Maj q_value
-        q_function[str(s0), a0] += alpha * delta
-        s0 = future_state
-        a0 = future_action
+    # Initialisation de la q_function et la policy, indexées par état encodé
+    codec = simulator.codec
+    q_function = dict()
+    policy = dict()
+    simulator.precompute_legal_masks(all_states)
+    for s in all_states:
+        policy[s] = Actions.ACTIONS[choice(simulator.get_legal_actions(s))]
+        q_function[s] = [0.] * Actions.N_ACTIONS
+    initial_index = codec.encode(initial_state)
+    # la politique est l'action gloutonne des états mis à jour, maintenue incrémentalement
+    policy = GreedyPolicy(simulator, q_function, policy)
+    if recorder is None:
+        recorder = Metrics.Recorder(Q_LEARNING_METRICS)
+
+    s0 = initial_index
+    # choix exploitation / exploration, comptés localement et ajoutés à Stats avec les mises à jour
+    choices = [0, 0]
+    a0 = a_epsilon_greedy(simulator, s0, epsilon, policy, choices)
 
-        # Maj politique
-        action_list = simulator.get_actions(s0)
-        q_action_list = [q_function[str(s0), action] for action in action_list]
-        policy[str(s0)] = action_list[q_action_list.index(max(q_action_list))]
+    # Algorithme de Q Learning
+    start_time = time.time()
+    count = 1
+    steps = 0
+    total_steps = 0
+    if resume is not None:
+        Checkpoint.restore(resume, q_function, policy)
+        start_time -= float(resume["elapsed"])
+        s0, a0, count = int(resume["s0"]), int(resume["a0"]), int(resume["count"])
+        total_steps = int(resume["steps"])
+        recorder.restore(resume["metrics"])
+    next_record = (total_steps // record_every + 1) * record_every
+    # l'horloge, l'interruption et les courbes ne sont regardées que tous les CLOCK_STEPS pas
+    while time.time() - start_time < time_limit:
+        for _ in range(CLOCK_STEPS):
+            reward, future_state = simulator.get_encoded(Actions.ACTIONS[a0], s0)
+            action_list = simulator.get_legal_actions(future_state)
+            future_action = q_epsilon_greedy(simulator, future_state, epsilon, action_list, policy, choices)
+            q_value = q_function[s0][a0]
+            delta = reward + gamma * q_function[future_state][future_action] - q_value
+
+            # Maj q_value et politique
+            policy.update(s0, a0, q_value + alpha * delta)
+            s0 = future_state
+            a0 = future_action
 
-        if reward == simulator.dead_reward:
-            s0 = Actions.reasign(initial_state)
-            a0 = a_epsilon_greedy(simulator, initial_state, epsilon, policy)
+            if reward == simulator.dead_reward:
+                s0 = initial_index
+                a0 = a_epsilon_greedy(simulator, initial_index, epsilon, policy, choices)
+        steps += CLOCK_STEPS
+        total_steps += CLOCK_STEPS
 
-        # Debug
         time_spent = time.time() - start_time
+        if total_steps >= next_record:
+            next_record += record_every
+            recorder.record(total_steps, time_spent, policy.value(initial_index))
+
         if time_spent > 1 * count:
             count += 1
-            t.append(time_spent)
-            q_values = [q_function[str(initial_state), action] for action in simulator.get_actions(initial_state)]
-            q_value_s0 = max(q_values)
-            q_values_s0.append(q_value_s0)
-            Debug("time spent", time_spent, q_value_s0=q_value_s0)
+            q_value_s0 = policy.value(initial_index)
+            Stats.count("updates", steps)
+            flush_exploration(choices)
+            steps = 0
+            Stats.report("q_learning", elapsed=time_spent, q_value_s0=q_value_s0)
+            if checkpointer is not None and checkpointer.due():
+                checkpointer.save(q_function, policy, elapsed=time_spent, s0=s0, a0=a0, count=count,
+                                  steps=total_steps, metrics=recorder.rows())
 
         if interrupt_flag:
             break
+    Stats.count("updates", steps)
+    flush_exploration(choices)
+    if checkpointer is not None:
+        checkpointer.save(q_function, policy, elapsed=time.time() - start_time, s0=s0, a0=a0, count=count,
+                          steps=total_steps, metrics=recorder.rows())
+        checkpointer.close()
 
-    # Plot
-    dirname = os.path.dirname(os.path.abspath(__file__))
-    plt.plot(t, q_values_s0)
-    title = 'QL, GRID=' + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(simulator.max_battery_level) + " T_LIMIT:" + "{:5}".format(time_limit) + " - q_value_s0"
-    plt.title(title)
-    plt.ylabel('q_value_s0')
-    plt.xlabel('Time(s)')
-    plt.draw()
-    plt.savefig(os.path.join(dirname, "plots", str(title) + ".png"))
+    if tables is not None:
+        tables["q_function"] = q_function
+    return policy.extract()
 
-    return policy
+
+def planning_backups(q_function, legal, buffer, n, gamma, alpha, rng):
+    """
+    n mises à jour de Q learning sur des transitions tirées du tampon, en un lot: les cibles sont calculées avec la
+    fonction de Qvaleur d'avant le lot, puis appliquées dans l'ordre (sequential_updates)
+    :param q_function: un tableau (nombre d'états, N_ACTIONS) de Qvaleurs, modifié en place
+    :param legal: un tableau de booléens (nombre d'états, N_ACTIONS) des actions possibles
+    :param buffer: le tampon des transitions (Replay.ReplayBuffer)
+    :param n: le nombre de mises à jour
+    :param gamma: le facteur d'actualisation
+    :param alpha: le pas d'apprentissage
+    :param rng: le générateur numpy
+    """
+    i = buffer.sample(n, rng)
+    s, a, future_state = buffer.states[i], buffer.actions[i], buffer.successors[i]
+    targets = buffer.rewards[i] + gamma * np.where(legal[future_state], q_function[future_state], -np.inf).max(axis=1)
+    buffer.update_priorities(i, targets - q_function[s, a])
+    sequential_updates(q_function.reshape(-1), s * Actions.N_ACTIONS + a, targets, alpha)
+
+
+def dyna_q_learning(all_states, simulator, time_limit, gamma, epsilon, alpha, initial_state, planning_steps,
+                    buffer_size, prioritized=False, model=None, tables=None, recorder=None, record_every=RECORD_STEPS):
+    """
+    Dyna-Q: chaque pas réel (sur les tableaux de Model.compile_samples, comme Simulator.get) fait une mise à jour de
+    Q learning et range la transition dans un tampon circulaire, et tous les PLANNING_BLOCK pas réels
+    planning_steps * PLANNING_BLOCK mises à jour sont rejouées en un lot vectorisé sur des transitions du tampon.
+    Comme q_learning, un épisode repart de l'état initial à la mort.
+    :param all_states: les index de tous les états (voir get_all_states)
+    :param simulator: le simulateur
+    :param time_limit: la limite de temps en seconde
+    :param gamma: un hyperparamètre
+    :param epsilon: un autre hyperparamètre
+    :param alpha: encore un
+    :param initial_state: l'état initial
+    :param planning_steps: le nombre de mises à jour de planification par pas réel, 0 pour du Q learning seul
+    :param buffer_size: le nombre de transitions gardées dans le tampon
+    :param prioritized: si vrai, les transitions sont rejouées proportionnellement à leur dernière erreur TD
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de Qvaleur ("q_function")
+    :param recorder: le Metrics.Recorder des courbes (Q_LEARNING_METRICS), un tampon seul par défaut
+    :param record_every: le nombre de pas réels entre deux points des courbes
+    :return policy: la politique, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    model.compile_samples(simulator)
+    legal = np.asarray(model.legal)
+    s_initial = int(model.position(simulator.codec.encode(initial_state)))
+    if recorder is None:
+        recorder = Metrics.Recorder(Q_LEARNING_METRICS)
+
+    n_actions = Actions.N_ACTIONS
+    q_function = np.zeros((len(model.states), n_actions))
+    # les pas réels lisent et écrivent les Qvaleurs une à une par une vue mémoire, bien plus rapide que l'indexation
+    # numpy, la planification travaille par lots sur le même tableau
+    q = memoryview(q_function.reshape(-1))
+    legal_actions = [np.flatnonzero(row).tolist() for row in legal]
+    rewards = model.sample_rewards.tolist()
+    probas = model.sample_probas.tolist()
+    successors = model.sample_successors.tolist()
+    buffer = ReplayBuffer(buffer_size, prioritized)
+    # graine tirée du générateur de random, comme les pas réels (sweep.py fixe random.seed)
+    rng = np.random.default_rng(getrandbits(64))
+
+    def greedy(s):
+        return max(legal_actions[s], key=lambda a: q[s * n_actions + a])
+
+    s0 = s_initial
+    start_time = time.time()
+    count = 1
+    steps = 0
+    total_steps = 0
+    next_record = record_every
+    while time.time() - start_time < time_limit:
+        for _ in range(CLOCK_STEPS // PLANNING_BLOCK):
+            for _ in range(PLANNING_BLOCK):
+                actions = legal_actions[s0]
+                if simulator.roll_dice(1 - epsilon + epsilon / len(actions)):
+                    a0 = greedy(s0)
+                else:
+                    a0 = choice(actions)
+                reward = rewards[s0][a0]
+                future_state = successors[s0][a0][0 if simulator.roll_dice(probas[s0][a0]) else 1]
+                key = s0 * n_actions + a0
+                future_q_value = max(q[future_state * n_actions + a] for a in legal_actions[future_state])
+                q[key] += alpha * (reward + gamma * future_q_value - q[key])
+                buffer.add(s0, a0, reward, future_state)
+
+                s0 = s_initial if reward == simulator.dead_reward else future_state
+            if planning_steps:
+                planning_backups(q_function, legal, buffer, planning_steps * PLANNING_BLOCK, gamma, alpha, rng)
+        steps += CLOCK_STEPS
+        total_steps += CLOCK_STEPS
+
+        time_spent = time.time() - start_time
+        if total_steps >= next_record:
+            next_record += record_every
+            recorder.record(total_steps, time_spent, greedy_q_value(q_function, legal, s_initial))
+        if time_spent > count:
+            count += 1
+            Stats.count("updates", steps * (1 + planning_steps))
+            steps = 0
+            Stats.report("dyna_q_learning", elapsed=time_spent, q_value_s0=greedy_q_value(q_function, legal, s_initial))
+
+        if interrupt_flag:
+            break
+    Stats.count("updates", steps * (1 + planning_steps))
+    q.release()
+    print("dyna_q_learning: {} pas réels, {} mises à jour de planification, tampon: {}/{}".format(
+        total_steps, total_steps * planning_steps, len(buffer), buffer_size))
+
+    if tables is not None:
+        tables["q_function"] = q_function
+    policy = greedy_actions(q_function, legal)
+    return dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in policy.tolist()]))
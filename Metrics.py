@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+
+
+class Recorder:
+    """
+    Enregistre les séries d'un apprentissage, une ligne de valeurs par point, dans un tampon circulaire préalloué (les
+    plus anciens points sont écrasés au-delà de capacity), et si path est donné les ajoute aussi à un fichier csv
+    relu ensuite par load (voir Plots). Les algorithmes enregistrent un point tous les n mises à jour ou épisodes.
+    """
+
+    def __init__(self, names, capacity=100000, path=None, append=False):
+        """
+        :param names: les noms des colonnes
+        :param capacity: le nombre de lignes du tampon
+        :param path: le fichier csv où ajouter les lignes, None pour ne garder que le tampon
+        :param append: si vrai, continue le fichier (reprise) au lieu de le réécrire
+        """
+        self.names = list(names)
+        self.buffer = np.empty((capacity, len(self.names)))
+        self.count = 0
+        self.file = None
+        if path is not None:
+            new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+            self.file = open(path, "w" if new else "a")
+            if new:
+                self.file.write(",".join(self.names) + "\n")
+
+    def record(self, *values):
+        """
+        Ajoute un point
+        :param values: une valeur par colonne
+        """
+        self.buffer[self.count % len(self.buffer)] = values
+        self.count += 1
+        if self.file is not None:
+            self.file.write(",".join("{:.17g}".format(value) for value in values) + "\n")
+
+    def restore(self, rows):
+        """
+        Remet dans le tampon des lignes déjà enregistrées (reprise), sans les réécrire dans le fichier
+        :param rows: les lignes (voir rows)
+        """
+        for row in rows:
+            self.buffer[self.count % len(self.buffer)] = row
+            self.count += 1
+
+    def rows(self):
+        """
+        :return: un tableau (nombre de points, nombre de colonnes) des points du tampon, du plus ancien au plus récent
+        """
+        capacity = len(self.buffer)
+        if self.count <= capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+    def series(self):
+        """
+        :return: un dict nom de colonne -> tableau de ses valeurs
+        """
+        return dict(zip(self.names, self.rows().T))
+
+    def close(self):
+        """
+        Ferme le fichier csv
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load(path):
+    """
+    :param path: un fichier csv écrit par un Recorder
+    :return: un dict nom de colonne -> tableau de ses valeurs
+    """
+    with open(path) as f:
+        names = f.readline().strip().split(",")
+    rows = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    return dict(zip(names, rows.T))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import Actions
+
+
+def index_array(indices):
+    """
+    :param indices: des index (StateCodec), un range (voir Learning.get_all_states) ou une séquence d'entiers
+    :return: le tableau int64 des index, construit sans passer par des entiers Python pour un range
+    """
+    if isinstance(indices, range):
+        return np.arange(indices.start, indices.stop, indices.step, dtype=np.int64)
+    return np.asarray(indices, dtype=np.int64)
+
+
+def do_action_batch(simulator, action, battery_level, robot, base, mask):
+    """
+    Equivalent vectorisé de Simulator.do_action sur les composantes d'états encodés.
+    Les résultats n'ont de sens que là où l'action est possible.
+    :param simulator: le simulateur
+    :param action: un string représentant une action
+    :param battery_level, robot, base, mask: les composantes des états (voir StateCodec.split)
+    :return: les composantes des états suivants
+    """
+    width, height = simulator.grid_size
+    if action == "load":
+        return battery_level + 1, robot, base, mask
+    if action == "dead" or action == "stay":
+        return battery_level, robot, base, mask
+
+    x, y = robot % width, robot // width
+    if action == "move_up":
+        robot = np.where(y != 0, robot - width, robot)
+    elif action == "move_down":
+        robot = np.where(y != height - 1, robot + width, robot)
+    elif action == "move_left":
+        robot = np.where(x != 0, robot - 1, robot)
+    elif action == "move_right":
+        robot = np.where(x != width - 1, robot + 1, robot)
+    elif action == "clean":
+        mask = mask & ~(1 << robot)
+    return battery_level - 1, robot, base, mask
+
+
+def legal_actions_batch(simulator, battery_level, robot, base, mask):
+    """
+    Equivalent vectorisé de Simulator.get_actions
+    :param simulator: le simulateur
+    :param battery_level, robot, base, mask: les composantes des états (voir StateCodec.split)
+    :return: un tableau de booléens (nombre d'états, N_ACTIONS), colonnes dans l'ordre de Actions.ACTIONS
+    """
+    width, height = simulator.grid_size
+    x, y = robot % width, robot // width
+    alive = battery_level > 0
+    on_base = robot == base
+    legal = np.zeros((len(battery_level), Actions.N_ACTIONS), dtype=bool)
+    legal[:, Actions.ACTION_INDEX["clean"]] = (mask >> robot & 1).astype(bool) & alive
+    legal[:, Actions.ACTION_INDEX["load"]] = on_base & (battery_level < simulator.max_battery_level)
+    if width != 1:
+        legal[:, Actions.ACTION_INDEX["move_left"]] = alive & (x != 0)
+        legal[:, Actions.ACTION_INDEX["move_right"]] = alive & (x != width - 1)
+    if height != 1:
+        legal[:, Actions.ACTION_INDEX["move_up"]] = alive & (y != 0)
+        # même borne que Simulator.get_actions
+        legal[:, Actions.ACTION_INDEX["move_down"]] = alive & (y != width - 1)
+    legal[:, Actions.ACTION_INDEX["stay"]] = (mask == 0) & on_base & (battery_level == simulator.max_battery_level)
+    legal[:, Actions.ACTION_INDEX["dead"]] = ~alive & ~on_base
+    return legal
+
+
+def legal_masks_batch(simulator, battery_level, robot, base, mask):
+    """
+    Comme legal_actions_batch, mais chaque ligne est compactée en un masque (voir Actions.MASK_INDICES)
+    :param simulator: le simulateur
+    :param battery_level, robot, base, mask: les composantes des états (voir StateCodec.split)
+    :return: un tableau d'entiers, le masque des actions possibles de chaque état
+    """
+    legal = legal_actions_batch(simulator, battery_level, robot, base, mask)
+    return legal.astype(np.int64) @ (1 << np.arange(Actions.N_ACTIONS))
+
+
+def get_distribution_batch(simulator, action, indices, battery_level, robot, base, mask):
+    """
+    Equivalent vectorisé de Simulator.get_distribution pour une action sur des états encodés.
+    Les résultats n'ont de sens que là où l'action est possible.
+    :param simulator: le simulateur
+    :param action: un string représentant une action
+    :param indices: les index des états
+    :param battery_level, robot, base, mask: les composantes des états (voir StateCodec.split)
+    :return rewards, probas, successes, failures: les récompenses, les probabilités de succès et les index des états
+    suivants en cas de succès et d'échec
+    """
+    dead = battery_level == 0
+    goal = (mask == 0) & (robot == base)
+    unloaded = indices - simulator.codec.pack(1, 0, 0, 0)
+    success = simulator.codec.pack(*do_action_batch(simulator, action, battery_level, robot, base, mask))
+    if action == "load" or action == "stay":
+        reward, failure = simulator.charging_reward, indices
+    else:
+        reward, failure = simulator.moving_reward, unloaded
+
+    rewards = np.where(dead, simulator.dead_reward, np.where(goal, simulator.goal_reward, reward))
+    probas = np.where(dead, 1., simulator.get_proba(action))
+    successes = np.where(dead, indices, success)
+    failures = np.where(dead, indices, np.where(goal, unloaded, failure))
+    return rewards, probas, successes, failures
+
+
+class Model:
+    """
+    Modèle compilé du simulateur (get_with_model) sur un ensemble d'états encodés.
+    Les états sont rangés par index croissant et désignés par leur position. Chaque couple (état, action) a au plus
+    deux issues: successors[s, a] donne les positions des états suivants et probas[s, a] leurs probabilités.
+    """
+
+    def __init__(self, simulator, indices):
+        """
+        :param simulator: le simulateur
+        :param indices: les index (StateCodec) des états à compiler, l'ensemble doit être clos par transition
+        """
+        self.states = np.unique(index_array(indices))
+        n_states, n_actions = len(self.states), Actions.N_ACTIONS
+        battery_level, robot, base, mask = simulator.codec.split(self.states)
+
+        self.legal = legal_actions_batch(simulator, battery_level, robot, base, mask)
+        self.rewards = np.zeros((n_states, n_actions))
+        self.probas = np.zeros((n_states, n_actions, 2))
+        self.successors = np.broadcast_to(np.arange(n_states)[:, None, None], (n_states, n_actions, 2)).copy()
+
+        dead = (battery_level == 0) & (robot != base)
+        goal = (mask == 0) & (robot == base) & (battery_level == simulator.max_battery_level) & ~dead
+        unloaded = self.states - simulator.codec.pack(1, 0, 0, 0)
+        for a, action in enumerate(Actions.ACTIONS):
+            legal = self.legal[:, a]
+            proba = simulator.get_proba(action)
+            reward = simulator.charging_reward if action == "load" and proba != 1 else simulator.moving_reward
+            self.rewards[:, a] = np.where(dead, simulator.dead_reward, np.where(goal, simulator.goal_reward, reward))
+
+            # dead: l'état reste le même avec probabilité 1
+            success = simulator.codec.pack(*do_action_batch(simulator, action, battery_level, robot, base, mask))
+            position = np.flatnonzero(legal & ~dead)
+            self.successors[position, a, 0] = self.position(success[position])
+            self.probas[position, a, 0] = proba
+            self.probas[legal & dead, a, 0] = 1.
+            if proba != 1:
+                # l'échec d'un chargement laisse l'état inchangé, sauf dans l'état but où la batterie se décharge
+                failure = np.where(goal | (action != "load"), unloaded, self.states)
+                self.successors[position, a, 1] = self.position(failure[position])
+                self.probas[position, a, 1] = 1 - proba
+
+    @classmethod
+    def from_arrays(cls, states, legal, rewards, successors, probas):
+        """
+        Reconstruit un modèle à partir de ses tableaux (voir Storage), sans le recompiler
+        :return: le modèle
+        """
+        model = cls.__new__(cls)
+        model.states, model.legal, model.rewards = states, legal, rewards
+        model.successors, model.probas = successors, probas
+        return model
+
+    def compile_samples(self, simulator):
+        """
+        Compile aussi la dynamique de Simulator.get (utilisée pour générer des épisodes) sur les positions du modèle:
+        sample_rewards[s, a], sample_probas[s, a] et les positions sample_successors[s, a] des états suivants en cas de
+        succès et d'échec. Ne fait rien si c'est déjà fait.
+        :param simulator: le simulateur
+        """
+        if hasattr(self, "sample_rewards"):
+            return
+        n_states, n_actions = len(self.states), Actions.N_ACTIONS
+        components = simulator.codec.split(np.asarray(self.states))
+        self.sample_rewards = np.zeros((n_states, n_actions))
+        self.sample_probas = np.ones((n_states, n_actions))
+        self.sample_successors = np.broadcast_to(np.arange(n_states)[:, None, None], (n_states, n_actions, 2)).copy()
+        for a, action in enumerate(Actions.ACTIONS):
+            position = np.flatnonzero(self.legal[:, a])
+            rewards, probas, successes, failures = get_distribution_batch(
+                simulator, action, self.states[position], *[component[position] for component in components])
+            self.sample_rewards[position, a] = rewards
+            self.sample_probas[position, a] = probas
+            self.sample_successors[position, a, 0] = self.position(successes)
+            self.sample_successors[position, a, 1] = self.position(failures)
+
+    def position(self, indices):
+        """
+        Etant donné des index d'états retourne leurs positions dans le modèle
+        :param indices: des index (StateCodec)
+        :return: les positions
+        """
+        positions = np.minimum(np.searchsorted(self.states, indices), len(self.states) - 1)
+        if np.any(self.states[positions] != indices):
+            raise KeyError("état absent du modèle")
+        return positions
+
+    def submodel(self, positions):
+        """
+        Sous-modèle sur une partie close par transition des états
+        :param positions: les positions (triées) des états du sous-modèle
+        :return: le sous-modèle (Model), ses états désignés par leur position dans positions
+        """
+        local = np.full(len(self.states), -1, dtype=np.int64)
+        local[positions] = np.arange(len(positions))
+        successors = local[self.successors[positions]]
+        if np.any(successors[np.asarray(self.probas[positions]) > 0] < 0):
+            raise ValueError("les états ne sont pas clos par transition")
+        return Model.from_arrays(self.states[positions], self.legal[positions], self.rewards[positions],
+                                 np.maximum(successors, 0), self.probas[positions])
+
+    def base_blocks(self, codec):
+        """
+        Partition des états en sous-problèmes indépendants. Aucune action ne déplace la base: les transitions relient
+        des états de même base (ou de bases symétriques dans un ReducedModel), les blocs sont les classes de bases
+        reliées par une transition.
+        :param codec: le StateCodec des états
+        :return: la liste des positions (triées) des états de chaque bloc
+        """
+        base = codec.split(self.states)[2]
+        s, a, k = np.nonzero(np.asarray(self.legal)[:, :, None] & (np.asarray(self.probas) > 0))
+        links = np.unique(np.stack([base[s], base[self.successors[s, a, k]]], axis=1), axis=0)
+        root = list(range(codec.n_cells))
+
+        def find(cell):
+            while root[cell] != cell:
+                cell = root[cell]
+            return cell
+
+        for cell, other in links.tolist():
+            root[find(cell)] = find(other)
+        block = np.array([find(cell) for cell in range(codec.n_cells)])[base]
+        return [np.flatnonzero(block == b) for b in np.unique(block).tolist()]
+
+    def scc_levels(self):
+        """
+        Niveaux des composantes fortement connexes du graphe des transitions: une composante est au niveau 0 si elle
+        ne mène à aucune autre, sinon un de plus que la plus haute de celles où elle mène. Les transitions d'un état
+        restent donc dans sa composante ou descendent de niveau.
+        :return components, levels: la composante et le niveau de chaque état
+        """
+        # scipy n'est importé qu'à l'utilisation, il double le temps de démarrage
+        from scipy import sparse
+        from scipy.sparse import csgraph
+        n_states = len(self.states)
+        s, a, k = np.nonzero(np.asarray(self.legal)[:, :, None] & (np.asarray(self.probas) > 0))
+        successors = self.successors[s, a, k]
+        graph = sparse.csr_matrix((np.ones(len(s), dtype=np.int32), (s, successors)), shape=(n_states, n_states))
+        n_components, components = csgraph.connected_components(graph, directed=True, connection="strong")
+        source, target = components[s], components[successors]
+        links = np.unique(np.stack([source, target], axis=1)[source != target], axis=0)
+        levels = np.zeros(n_components, dtype=np.int64)
+        while True:
+            relaxed = levels.copy()
+            np.maximum.at(relaxed, links[:, 0], levels[links[:, 1]] + 1)
+            if np.array_equal(relaxed, levels):
+                return components, levels[components]
+            levels = relaxed
+
+    def q_values(self, value_function, gamma, start=0, stop=None):
+        """
+        Backup de Bellman vectorisé sur les positions [start, stop).
+        Les termes sont sommés dans le même ordre que dans dynamic_programming pour que les égalités entre actions
+        soient départagées de la même façon.
+        :param value_function: les valeurs courantes de tous les états du modèle
+        :param gamma: le facteur d'actualisation
+        :param start: la première position
+        :param stop: la position de fin (exclue), toutes les positions par défaut
+        :return: un tableau (stop - start, N_ACTIONS), -inf pour les actions impossibles
+        """
+        stop = len(self.states) if stop is None else stop
+        successors, probas = self.successors[start:stop], self.probas[start:stop]
+        q_values = self.rewards[start:stop] + gamma * probas[:, :, 0] * value_function[successors[:, :, 0]]
+        q_values += gamma * probas[:, :, 1] * value_function[successors[:, :, 1]]
+        q_values[~self.legal[start:stop]] = -np.inf
+        return q_values
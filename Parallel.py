@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import contextlib
+import io
+import multiprocessing
+import random
+import signal
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import Actions
+import Learning
+import Metrics
+import Model
+import Stats
+
+# nombre de pas entre deux vérifications de l'arrêt par un worker de q learning
+CHUNK = 1000
+
+# algorithme, simulateur, modèle et paramètres des processus de decomposed_dynamic_programming, hérités à leur création
+block_context = None
+
+
+class SharedQFunction:
+    """
+    Fonction de Qvaleur, tableau (nombre d'états, N_ACTIONS), en mémoire partagée entre processus.
+    Les workers y écrivent sans verrou (Hogwild): une mise à jour concurrente d'une même entrée peut être perdue, ce
+    qui est négligeable devant le bruit des tirages.
+    """
+
+    def __init__(self, shape, name=None):
+        """
+        :param shape: la forme du tableau
+        :param name: le nom d'un segment existant à ouvrir, None pour en créer un initialisé à 0
+        """
+        self.shape = shape
+        self.owner = name is None
+        size = int(np.prod(shape)) * np.dtype(np.float64).itemsize
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.name = self.memory.name
+        self.array = np.ndarray(shape, dtype=np.float64, buffer=self.memory.buf)
+        if self.owner:
+            self.array[:] = 0.
+
+    def close(self):
+        """
+        Détache le segment, et le supprime si c'est le processus qui l'a créé
+        """
+        del self.array
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def start_workers(target, n_workers, q_function, seed, *args):
+    """
+    Lance n_workers processus target(worker, seed, nom du segment, forme, stop, updates, *args)
+    :param target: la fonction d'un worker
+    :param n_workers: le nombre de processus
+    :param q_function: la fonction de Qvaleur partagée (SharedQFunction)
+    :param seed: la graine des workers, None pour une graine tirée au hasard. Chaque worker en reçoit une dérivée
+    indépendante (numpy.random.SeedSequence.spawn)
+    :return processes, stop, updates: les processus, l'évènement qui les arrête, et le nombre de mises à jour faites par
+    chacun
+    """
+    stop = multiprocessing.Event()
+    updates = multiprocessing.Array("q", n_workers, lock=False)
+    processes = [multiprocessing.Process(target=target, daemon=True,
+                                         args=(worker, worker_seed, q_function.name, q_function.shape, stop, updates)
+                                         + args)
+                 for worker, worker_seed in enumerate(np.random.SeedSequence(seed).spawn(n_workers))]
+    for process in processes:
+        process.start()
+    return processes, stop, updates
+
+
+def stop_workers(processes, stop):
+    """
+    Arrête les workers et attend leur fin
+    :param processes: les processus
+    :param stop: l'évènement qui les arrête
+    """
+    stop.set()
+    for process in processes:
+        process.join()
+
+
+def q_learning_worker(worker, seed, name, shape, stop, updates, model, s_initial, gamma, epsilon, alpha, dead_reward):
+    """
+    Boucle de q learning d'un worker sur les tableaux de Model.compile_samples, jusqu'à ce que stop soit levé.
+    Même algorithme que Learning.q_learning, la politique étant l'action gloutonne de la fonction de Qvaleur partagée.
+    """
+    # seul le processus principal traite ctrl-c, il arrête ensuite les workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    q_function = SharedQFunction(shape, name)
+    # accès scalaires: une vue mémoire et des listes python sont bien plus rapides que l'indexation numpy
+    q = q_function.memory.buf.cast("d")
+    rng = random.Random(int(seed.generate_state(1, np.uint64)[0]))
+    n_actions = Actions.N_ACTIONS
+    legal = [np.flatnonzero(row).tolist() for row in model.legal]
+    rewards = model.sample_rewards.tolist()
+    probas = model.sample_probas.tolist()
+    successors = model.sample_successors.tolist()
+
+    def epsilon_greedy(s):
+        actions = legal[s]
+        if rng.random() < 1 - epsilon + epsilon / len(actions):
+            return max(actions, key=lambda a: q[s * n_actions + a])
+        return rng.choice(actions)
+
+    s0, a0 = s_initial, epsilon_greedy(s_initial)
+    count = 0
+    while not stop.is_set():
+        for _ in range(CHUNK):
+            reward = rewards[s0][a0]
+            future_state = successors[s0][a0][0 if rng.random() < probas[s0][a0] else 1]
+            future_action = epsilon_greedy(future_state)
+            key = s0 * n_actions + a0
+            q[key] += alpha * (reward + gamma * q[future_state * n_actions + future_action] - q[key])
+            if reward == dead_reward:
+                s0, a0 = s_initial, epsilon_greedy(s_initial)
+            else:
+                s0, a0 = future_state, future_action
+        count += CHUNK
+        updates[worker] = count
+    q.release()
+    q_function.close()
+
+
+def parallel_q_learning(all_states, simulator, time_limit, gamma, epsilon, alpha, initial_state, n_workers,
+                        model=None, seed=None, tables=None, recorder=None):
+    """
+    Q learning sur n_workers processus qui partagent la même fonction de Qvaleur
+    :param all_states: les index de tous les états (voir Learning.get_all_states)
+    :param simulator: le simulateur
+    :param time_limit: la limite de temps en seconde
+    :param gamma: un hyperparamètre
+    :param epsilon: un autre hyperparamètre
+    :param alpha: encore un
+    :param initial_state: l'état initial
+    :param n_workers: le nombre de processus
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param seed: la graine des workers, None pour une graine tirée au hasard
+    :param tables: si donné, un dict dans lequel est rangée la fonction de Qvaleur ("q_function")
+    :param recorder: le Metrics.Recorder des courbes (Learning.Q_LEARNING_METRICS), un point par seconde, un tampon
+    seul par défaut
+    :return policy: la politique, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    model.compile_samples(simulator)
+    legal = np.asarray(model.legal)
+    s_initial = int(model.position(simulator.codec.encode(initial_state)))
+    if recorder is None:
+        recorder = Metrics.Recorder(Learning.Q_LEARNING_METRICS)
+
+    q_function = SharedQFunction((len(model.states), Actions.N_ACTIONS))
+    try:
+        processes, stop, updates = start_workers(q_learning_worker, n_workers, q_function, seed, model, s_initial,
+                                                 gamma, epsilon, alpha, simulator.dead_reward)
+        start_time = time.time()
+        while time.time() - start_time < time_limit and not Learning.interrupt_flag:
+            time.sleep(min(1, max(0, start_time + time_limit - time.time())))
+            time_spent = time.time() - start_time
+            q_value_s0 = Learning.greedy_q_value(q_function.array, legal, s_initial)
+            recorder.record(sum(updates), time_spent, q_value_s0)
+            Stats.report("parallel_q_learning", elapsed=time_spent, q_value_s0=q_value_s0, updates=sum(updates))
+        stop_workers(processes, stop)
+        Stats.count("updates", sum(updates))
+        q = q_function.array.copy()
+    finally:
+        q_function.close()
+
+    print("parallel_q_learning, workers:", n_workers, "mises à jour:", sum(updates),
+          "({:.0f}/s)".format(sum(updates) / (time.time() - start_time)))
+
+    if tables is not None:
+        tables["q_function"] = q
+    policy = Learning.greedy_actions(q, legal)
+    return dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in policy.tolist()]))
+
+
+def monte_carlo_worker(worker, seed, name, shape, stop, updates, model, s_initial, T, gamma, epsilon, alpha, n_envs,
+                       total_rewards):
+    """
+    Boucle de batched_monte_carlo d'un worker, jusqu'à ce que stop soit levé, les mises à jour étant faites dans la
+    fonction de Qvaleur partagée. La politique de chaque worker est l'action gloutonne des états qu'il a visités.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    q_function = SharedQFunction(shape, name)
+    rng = np.random.default_rng(seed)
+    legal = np.asarray(model.legal)
+    policy = Learning.random_legal_actions(legal, rng.random(len(legal)))
+    states = np.empty((T + 1, n_envs), dtype=np.int64)
+    actions = np.empty((T + 1, n_envs), dtype=np.int64)
+    rewards = np.empty((T + 1, n_envs))
+    returns = np.empty((T + 1, n_envs))
+    count = 0
+    while not stop.is_set():
+        Learning.generate_episodes(model, policy, epsilon, s_initial, rng, states, actions, rewards)
+        Learning.discounted_returns(rewards, gamma, returns)
+        total_rewards[worker] = rewards.sum(axis=0).mean()
+
+        Learning.sequential_updates(q_function.array.reshape(-1), (states * Actions.N_ACTIONS + actions).T.ravel(),
+                                    returns.T.ravel(), alpha)
+        visited = np.unique(states)
+        policy[visited] = Learning.greedy_actions(q_function.array[visited], legal[visited])
+        for _ in range(n_envs):
+            if epsilon > 0.1:
+                epsilon /= 1.00001
+        count += n_envs
+        updates[worker] = count
+    q_function.close()
+
+
+def parallel_monte_carlo(all_states, simulator, time_limit, T, gamma, epsilon, alpha, initial_state, n_workers, n_envs,
+                         step=1, model=None, seed=None, tables=None, recorder=None):
+    """
+    batched_monte_carlo sur n_workers processus qui partagent la même fonction de Qvaleur
+    :param all_states: les index de tous les états (voir Learning.get_all_states)
+    :param simulator: le simulateur
+    :param time_limit: la limite de temps en seconde
+    :param T: la longueur des épisodes générés
+    :param gamma: un hyperparamètre
+    :param epsilon: un autre hyperparamètre
+    :param alpha: encore un
+    :param initial_state: l'état initial
+    :param n_workers: le nombre de processus
+    :param n_envs: le nombre d'épisodes générés en parallèle par chaque processus
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param seed: la graine des workers, None pour une graine tirée au hasard
+    :param tables: si donné, un dict dans lequel est rangée la fonction de Qvaleur ("q_function")
+    :param recorder: le Metrics.Recorder des courbes (Learning.MONTE_CARLO_METRICS), un point tous les step secondes,
+    un tampon seul par défaut
+    :return policy: la politique, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    model.compile_samples(simulator)
+    legal = np.asarray(model.legal)
+    s_initial = int(model.position(simulator.codec.encode(initial_state)))
+    if recorder is None:
+        recorder = Metrics.Recorder(Learning.MONTE_CARLO_METRICS)
+
+    q_function = SharedQFunction((len(model.states), Actions.N_ACTIONS))
+    total_rewards = multiprocessing.Array("d", n_workers, lock=False)
+    try:
+        processes, stop, updates = start_workers(monte_carlo_worker, n_workers, q_function, seed, model, s_initial, T,
+                                                 gamma, epsilon, alpha, n_envs, total_rewards)
+        start_time = time.time()
+        while time.time() - start_time < time_limit and not Learning.interrupt_flag:
+            time.sleep(min(step, max(0, start_time + time_limit - time.time())))
+            time_spent = time.time() - start_time
+            v = Learning.greedy_q_value(q_function.array, legal, s_initial)
+            Stats.report("parallel_monte_carlo", elapsed=time_spent, v_s0=v, episodes=sum(updates))
+            recorder.record(sum(updates), time_spent, sum(total_rewards) / n_workers / T, v)
+        stop_workers(processes, stop)
+        Stats.count("episodes", sum(updates))
+        Stats.count("updates", sum(updates) * (T + 1))
+        q = q_function.array.copy()
+    finally:
+        q_function.close()
+
+    # Print final
+    print("### FIN du calcul ###")
+    print("actions en s0:", [Actions.ACTIONS[a] for a in np.flatnonzero(legal[s_initial])])
+    print("q_val associées:", ["{:05.2f}".format(q_value) for q_value in q[s_initial, legal[s_initial]]])
+    print("parallel_monte_carlo, workers:", n_workers, "épisodes:", sum(updates),
+          "({:.0f}/s),".format(sum(updates) / (time.time() - start_time)),
+          "v(s0) = {:6.2f}".format(Learning.greedy_q_value(q, legal, s_initial)))
+
+    if tables is not None:
+        tables["q_function"] = q
+    policy = Learning.greedy_actions(q, legal)
+    return dict(zip(model.states.tolist(), [Actions.ACTIONS[a] for a in policy.tolist()]))
+
+
+def initialize_block_worker(solver, simulator, model, gamma, epsilon, kwargs):
+    """
+    Initialisation d'un processus de decomposed_dynamic_programming
+    """
+    global block_context
+    block_context = solver, simulator, model, gamma, epsilon, kwargs
+
+
+def solve_block(positions):
+    """
+    Résout un bloc de decomposed_dynamic_programming
+    :param positions: les positions des états du bloc dans le modèle
+    :return positions, policy, value_function: les positions, la politique et la fonction de valeur du bloc
+    """
+    solver, simulator, model, gamma, epsilon, kwargs = block_context
+    tables = dict()
+    # les algorithmes affichent chaque itération, illisible quand les blocs sont résolus en même temps
+    with contextlib.redirect_stdout(io.StringIO()):
+        policy = solver(None, simulator, gamma, epsilon, model=model.submodel(positions), tables=tables, **kwargs)
+    return positions, policy, tables["value_function"]
+
+
+def decomposed_dynamic_programming(solver, all_states, simulator, gamma, epsilon, n_workers, model=None,
+                                   tables=None, **kwargs):
+    """
+    Programmation dynamique par sous-problèmes indépendants (Model.base_blocks, un par position de la base): chaque
+    bloc est résolu séparément, avec ses propres tables, sur n_workers processus, puis les politiques sont recollées.
+    Les valeurs sont celles de solver sur tout le modèle, au critère d'arrêt près qui est appliqué par bloc.
+    :param solver: vectorized_dynamic_programming, ordered_dynamic_programming, prioritized_sweeping ou
+    policy_iteration
+    :param all_states: les index de tous les états (voir Learning.get_all_states)
+    :param simulator: le simulateur
+    :param gamma:
+    :param epsilon:
+    :param n_workers: le nombre de processus
+    :param model: le modèle compilé des états de all_states s'il est déjà disponible (voir Storage)
+    :param tables: si donné, un dict dans lequel est rangée la fonction de valeur ("value_function")
+    :param kwargs: les autres paramètres de solver (evaluation_sweeps)
+    :return policy: la politique optimale, indexée par état encodé
+    """
+    if model is None:
+        model = Model.Model(simulator, all_states)
+    start_time = time.time()
+    # les plus gros blocs d'abord pour équilibrer les processus
+    blocks = sorted(model.base_blocks(simulator.codec), key=len, reverse=True)
+    n_workers = min(n_workers, len(blocks))
+    if n_workers > 1:
+        with multiprocessing.Pool(n_workers, initializer=initialize_block_worker,
+                                  initargs=(solver, simulator, model, gamma, epsilon, kwargs)) as pool:
+            results = list(pool.imap_unordered(solve_block, blocks))
+    else:
+        initialize_block_worker(solver, simulator, model, gamma, epsilon, kwargs)
+        results = [solve_block(positions) for positions in blocks]
+
+    policy = dict()
+    value_function = np.zeros(len(model.states))
+    for positions, block_policy, block_values in results:
+        policy.update(block_policy)
+        value_function[positions] = block_values
+    Stats.count("blocks", len(blocks))
+    print("decomposed", solver.__name__ + ":", len(blocks), "blocs de", min(map(len, blocks)), "à",
+          max(map(len, blocks)), "états, workers:", n_workers, "en {:.2f}s".format(time.time() - start_time))
+    if tables is not None:
+        tables["value_function"] = value_function
+    return policy
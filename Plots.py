@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracé des courbes des algorithmes, séparé de l'apprentissage: les algorithmes enregistrent leurs séries dans un
+Metrics.Recorder, main.py les trace une fois la résolution terminée et matplotlib n'est importé qu'au premier tracé.
+
+Les séries enregistrées dans un fichier csv (Metrics.Recorder) se tracent après coup:
+
+    ./Plots.py cache/.../metrics.csv elapsed v_s0
+"""
+import os
+import sys
+
+# à False les courbes ne sont ni tracées ni sauvegardées
+PLOTS = True
+DIRNAME = os.path.dirname(os.path.abspath(__file__))
+
+
+def pyplot():
+    """
+    :return: matplotlib.pyplot, importé au premier appel (backend Agg, sans affichage)
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_mean_values(x, mean_values, simulator, epsilon):
+    """
+    Trace et sauvegarde la courbe des valeurs moyennes de la programmation dynamique
+    :param x: les itérations
+    :param mean_values: la valeur moyenne des états à chaque itération
+    :param simulator: le simulateur
+    :param epsilon: le critère d'arrêt
+    """
+    if not PLOTS:
+        return
+    plt = pyplot()
+    # plt.figure()
+
+    plt.plot(x, mean_values)
+
+    title = 'DP, EPSILON=' + "{:3}".format(epsilon) + " GRID=" + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(
+        simulator.max_battery_level) + " - mean_values of policy"
+    plt.title(title)
+    plt.ylabel('Mean value')
+    plt.xlabel('Iteration')
+    plt.draw()
+    plt.savefig(DIRNAME + "/plots/" + title + ".png")
+
+
+def plot_monte_carlo(x, mean_rewards, v_s0, simulator, T, time_limit):
+    """
+    Trace et sauvegarde les courbes de récompense moyenne et de v(s0) de monte carlo
+    :param x: les instants (en secondes)
+    :param mean_rewards: la récompense moyenne par pas du dernier épisode à chaque instant
+    :param v_s0: la valeur de l'état initial à chaque instant
+    :param simulator: le simulateur
+    :param T: la longueur des épisodes
+    :param time_limit: la limite de temps en seconde
+    """
+    if not PLOTS:
+        return
+    plt = pyplot()
+    # plt.figure()
+    plt.plot(x, mean_rewards)
+    title = 'MC, T=' + "{:3}".format(T) + " GRID=" + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(simulator.max_battery_level) + " T_LIMIT:" + "{:5}".format(time_limit) + " - mean_reward"
+    plt.title(title)
+    plt.ylabel('Récompense moyenne')
+    plt.xlabel('Time(s)')
+    plt.draw()
+    print(os.path.join(DIRNAME, "plots", title + ".png"))
+    plt.savefig(DIRNAME + "/plots/" + title + ".png")
+
+    plt.clf()
+    plt.plot(x, v_s0)
+    title = 'MC, T=' + "{:3}".format(T) + " GRID=" + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(simulator.max_battery_level) + " T_LIMIT:" + "{:5}".format(time_limit) + " - v_s0(t)"
+    plt.ylabel('v(s0)')
+    plt.xlabel('Time(s)')
+    plt.draw()
+    plt.savefig(DIRNAME + "/plots/" + title + ".png")
+
+
+def plot_q_learning(t, q_values_s0, simulator, time_limit):
+    """
+    Trace et sauvegarde la courbe de max_a Q(s0, a) du q learning
+    :param t: les instants (en secondes)
+    :param q_values_s0: max_a Q(s0, a) à chaque instant
+    :param simulator: le simulateur
+    :param time_limit: la limite de temps en seconde
+    """
+    if not PLOTS:
+        return
+    plt = pyplot()
+    plt.plot(t, q_values_s0)
+    title = 'QL, GRID=' + "{:9}".format(str(simulator.grid_size)) + "BAT:" + str(simulator.max_battery_level) + " T_LIMIT:" + "{:5}".format(time_limit) + " - q_value_s0"
+    plt.title(title)
+    plt.ylabel('q_value_s0')
+    plt.xlabel('Time(s)')
+    plt.draw()
+    plt.savefig(os.path.join(DIRNAME, "plots", str(title) + ".png"))
+
+
+def plot_series(series, x, y, title):
+    """
+    Trace et sauvegarde des colonnes d'une série enregistrée (voir Metrics) en fonction d'une autre
+    :param series: un dict nom de colonne -> tableau de ses valeurs
+    :param x: le nom de la colonne en abscisse
+    :param y: les noms des colonnes en ordonnée
+    :param title: le titre, et le nom du fichier dans plots/
+    :return: le chemin de l'image
+    """
+    plt = pyplot()
+    plt.clf()
+    for name in y:
+        plt.plot(series[x], series[name], label=name)
+    plt.title(title)
+    plt.xlabel(x)
+    plt.legend()
+    plt.draw()
+    path = os.path.join(DIRNAME, "plots", title + ".png")
+    plt.savefig(path)
+    return path
+
+
+if __name__ == "__main__":
+    import Metrics
+
+    if len(sys.argv) < 2:
+        print("./Plots.py <metrics.csv> [abscisse [ordonnées...]]")
+        sys.exit(-1)
+    series = Metrics.load(sys.argv[1])
+    names = list(series)
+    x = sys.argv[2] if len(sys.argv) > 2 else names[0]
+    y = sys.argv[3:] or [name for name in names if name != x]
+    run = os.path.basename(os.path.dirname(os.path.abspath(sys.argv[1])))
+    print(plot_series(series, x, y, run + " - " + ", ".join(y)))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import Actions
+
+
+class GreedyPolicy:
+    """
+    Politique gloutonne d'une fonction de Qvaleur (dict état encodé -> liste de N_ACTIONS valeurs), maintenue
+    incrémentalement: l'action gloutonne d'un état n'est recalculée que lorsqu'une mise à jour peut changer le max,
+    c'est-à-dire quand la Qvaleur de l'action gloutonne baisse. Les égalités sont départagées comme dans les
+    algorithmes: la première action possible dans l'ordre de Actions.ACTIONS.
+    Tant qu'un état n'a pas été mis à jour, policy[s] reste l'action de la politique initiale.
+    """
+
+    def __init__(self, simulator, q_function, policy):
+        """
+        :param simulator: le simulateur
+        :param q_function: la fonction de Qvaleur, modifiée en place par update
+        :param policy: la politique initiale, un dict état encodé -> action
+        """
+        self.q_function = q_function
+        self.legal = {s: simulator.get_legal_actions(s) for s in policy}
+        # indice de l'action gloutonne, ou son complément (négatif) pour l'action de la politique initiale
+        self.best = {s: ~Actions.ACTION_INDEX[a] for s, a in policy.items()}
+
+    def __getitem__(self, s):
+        """
+        :param s: un état encodé
+        :return: l'action de la politique en s
+        """
+        return Actions.ACTIONS[self.action_index(s)]
+
+    def action_index(self, s):
+        """
+        :param s: un état encodé
+        :return: l'indice de l'action de la politique en s
+        """
+        best = self.best[s]
+        return best if best >= 0 else ~best
+
+    def argmax(self, s):
+        """
+        :param s: un état encodé
+        :return: l'indice de la première action possible de Qvaleur maximale
+        """
+        return max(self.legal[s], key=self.q_function[s].__getitem__)
+
+    def greedy(self, s):
+        """
+        :param s: un état encodé
+        :return: l'indice de l'action de Qvaleur maximale en s, même si s n'a pas encore été mis à jour
+        """
+        best = self.best[s]
+        if best < 0:
+            best = self.best[s] = self.argmax(s)
+        return best
+
+    def value(self, s):
+        """
+        :param s: un état encodé
+        :return: max_a Q(s, a) sur les actions possibles
+        """
+        q_values = self.q_function[s]
+        return q_values[self.argmax(s)] if self.best[s] < 0 else q_values[self.best[s]]
+
+    def update(self, s, a, q_value):
+        """
+        Modifie une Qvaleur et met à jour l'action gloutonne de l'état
+        :param s: un état encodé
+        :param a: l'indice de l'action
+        :param q_value: la nouvelle Qvaleur de (s, a)
+        """
+        q_values = self.q_function[s]
+        old, q_values[a] = q_values[a], q_value
+        best = self.best[s]
+        if best < 0 or (a == best and q_value < old):
+            self.best[s] = self.argmax(s)
+        elif q_value > q_values[best] or (q_value == q_values[best] and a < best):
+            self.best[s] = a
+
+    def extract(self):
+        """
+        :return: la politique, un dict état encodé -> action
+        """
+        actions = Actions.ACTIONS
+        return {s: actions[best if best >= 0 else ~best] for s, best in self.best.items()}
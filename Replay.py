@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# exposant des priorités (|erreur TD| ** PRIORITY_EXPONENT): en dessous de 1, le tirage reste proche de l'uniforme et
+# les transitions dont la priorité est périmée (petite erreur à leur dernier passage) continuent d'être rejouées
+PRIORITY_EXPONENT = 0.6
+
+
+class ReplayBuffer:
+    """
+    Transitions (s, a, r, s') observées, les états étant des positions de Model, dans des tableaux préalloués
+    utilisés comme tampon circulaire (les plus anciennes sont écrasées au-delà de capacity). Les transitions sont
+    tirées par lots, uniformément ou proportionnellement à leur priorité (fonction de la dernière erreur TD connue, une
+    nouvelle transition recevant la plus grande priorité vue pour être rejouée au moins une fois).
+    """
+
+    def __init__(self, capacity, prioritized=False):
+        """
+        :param capacity: le nombre de transitions gardées
+        :param prioritized: si vrai, le tirage est proportionnel aux priorités
+        """
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity)
+        self.successors = np.zeros(capacity, dtype=np.int64)
+        self.prioritized = prioritized
+        self.priorities = np.zeros(capacity) if prioritized else None
+        self.max_priority = 1.
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.states))
+
+    def add(self, s, a, reward, future_state):
+        """
+        Ajoute une transition
+        :param s: la position de l'état
+        :param a: l'indice de l'action
+        :param reward: la récompense
+        :param future_state: la position de l'état suivant
+        """
+        i = self.count % len(self.states)
+        self.states[i], self.actions[i], self.rewards[i], self.successors[i] = s, a, reward, future_state
+        if self.prioritized:
+            self.priorities[i] = self.max_priority
+        self.count += 1
+
+    def sample(self, n, rng):
+        """
+        :param n: le nombre de transitions tirées (avec remise)
+        :param rng: le générateur numpy
+        :return: les indices des transitions dans le tampon
+        """
+        size = len(self)
+        if not self.prioritized:
+            return rng.integers(size, size=n)
+        cumulative = np.cumsum(self.priorities[:size])
+        return np.minimum(np.searchsorted(cumulative, rng.random(n) * cumulative[-1], side="right"), size - 1)
+
+    def update_priorities(self, indices, errors):
+        """
+        :param indices: des indices de transitions (voir sample)
+        :param errors: leurs nouvelles erreurs TD
+        """
+        if self.prioritized:
+            # un petit plancher pour qu'aucune transition ne disparaisse du tirage
+            priorities = (np.abs(errors) + 1e-6) ** PRIORITY_EXPONENT
+            self.priorities[indices] = priorities
+            self.max_priority = max(self.max_priority, priorities.max())
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import random
-import copy
+import numpy as np
 import Actions
+import Model
+from Codec import StateCodec
+from Transitions import TransitionTable
 from Debug import Debug
 from State import print_state
 
@@ -30,6 +33,19 @@ class Simulator:
         self.goal_reward = goal_reward
         self.dead_reward = dead_reward
         self.charging_reward = charging_reward
+        self.codec = StateCodec(grid_size, max_battery_level)
+        self.transition_cache = None
+        # masques des actions possibles (voir Actions.MASK_INDICES) des états encodés déjà rencontrés
+        self.legal_masks = dict()
+
+    def enable_transition_cache(self, full=False):
+        """
+        Active le cache des transitions utilisé par les méthodes *_encoded
+        :param full: si vrai, calcule tout de suite les transitions de tous les états, sinon à la première utilisation
+        """
+        self.transition_cache = TransitionTable(self)
+        if full:
+            self.transition_cache.build()
 
     def roll_dice(self, probabilities):
         """
@@ -40,21 +56,29 @@ class Simulator:
         dice = random.random()
         return dice < probabilities
 
+    def as_state(self, state):
+        """
+        :param state: un état, GridState ou dict
+        :return: l'état sous forme de GridState
+        """
+        return state if isinstance(state, Actions.GridState) else Actions.GridState.from_dict(state, self.grid_size)
+
     def get_actions(self, state, DEBUG=False):
         """
         retourne la liste d'actions possibles étant donné l'état state
-        :param state: l'état courant
+        :param state: l'état courant (GridState ou dict)
         :return actions: la liste d'actions possibles 
         """
+        battery_level, robot, base, dirty = self.as_state(state)
         actions = []
-        if state["robot_pos"] in state["dirty_cells"] and state["battery_level"] > 0:
+        if dirty >> robot & 1 and battery_level > 0:
             actions.append("clean")
 
-        if state["robot_pos"] == state["base_pos"] and state["battery_level"] < self.max_battery_level:
+        if robot == base and battery_level < self.max_battery_level:
             actions.append("load")
 
-        if state["battery_level"] > 0:
-            x, y = state['robot_pos']
+        if battery_level > 0:
+            x, y = robot % self.grid_size[0], robot // self.grid_size[0]
             if self.grid_size[0] != 1:
                 if x != 0:
                     actions.append("move_left")
@@ -66,10 +90,10 @@ class Simulator:
                 if y != self.grid_size[0] - 1:
                     actions.append("move_down")
 
-        if not state["dirty_cells"] and state["robot_pos"] == state["base_pos"] and state["battery_level"] == self.max_battery_level:
+        if not dirty and robot == base and battery_level == self.max_battery_level:
             actions.append("stay")
 
-        if state["battery_level"] == 0 and state["robot_pos"] != state["base_pos"]:
+        if battery_level == 0 and robot != base:
             actions.append("dead")
 
         DEBUG and Debug(state=state, actions=actions)
@@ -80,7 +104,7 @@ class Simulator:
         """
         Etant donné une action retourne l'état suivant
         :param action: 
-        :param state: 
+        :param state: un GridState
         :return: 
         """
         if action == "move_up":
@@ -125,20 +149,20 @@ class Simulator:
         """
         Etant donné une action et un état, retourne l'état suivant et une récompense
         :param action: un string représentant une action 
-        :param state: un état du système
-        :return state, reward: l'état suivant et une récompense 
+        :param state: un état du système (GridState ou dict)
+        :return state, reward: l'état suivant (GridState) et une récompense 
         """
         # état dead,  pour tt action --> -100
         # état final pour toute action --> 100
         # tout les autres --> -0.5
-
-        if state["battery_level"] == 0:
+        state = self.as_state(state)
+        if state.battery_level == 0:
             # print("##### dead reward ! #####")
             return self.dead_reward,\
                    state
 
         proba = self.get_proba(action)
-        if not state["dirty_cells"] and state["robot_pos"] == state["base_pos"]:
+        if not state.dirty and state.robot == state.base:
             # print("##### goal reward ! #####")
             return self.goal_reward,\
                    self.do_action(action, state) if self.roll_dice(proba) else Actions.unload(state)
@@ -151,23 +175,46 @@ class Simulator:
             return self.moving_reward,\
                    self.do_action(action, state) if self.roll_dice(proba) else Actions.unload(state)
 
+    def get_distribution(self, action, state):
+        """
+        Etant donné une action et un état, retourne la récompense de get et les deux issues entre lesquelles get tire
+        au sort (mêmes branches que get)
+        :param action: un string représentant une action
+        :param state: un état du système (GridState ou dict)
+        :return reward, proba, success, failure: une récompense, la probabilité de succès, l'état suivant en cas de
+        succès et en cas d'échec (GridState)
+        """
+        state = self.as_state(state)
+        if state.battery_level == 0:
+            return self.dead_reward, 1, state, state
+
+        proba = self.get_proba(action)
+        if not state.dirty and state.robot == state.base:
+            return self.goal_reward, proba, self.do_action(action, state), Actions.unload(state)
+
+        if action == "load" or action == "stay":
+            return self.charging_reward, proba, self.do_action(action, state), state
+        else:
+            return self.moving_reward, proba, self.do_action(action, state), Actions.unload(state)
+
     def get_with_model(self, action, state):
         """
         Etant donné une action et un état, retourne l'état suivant une récompense
         :param action: un string représentant une action 
-        :param state: un état du système
-        :return reward, [(proba state 1, state1), (proba state2, state 2)]: une récompense et la distribution d'état suivant
+        :param state: un état du système (GridState ou dict)
+        :return reward, [(proba state 1, state1), (proba state2, state 2)]: une récompense et la distribution d'état
+        suivant (GridState)
         """
         # état dead,  pour tt action --> -100 dead_reward
         # état final pour toute action --> goal_reward
         # tout les autres --> moving_reward
-
-        if state["battery_level"] == 0 and state["robot_pos"] != state["base_pos"]:
+        state = self.as_state(state)
+        if state.battery_level == 0 and state.robot != state.base:
             return self.dead_reward,\
                    [(1, state)]
 
         proba = self.get_proba(action)
-        if not state["dirty_cells"] and state["robot_pos"] == state["base_pos"] and state["battery_level"] == self.max_battery_level:
+        if not state.dirty and state.robot == state.base and state.battery_level == self.max_battery_level:
             if proba == 1:
                 return self.goal_reward,\
                        [(1, self.do_action(action, state))]
@@ -185,3 +232,104 @@ class Simulator:
             else:
                 return self.moving_reward, \
                        [(proba, self.do_action(action, state)), (1 - proba, Actions.unload(state))]
+
+    def state(self, index):
+        """
+        :param index: l'index d'un état
+        :return: l'état sous forme de GridState, sans passer par le dict de codec.decode
+        """
+        return Actions.GridState(*self.codec.split(index))
+
+    def get_legal_mask(self, index):
+        """
+        :param index: l'index de l'état courant
+        :return: le masque des actions possibles (voir Actions.MASK_INDICES), calculé une fois par état
+        """
+        mask = self.legal_masks.get(index)
+        if mask is None:
+            mask = self.legal_masks[index] = Actions.action_mask(self.get_actions(self.state(index)))
+        return mask
+
+    def precompute_legal_masks(self, indices):
+        """
+        Calcule d'un coup (vectorisé) les masques des actions possibles d'états encodés
+        :param indices: les index des états
+        """
+        indices = Model.index_array(indices)
+        masks = Model.legal_masks_batch(self, *self.codec.split(indices))
+        self.legal_masks.update(zip(indices.tolist(), masks.tolist()))
+
+    def get_legal_actions(self, index):
+        """
+        :param index: l'index de l'état courant
+        :return: les indices (dans Actions.ACTIONS) des actions possibles
+        """
+        return Actions.MASK_INDICES[self.get_legal_mask(index)]
+
+    def get_actions_encoded(self, index):
+        """
+        Equivalent de get_actions pour un état encodé
+        :param index: l'index de l'état courant
+        :return actions: la liste d'actions possibles
+        """
+        return Actions.MASK_ACTIONS[self.get_legal_mask(index)]
+
+    def get_encoded(self, action, index):
+        """
+        Equivalent de get pour un état encodé
+        :param action: un string représentant une action
+        :param index: l'index de l'état courant
+        :return reward, index: une récompense et l'index de l'état suivant
+        """
+        if self.transition_cache is not None:
+            return self.transition_cache.get(action, index)
+        reward, state = self.get(action, self.state(index))
+        return reward, self.codec.join(*state)
+
+    def step_batch(self, states, actions, rng):
+        """
+        Equivalent vectorisé de get_encoded: un pas pour chaque couple (état, action), avec un tirage par couple.
+        Les résultats n'ont de sens que là où l'action est possible.
+        :param states: un tableau d'index d'états
+        :param actions: un tableau d'indices d'actions (dans Actions.ACTIONS), de même taille
+        :param rng: le générateur des tirages (numpy.random.Generator)
+        :return rewards, next_states: les récompenses et les index des états suivants
+        """
+        states = np.asarray(states, dtype=np.int64)
+        actions = np.asarray(actions, dtype=np.int64)
+        dice = rng.random(len(states))
+        components = self.codec.split(states)
+        rewards = np.empty(len(states))
+        next_states = np.empty_like(states)
+        for a in np.unique(actions).tolist():
+            selected = np.flatnonzero(actions == a)
+            reward, proba, success, failure = Model.get_distribution_batch(
+                self, Actions.ACTIONS[a], states[selected], *[component[selected] for component in components])
+            rewards[selected] = reward
+            next_states[selected] = np.where(dice[selected] < proba, success, failure)
+        return rewards, next_states
+
+    def get_distribution_encoded(self, action, index):
+        """
+        Equivalent de get_distribution pour un état encodé
+        :param action: un string représentant une action
+        :param index: l'index de l'état courant
+        :return reward, proba, success, failure: une récompense, la probabilité de succès et les index des états
+        suivants en cas de succès et d'échec
+        """
+        if self.transition_cache is not None:
+            return self.transition_cache.get_distribution(action, index)
+        reward, proba, success, failure = self.get_distribution(action, self.state(index))
+        return reward, proba, self.codec.join(*success), self.codec.join(*failure)
+
+    def get_with_model_encoded(self, action, index):
+        """
+        Equivalent de get_with_model pour un état encodé
+        :param action: un string représentant une action
+        :param index: l'index de l'état courant
+        :return reward, [(proba 1, index 1), (proba 2, index 2)]: une récompense et la distribution des index suivants
+        """
+        if self.transition_cache is not None:
+            return self.transition_cache.get_with_model(action, index)
+        reward, future = self.get_with_model(action, self.state(index))
+        return reward, [(proba, self.codec.join(*state)) for proba, state in future]
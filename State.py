@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import tkinter
-from tkinter.ttk import Progressbar, Style
 import Actions
 import os
 
+# tkinter n'est importé qu'à la création d'un Display (voir load_tkinter), les exécutions sans affichage s'en passent
+tkinter = Progressbar = Style = None
+
+
+def load_tkinter():
+    """
+    Importe tkinter et ttk dans les globales du module
+    """
+    global tkinter, Progressbar, Style
+    import tkinter
+    from tkinter.ttk import Progressbar, Style
+
 
 def print_state(grid_size, state):
     """
@@ -30,6 +40,7 @@ class Display:
     Class affichant l'état du système à l'aide de tkinter 
     """
     def __init__(self, simulator, p, grid_size, maximum_battery, state, title):
+        load_tkinter()
         self.simulator = simulator
         self.policy = p
         self.grid_size = grid_size
@@ -96,7 +107,7 @@ class Display:
         Méthode mettant à jour régulièrement l'UI
         """
         try:
-            action = self.policy[str(self.state)]
+            action = self.policy[self.simulator.codec.encode(self.state)]
             print("action:", action)
 
             new_state = self.do_action(action)
@@ -112,9 +123,9 @@ class Display:
                 else:
                     col, row = diff
                     self.grid[row][col].configure(image=self.get_img(row, col))
-        except KeyError as e:
+        except (KeyError, ValueError) as e:
             print("La configuration est invalide, l'état est inconnu")
-            print("KeyError", e)
+            print(type(e).__name__, e)
 
         self.root.after(1000, self.update)
 
@@ -124,26 +135,28 @@ class Display:
         :param action: une action donnée par le politique
         :return : le nouvelle état après l'action
         """
+        state = Actions.GridState.from_dict(self.state, self.grid_size)
         if action == "move_up":
-            return Actions.move_up(self.state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
-                   else Actions.unload(self.state)
+            new_state = Actions.move_up(state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
+                   else Actions.unload(state)
         elif action == "move_down":
-            return Actions.move_down(self.state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
-                   else Actions.unload(self.state)
+            new_state = Actions.move_down(state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
+                   else Actions.unload(state)
         elif action == "move_right":
-            return Actions.move_right(self.state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
-                   else Actions.unload(self.state)
+            new_state = Actions.move_right(state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
+                   else Actions.unload(state)
         elif action == "move_left":
-            return Actions.move_left(self.state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
-                   else Actions.unload(self.state)
+            new_state = Actions.move_left(state, self.grid_size) if self.simulator.roll_dice(self.simulator.moving_proba)\
+                   else Actions.unload(state)
         elif action == "load":
-            return Actions.load(self.state) if self.simulator.roll_dice(self.simulator.charging_proba)\
-                   else self.state
+            new_state = Actions.load(state) if self.simulator.roll_dice(self.simulator.charging_proba)\
+                   else state
         elif action == "clean":
-            return Actions.clean(self.state) if self.simulator.roll_dice(self.simulator.cleaning_proba)\
-                   else Actions.unload(self.state)
+            new_state = Actions.clean(state) if self.simulator.roll_dice(self.simulator.cleaning_proba)\
+                   else Actions.unload(state)
         elif action == "dead" or action == "stay":
             return self.state
+        return new_state.to_dict(self.grid_size)
 
     def clear_grid(self):
         """
@@ -205,11 +218,14 @@ class Display:
 
     def restart(self):
         print("restart")
-        self.init_state["robot_pos"] = [int(i) for i in self.robot_pos_entry.get() if i not in ["[", "]", " ", ","]]
-        self.init_state["base_pos"] = [int(i) for i in self.base_pos_entry.get() if i not in ["[", "]", " ", ","]]
-        self.init_state["battery_level"] = int(self.battery_level_entry.get())
         temp_list = self.dirty_cell_entry.get().replace("[", "").replace("]", "").split(', ')
-        self.init_state["dirty_cells"] = sorted([[int(temp_list[i]), int(temp_list[i+1])] for i in range(0, len(temp_list) - 1, 2)])
+        # nouveau dict: self.state a pu être partagé avec init_state, on ne le modifie jamais en place
+        self.init_state = {
+            "robot_pos": [int(i) for i in self.robot_pos_entry.get() if i not in ["[", "]", " ", ","]],
+            "base_pos": [int(i) for i in self.base_pos_entry.get() if i not in ["[", "]", " ", ","]],
+            "battery_level": int(self.battery_level_entry.get()),
+            "dirty_cells": sorted([[int(temp_list[i]), int(temp_list[i+1])] for i in range(0, len(temp_list) - 1, 2)])
+        }
 
         for elem in [self.battery_level_entry, self.base_pos_entry, self.robot_pos_entry, self.dirty_cell_entry]:
             elem.delete(0, "end")
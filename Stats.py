@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentation légère des algorithmes: compteurs, chronomètres et dernières valeurs nommés, exportés en instantanés
+json (une ligne par instantané), et profilage optionnel (cProfile ou échantillonnage).
+
+Tant que enable n'a pas été appelé, count, timer et snapshot ne font rien. Les boucles chaudes comptent dans des
+variables locales et appellent count aux points de contrôle (chaque seconde, chaque balayage), pas à chaque pas.
+"""
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import signal
+import sys
+import time
+
+enabled = False
+counters = collections.defaultdict(int)
+timers = collections.defaultdict(float)
+values = dict()
+log_file = None
+interval = 1.
+last_snapshot = 0.
+start_time = time.time()
+NULL_TIMER = contextlib.nullcontext()
+
+
+def enable(path=None, snapshot_interval=1.):
+    """
+    Active l'instrumentation et remet les compteurs à zéro
+    :param path: le fichier (json lines) où écrire les instantanés, None pour ne pas les exporter
+    :param snapshot_interval: le temps minimal en seconde entre deux instantanés
+    """
+    global enabled, log_file, interval, last_snapshot, start_time
+    enabled = True
+    counters.clear()
+    timers.clear()
+    values.clear()
+    log_file = open(path, "a") if path else None
+    interval = snapshot_interval
+    start_time = last_snapshot = time.time()
+
+
+def disable():
+    """
+    Ecrit un dernier instantané et désactive l'instrumentation
+    """
+    global enabled, log_file
+    if enabled:
+        snapshot(force=True)
+    if log_file is not None:
+        log_file.close()
+    enabled, log_file = False, None
+
+
+def count(name, n=1):
+    """
+    :param name: le nom du compteur
+    :param n: la valeur à ajouter
+    """
+    if enabled:
+        counters[name] += n
+
+
+def add_time(name, seconds):
+    """
+    Ajoute une durée mesurée par l'appelant au chronomètre name et compte une exécution (name_calls)
+    :param name: le nom du chronomètre
+    :param seconds: la durée
+    """
+    if enabled:
+        timers[name] += seconds
+        counters[name + "_calls"] += 1
+
+
+@contextlib.contextmanager
+def measure(name):
+    """
+    Chronomètre le bloc (voir timer)
+    :param name: le nom du chronomètre
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+
+def timer(name):
+    """
+    S'utilise avec with: ajoute la durée du bloc au chronomètre name et compte ses exécutions (name_calls)
+    :param name: le nom du chronomètre
+    """
+    return measure(name) if enabled else NULL_TIMER
+
+
+def report(label, **kwargs):
+    """
+    Affiche des valeurs courantes d'un algorithme (remplace les Debug des boucles), les retient pour les instantanés
+    et en écrit un si le délai est écoulé
+    :param label: le nom de l'algorithme ou de l'étape
+    :param kwargs: les valeurs
+    """
+    print(label + ":", ", ".join("{}={}".format(key, value) for key, value in kwargs.items()))
+    if enabled:
+        values.update(kwargs)
+        snapshot()
+
+
+def snapshot(force=False):
+    """
+    Ecrit une ligne json avec tous les compteurs, chronomètres et valeurs, au plus une fois par intervalle
+    :param force: écrire même si l'intervalle n'est pas écoulé
+    :return: l'instantané (un dict), None s'il n'a pas été pris
+    """
+    global last_snapshot
+    now = time.time()
+    if not enabled or (not force and now - last_snapshot < interval):
+        return None
+    last_snapshot = now
+    state = {"time": now - start_time, "counters": dict(counters), "timers": dict(timers), "values": dict(values)}
+    if log_file is not None:
+        log_file.write(json.dumps(state, default=float) + "\n")
+        log_file.flush()
+    return state
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage: un signal SIGPROF toutes les period secondes de temps CPU relève la pile du
+    processus. Bien moins intrusif que cProfile dans les boucles serrées, mais ne marche que sous unix.
+    """
+
+    def __init__(self, period=0.001):
+        """
+        :param period: la période d'échantillonnage en seconde de temps CPU
+        """
+        self.period = period
+        self.own = collections.Counter()
+        self.cumulative = collections.Counter()
+        self.samples = 0
+
+    def sample(self, signum, frame):
+        """
+        Gestionnaire de SIGPROF: compte la fonction courante (temps propre) et toutes celles de la pile (cumulé)
+        """
+        self.samples += 1
+        seen = set()
+        self.own[self.location(frame)] += 1
+        while frame is not None:
+            location = self.location(frame)
+            if location not in seen:
+                seen.add(location)
+                self.cumulative[location] += 1
+            frame = frame.f_back
+
+    @staticmethod
+    def location(frame):
+        """
+        :return: "fichier:ligne(fonction)" de la fonction d'un cadre de pile
+        """
+        code = frame.f_code
+        return "{}:{}({})".format(code.co_filename.split("/")[-1], code.co_firstlineno, code.co_name)
+
+    def start(self):
+        """
+        Lance l'échantillonnage
+        """
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.period, self.period)
+
+    def stop(self):
+        """
+        Arrête l'échantillonnage
+        """
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def print_stats(self, limit=20, stream=sys.stdout):
+        """
+        Affiche les fonctions les plus échantillonnées, en temps propre puis cumulé
+        :param limit: le nombre de fonctions
+        :param stream: où écrire
+        """
+        print("{} échantillons".format(self.samples), file=stream)
+        for title, counter in (("propre", self.own), ("cumulé", self.cumulative)):
+            print("{:>8} {:>7}  fonction".format(title, "%"), file=stream)
+            for location, n in counter.most_common(limit):
+                print("{:8} {:6.1f}%  {}".format(n, 100. * n / max(self.samples, 1), location), file=stream)
+
+
+@contextlib.contextmanager
+def profiled(kind, path=None, limit=20):
+    """
+    Profile le bloc
+    :param kind: None (pas de profilage), "cprofile" ou "sampling"
+    :param path: le fichier où écrire le rapport (cProfile: statistiques pstats binaires), sinon affiché
+    :param limit: le nombre de fonctions du rapport
+    """
+    if kind is None:
+        yield
+        return
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif kind == "sampling":
+        profiler = SamplingProfiler()
+        profiler.start()
+    else:
+        raise ValueError("profilage inconnu: " + str(kind))
+    try:
+        yield
+    finally:
+        if kind == "cprofile":
+            profiler.disable()
+            if path:
+                profiler.dump_stats(path)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+            print(stream.getvalue())
+        else:
+            profiler.stop()
+            if path:
+                with open(path, "w") as f:
+                    profiler.print_stats(limit, f)
+            profiler.print_stats(limit)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import numpy as np
+import Actions
+from Model import Model
+
+# à incrémenter si l'encodage des états ou le format des fichiers change
+FORMAT_VERSION = 2
+
+
+def simulator_parameters(simulator):
+    """
+    Retourne les paramètres qui déterminent entièrement la dynamique d'un simulateur
+    :param simulator: le simulateur
+    :return: un dict sérialisable en json
+    """
+    return {
+        "grid_size": list(simulator.grid_size),
+        "max_battery_level": simulator.max_battery_level,
+        "moving_proba": simulator.moving_proba,
+        "cleaning_proba": simulator.cleaning_proba,
+        "charging_proba": simulator.charging_proba,
+        "moving_reward": simulator.moving_reward,
+        "goal_reward": simulator.goal_reward,
+        "dead_reward": simulator.dead_reward,
+        "charging_reward": simulator.charging_reward,
+        "format_version": FORMAT_VERSION,
+    }
+
+
+def parameters_hash(parameters):
+    """
+    :param parameters: un dict sérialisable en json
+    :return: une empreinte courte et stable des paramètres
+    """
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class StoredPolicy:
+    """
+    Politique lue depuis le disque (index d'états triés et indices d'actions, projetés en mémoire), s'utilise comme le
+    dict retourné par les algorithmes: policy[index] donne le nom de l'action, KeyError pour un état inconnu
+    """
+
+    def __init__(self, states, actions):
+        self.states = states
+        self.actions = actions
+
+    def __getitem__(self, index):
+        position = np.searchsorted(self.states, index)
+        if position == len(self.states) or self.states[position] != index:
+            raise KeyError(index)
+        return Actions.ACTIONS[self.actions[position]]
+
+    def __len__(self):
+        return len(self.states)
+
+
+class Storage:
+    """
+    Cache sur disque des tables compilées (Model) et des résultats des algorithmes.
+    Chaque configuration du simulateur a son répertoire, nommé par l'empreinte de ses paramètres, contenant un
+    sous-répertoire de fichiers .npy par entrée. Les tableaux sont relus en mmap, sans copie.
+    """
+
+    def __init__(self, simulator, root):
+        """
+        :param simulator: le simulateur
+        :param root: le répertoire racine du cache
+        """
+        self.simulator = simulator
+        parameters = simulator_parameters(simulator)
+        self.path = os.path.join(root, parameters_hash(parameters))
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "parameters.json"), "w") as f:
+            json.dump(parameters, f, sort_keys=True, indent=1)
+
+    def entry_path(self, name, hyperparameters=None):
+        """
+        :param name: le nom de l'entrée
+        :param hyperparameters: un dict de paramètres supplémentaires qui distinguent les entrées de même nom
+        :return: le répertoire de l'entrée
+        """
+        if hyperparameters:
+            name += "-" + parameters_hash(hyperparameters)
+        return os.path.join(self.path, name)
+
+    def checkpoint_path(self, method, hyperparameters):
+        """
+        :param method: le nom de l'algorithme
+        :param hyperparameters: les paramètres de l'algorithme
+        :return: le fichier des points de reprise de l'algorithme (voir Checkpoint)
+        """
+        path = self.entry_path(method, hyperparameters)
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, "checkpoint.npz")
+
+    def save_arrays(self, name, hyperparameters=None, **arrays):
+        """
+        Enregistre des tableaux numpy dans une entrée. Les fichiers sont écrits sous un nom temporaire puis renommés,
+        une entrée interrompue n'est donc jamais relue à moitié.
+        :param name: le nom de l'entrée
+        :param hyperparameters: voir entry_path
+        :param arrays: les tableaux à enregistrer
+        """
+        path = self.entry_path(name, hyperparameters)
+        os.makedirs(path, exist_ok=True)
+        for key, array in arrays.items():
+            tmp = os.path.join(path, key + ".tmp.npy")
+            np.save(tmp, np.asarray(array))
+            os.replace(tmp, os.path.join(path, key + ".npy"))
+
+    def load_arrays(self, name, keys, hyperparameters=None):
+        """
+        Relit les tableaux d'une entrée en mmap
+        :param name: le nom de l'entrée
+        :param keys: les noms des tableaux attendus
+        :param hyperparameters: voir entry_path
+        :return: un dict des tableaux, None si l'un d'eux manque
+        """
+        path = self.entry_path(name, hyperparameters)
+        files = [os.path.join(path, key + ".npy") for key in keys]
+        if not all(os.path.exists(f) for f in files):
+            return None
+        return {key: np.load(f, mmap_mode="r") for key, f in zip(keys, files)}
+
+    def save_model(self, model, hyperparameters=None):
+        """
+        :param model: le modèle compilé (Model)
+        :param hyperparameters: ce qui détermine l'ensemble d'états compilé (voir entry_path)
+        """
+        self.save_arrays("model", hyperparameters, states=model.states, legal=model.legal, rewards=model.rewards,
+                         successors=model.successors, probas=model.probas)
+
+    def load_model(self, hyperparameters=None):
+        """
+        :param hyperparameters: ce qui détermine l'ensemble d'états compilé (voir entry_path)
+        :return: le modèle compilé, None s'il n'est pas en cache
+        """
+        arrays = self.load_arrays("model", ["states", "legal", "rewards", "successors", "probas"], hyperparameters)
+        return None if arrays is None else Model.from_arrays(**arrays)
+
+    def save_policy(self, method, hyperparameters, policy, tables=None):
+        """
+        Enregistre le résultat d'un algorithme
+        :param method: le nom de l'algorithme
+        :param hyperparameters: les paramètres de l'algorithme (gamma, epsilon, ...)
+        :param policy: la politique, un dict indexé par état encodé
+        :param tables: les tables apprises (value_function, q_function, ...) à enregistrer avec la politique, soit des
+        dict indexés par état encodé, soit des tableaux alignés sur les états triés de la politique
+        """
+        states = np.array(sorted(policy), dtype=np.int64)
+        actions = np.array([Actions.ACTION_INDEX[policy[s]] for s in states.tolist()], dtype=np.int8)
+        arrays = dict()
+        for key, table in (tables or dict()).items():
+            arrays[key] = [table[s] for s in states.tolist()] if isinstance(table, dict) else table
+        self.save_arrays(method, hyperparameters, states=states, policy=actions, **arrays)
+
+    def load_policy(self, method, hyperparameters):
+        """
+        :param method: le nom de l'algorithme
+        :param hyperparameters: les paramètres de l'algorithme
+        :return: la politique (StoredPolicy), None si elle n'est pas en cache
+        """
+        arrays = self.load_arrays(method, ["states", "policy"], hyperparameters)
+        return None if arrays is None else StoredPolicy(arrays["states"], arrays["policy"])
+
+    def load_tables(self, method, hyperparameters, keys):
+        """
+        :param method: le nom de l'algorithme
+        :param hyperparameters: les paramètres de l'algorithme
+        :param keys: les noms des tables
+        :return: un dict des tables en mmap, alignées sur le tableau "states", None si l'une d'elles manque
+        """
+        return self.load_arrays(method, keys, hyperparameters)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import Actions
+import Model
+
+# échanges d'actions de chaque transformation élémentaire de la grille
+FLIP_X_ACTIONS = {"move_left": "move_right", "move_right": "move_left"}
+FLIP_Y_ACTIONS = {"move_up": "move_down", "move_down": "move_up"}
+TRANSPOSE_ACTIONS = {"move_left": "move_up", "move_up": "move_left", "move_right": "move_down",
+                     "move_down": "move_right"}
+
+
+class Symmetry:
+    """
+    Symétries de la grille qui laissent la dynamique du simulateur invariante, appliquées ensemble au robot, à la base
+    et aux cases sales, avec l'échange d'actions correspondant (move_left <-> move_right, ...).
+    La réflexion gauche-droite l'est toujours. Les autres (réflexion haut-bas, rotations) ne le sont que sur une grille
+    carrée, car get_actions borne move_down par grid_size[0]: 8 transformations sur une grille carrée, 2 sinon.
+    Le représentant canonique d'un état est le plus petit index de son orbite.
+    """
+
+    def __init__(self, simulator):
+        """
+        :param simulator: le simulateur
+        """
+        self.codec = simulator.codec
+        width, height = simulator.grid_size
+        square = width == height
+        # chaque transformation: la case image de chaque case et l'indice image de chaque action
+        self.cells, self.actions = [], []
+        for transpose in [False, True] if square else [False]:
+            for flip_y in [False, True] if square else [False]:
+                for flip_x in [False, True] if width > 1 else [False]:
+                    cells = []
+                    for cell in range(width * height):
+                        x, y = cell % width, cell // width
+                        x, y = width - 1 - x if flip_x else x, height - 1 - y if flip_y else y
+                        cells.append(y + x * width if transpose else x + y * width)
+                    actions = list(Actions.ACTIONS)
+                    for used, swap in [(flip_x, FLIP_X_ACTIONS), (flip_y, FLIP_Y_ACTIONS),
+                                       (transpose, TRANSPOSE_ACTIONS)]:
+                        if used:
+                            actions = [swap.get(action, action) for action in actions]
+                    self.cells.append(np.array(cells, dtype=np.int64))
+                    self.actions.append(np.array([Actions.ACTION_INDEX[action] for action in actions]))
+        # inverse[g][b] est l'action d'origine dont l'image par g est b
+        self.inverse = [np.argsort(actions) for actions in self.actions]
+
+    def __len__(self):
+        return len(self.cells)
+
+    def apply(self, g, indices):
+        """
+        :param g: le numéro d'une transformation
+        :param indices: des index (StateCodec)
+        :return: les index des images des états
+        """
+        battery_level, robot, base, mask = self.codec.split(np.asarray(indices, dtype=np.int64))
+        cells = self.cells[g]
+        image = np.zeros_like(mask)
+        for cell in range(self.codec.n_cells):
+            image |= (mask >> cell & 1) << cells[cell]
+        return self.codec.pack(battery_level, cells[robot], cells[base], image)
+
+    def canonical(self, indices):
+        """
+        :param indices: des index (StateCodec), ou un seul
+        :return canonical, transforms: les représentants canoniques et pour chaque état la transformation qui y mène
+        """
+        images = np.stack([self.apply(g, indices) for g in range(len(self))])
+        transforms = images.argmin(axis=0)
+        canonical = np.take_along_axis(images, transforms[None], axis=0)[0]
+        return canonical[()], transforms[()]
+
+    def canonical_states(self, indices):
+        """
+        :param indices: des index (StateCodec)
+        :return: les représentants canoniques distincts, triés
+        """
+        return np.unique(self.canonical(Model.index_array(indices))[0])
+
+
+class ReducedModel(Model.Model):
+    """
+    Modèle compilé (Model) du MDP quotient par les symétries: il ne contient que les représentants canoniques et les
+    états suivants y sont remplacés par le leur, les actions étant celles du représentant. Les algorithmes qui prennent
+    un modèle le résolvent comme un autre, puis expand retrouve la politique et les tables de tous les états.
+    """
+
+    def __init__(self, simulator, indices, symmetry=None):
+        """
+        :param simulator: le simulateur
+        :param indices: les index (StateCodec) des états, canoniques ou non
+        :param symmetry: les symétries (Symmetry) du simulateur, calculées si None
+        """
+        self.symmetry = Symmetry(simulator) if symmetry is None else symmetry
+        super().__init__(simulator, self.symmetry.canonical_states(indices))
+
+    @classmethod
+    def from_model(cls, model, symmetry):
+        """
+        :param model: un modèle relu du cache disque, déjà réduit
+        :param symmetry: les symétries (Symmetry) du simulateur
+        :return: le modèle réduit, sur les mêmes tableaux
+        """
+        reduced = cls.from_arrays(model.states, model.legal, model.rewards, model.successors, model.probas)
+        reduced.symmetry = symmetry
+        return reduced
+
+    def position(self, indices):
+        """
+        Comme Model.position, mais un état non canonique est désigné par la position de son représentant
+        """
+        return super().position(self.symmetry.canonical(indices)[0])
+
+    def expand(self, indices, policy, tables=None):
+        """
+        Etend à des états quelconques la politique et les tables calculées sur les représentants canoniques
+        :param indices: les index (StateCodec) des états
+        :param policy: la politique des représentants, indexée par état encodé
+        :param tables: les tables (voir Learning), tableaux alignés sur les états du modèle ou dict indexés par état
+        encodé, remplacées en place par des dict indexés par les index de indices
+        :return: la politique des états de indices
+        """
+        indices = Model.index_array(indices)
+        canonical, transforms = self.symmetry.canonical(indices)
+        actions = np.array([Actions.ACTION_INDEX[policy[s]] for s in canonical.tolist()], dtype=np.int64)
+        inverse = np.stack(self.symmetry.inverse)
+        expanded = dict(zip(indices.tolist(), [Actions.ACTIONS[a] for a in inverse[transforms, actions].tolist()]))
+        positions = super().position(canonical)
+        for key, table in (tables or dict()).items():
+            values = np.array([table[s] for s in canonical.tolist()]) if isinstance(table, dict) else table[positions]
+            if values.ndim == 2:
+                # Q(s, b) = Q(représentant, image de b)
+                values = np.take_along_axis(values, np.stack(self.symmetry.actions)[transforms], axis=1)
+            tables[key] = dict(zip(indices.tolist(), values.tolist()))
+        return expanded
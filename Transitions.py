@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import Actions
+
+
+class TransitionTable:
+    """
+    Cache des transitions d'un simulateur sur les états encodés.
+    La dynamique ne dépend que des paramètres du simulateur, chaque couple (état, action) n'est donc calculé qu'une
+    fois, à la première demande ou pour tous les états avec build.
+    Les listes retournées sont partagées et ne doivent pas être modifiées.
+    """
+
+    def __init__(self, simulator):
+        """
+        :param simulator: le simulateur dont on met en cache les transitions
+        """
+        self.simulator = simulator
+        self.codec = simulator.codec
+        # dict plutôt que listes pleine taille: seuls les états rencontrés sont alloués
+        self.samples = dict()
+        self.models = dict()
+
+    def get(self, action, index):
+        """
+        Equivalent de Simulator.get pour un état encodé: une lecture de la table et un tirage
+        :param action: un string représentant une action
+        :param index: l'index de l'état courant
+        :return reward, index: une récompense et l'index de l'état suivant
+        """
+        reward, proba, success, failure = self.get_distribution(action, index)
+        return reward, success if self.simulator.roll_dice(proba) else failure
+
+    def get_distribution(self, action, index):
+        """
+        Equivalent de Simulator.get_distribution pour un état encodé
+        :param action: un string représentant une action
+        :param index: l'index de l'état courant
+        :return reward, proba, success, failure: voir Simulator.get_distribution, avec les états encodés
+        """
+        key = index * Actions.N_ACTIONS + Actions.ACTION_INDEX[action]
+        sample = self.samples.get(key)
+        if sample is None:
+            sample = self.samples[key] = self.compute_sample(action, index)
+        return sample
+
+    def get_with_model(self, action, index):
+        """
+        Equivalent de Simulator.get_with_model pour un état encodé
+        :param action: un string représentant une action
+        :param index: l'index de l'état courant
+        :return reward, [(proba 1, index 1), (proba 2, index 2)]: une récompense et la distribution des index suivants
+        """
+        key = index * Actions.N_ACTIONS + Actions.ACTION_INDEX[action]
+        model = self.models.get(key)
+        if model is None:
+            model = self.models[key] = self.compute_model(action, index)
+        return model
+
+    def compute_sample(self, action, index):
+        """
+        Calcule l'entrée de la table utilisée par get
+        :return reward, proba, success, failure: voir Simulator.get_distribution, avec les états encodés
+        """
+        reward, proba, success, failure = self.simulator.get_distribution(action, self.simulator.state(index))
+        return reward, proba, self.codec.join(*success), self.codec.join(*failure)
+
+    def compute_model(self, action, index):
+        """
+        Calcule l'entrée de la table utilisée par get_with_model
+        :return reward, future: voir Simulator.get_with_model, avec les états encodés
+        """
+        reward, future = self.simulator.get_with_model(action, self.simulator.state(index))
+        return reward, tuple((proba, self.codec.join(*state)) for proba, state in future)
+
+    def build(self, indices=None):
+        """
+        Remplit la table pour toutes les actions possibles des états donnés
+        :param indices: les index des états, tous les états par défaut
+        """
+        indices = range(self.codec.n_states) if indices is None else indices
+        self.simulator.precompute_legal_masks(indices)
+        for index in indices:
+            for action in self.simulator.get_actions_encoded(index):
+                key = index * Actions.N_ACTIONS + Actions.ACTION_INDEX[action]
+                self.samples[key] = self.compute_sample(action, index)
+                self.models[key] = self.compute_model(action, index)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks du simulateur et des algorithmes sur une grille de configurations (GRID_SIZE x MAX_BATTERY_LEVEL).
+
+    ./benchmark.py --output bench.json
+    ./benchmark.py --grids 2x2,3x3 --batteries 6,10 --compare bench.json
+
+Les résultats sont écrits en json. Avec --compare, chaque mesure est comparée à celle d'un fichier de référence:
+les débits (*_per_s) ne doivent pas baisser, les durées (*_s) et la mémoire (*_bytes) ne doivent pas augmenter, de plus
+de --threshold (et de plus de DURATION_TOLERANCE pour les durées). Chaque mesure est la meilleure de --repeat
+répétitions. Le code de retour est 1 en cas de régression.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import Actions
+import Learning
+from Model import Model
+from Simulator import Simulator
+
+# Constantes des simulations mesurées, les mêmes que main.py sauf les probabilités (< 1 pour avoir des échecs)
+PROBA = 0.9
+MOVING_REWARD = -5
+GOAL_REWARD = 500
+DEAD_REWARD = -100
+CHARGING_REWARD = 0
+GAMMA = 0.95
+EPSILON = 0.1
+ALPHA = 0.01
+
+GRIDS = [(2, 2), (3, 2), (3, 3), (4, 3), (4, 4)]
+BATTERIES = [6, 10, 20, 30]
+# chaque mesure est répétée et on garde la meilleure, les autres étant surtout perturbées par la machine
+REPEAT = 3
+# une durée n'est une régression que si elle dépasse aussi la référence de plus de ça (en seconde): les durées de
+# quelques dizaines de millisecondes varient bien plus que --threshold d'une exécution à l'autre
+DURATION_TOLERANCE = 0.05
+
+
+def make_simulator(grid_size, max_battery_level):
+    """
+    :return simulator, initial_state: le simulateur d'une configuration et son état initial (comme main.py)
+    """
+    simulator = Simulator(grid_size, max_battery_level, PROBA, PROBA, PROBA, MOVING_REWARD, GOAL_REWARD, DEAD_REWARD,
+                          CHARGING_REWARD)
+    initial_state = {
+        "base_pos": [0, 0],
+        "robot_pos": [0, 0],
+        "dirty_cells": [[x, y] for x in range(grid_size[0]) for y in range(grid_size[1]) if [x, y] != [0, 0]],
+        "battery_level": max_battery_level
+    }
+    return simulator, initial_state
+
+
+def rate(function, arguments, duration):
+    """
+    Appelle function sur les arguments (en boucle) pendant duration secondes, REPEAT fois
+    :return: le meilleur nombre d'appels par seconde
+    """
+    rates = []
+    for _ in range(REPEAT):
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < duration:
+            for args in arguments:
+                function(*args)
+            count += len(arguments)
+        rates.append(count / (time.perf_counter() - start))
+    return max(rates)
+
+
+def timed(function, *args, **kwargs):
+    """
+    Exécute REPEAT fois function(*args, **kwargs), ses affichages sont supprimés
+    :return: la meilleure durée en seconde
+    """
+    durations = []
+    for _ in range(REPEAT):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function(*args, **kwargs)
+            durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def count_calls(simulator, name):
+    """
+    Remplace la méthode name du simulateur par une version qui compte ses appels
+    :return: une liste dont le premier élément est le nombre d'appels
+    """
+    counter = [0]
+    method = getattr(simulator, name)
+
+    def counted(*args):
+        counter[0] += 1
+        return method(*args)
+    setattr(simulator, name, counted)
+    return counter
+
+
+def benchmark(grid_size, max_battery_level, duration, max_states):
+    """
+    Mesure une configuration
+    :param grid_size: la taille de la grille
+    :param max_battery_level: le niveau de batterie maximal
+    :param duration: la durée en seconde de chaque mesure de débit
+    :param max_states: les mesures qui énumèrent plus d'états que ça sont sautées
+    :return: un dict nom de la mesure -> valeur
+    """
+    results = dict()
+    simulator, initial_state = make_simulator(grid_size, max_battery_level)
+    codec = simulator.codec
+    results["n_states"] = codec.n_states
+
+    # appels du simulateur sur un échantillon d'états valides et d'actions possibles
+    rng = random.Random(0)
+    samples = []
+    while len(samples) < 1000:
+        battery_level, robot, base, mask = codec.split(rng.randrange(codec.n_states))
+        if not mask >> base & 1:
+            state = codec.decode(codec.pack(battery_level, robot, base, mask))
+            samples.append((rng.choice(simulator.get_actions(state)), state))
+    results["get_per_s"] = rate(simulator.get, samples, duration)
+    results["get_with_model_per_s"] = rate(simulator.get_with_model, samples, duration)
+    encoded = [(action, codec.encode(state)) for action, state in samples]
+    simulator.enable_transition_cache()
+    simulator.transition_cache.build([index for _, index in encoded])
+    results["get_encoded_cached_per_s"] = rate(simulator.get_encoded, encoded, duration)
+    generator = np.random.default_rng(0)
+    batch_states = np.array([index for _, index in encoded])
+    batch_actions = np.array([Actions.ACTION_INDEX[action] for action, _ in encoded])
+    results["step_batch_per_s"] = rate(simulator.step_batch, [(batch_states, batch_actions, generator)],
+                                       duration) * len(encoded)
+
+    # énumération de tous les états
+    if codec.n_states <= max_states:
+        results["get_all_states_s"] = timed(Learning.get_all_states, max_battery_level, grid_size)
+        # le pic de mémoire compte le résultat même s'il est libéré aussitôt
+        tracemalloc.start()
+        Learning.get_all_states(max_battery_level, grid_size)
+        results["get_all_states_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # les algorithmes tournent sur les états atteignables, majorés par (batterie + 1) * cases * 2 ** (cases - 1)
+    if (max_battery_level + 1) * codec.n_cells * codec.mask_size > max_states:
+        return results
+    results["reachable_states_s"] = timed(Learning.get_reachable_indices, simulator, initial_state)
+    indices = Learning.get_reachable_indices(simulator, initial_state)
+    results["n_reachable_states"] = len(indices)
+    results["model_compile_s"] = timed(Model, simulator, indices)
+    model = Model(simulator, indices)
+
+    if len(indices) <= max_states // 10:
+        results["dynamic_programming_s"] = timed(Learning.dynamic_programming, indices, simulator, GAMMA, 0.01)
+    results["vectorized_dynamic_programming_s"] = timed(Learning.vectorized_dynamic_programming, indices, simulator,
+                                                        GAMMA, 0.01, model=model)
+    results["ordered_dynamic_programming_s"] = timed(Learning.ordered_dynamic_programming, indices, simulator, GAMMA,
+                                                     0.01, model=model)
+    results["prioritized_sweeping_s"] = timed(Learning.prioritized_sweeping, indices, simulator, GAMMA, 0.01,
+                                              model=model)
+    results["policy_iteration_s"] = timed(Learning.policy_iteration, indices, simulator, GAMMA, 0.01, model=model)
+
+    # apprentissage: pas de simulation par seconde, mise en place (tables, cache) comprise
+    T = 2 ** codec.n_cells
+    steps = count_calls(simulator, "get_encoded")
+    results["q_learning_steps_per_s"] = results["monte_carlo_episodes_per_s"] = 0.
+    for _ in range(REPEAT):
+        steps[0] = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            Learning.q_learning(indices, simulator, duration, GAMMA, EPSILON, ALPHA, initial_state)
+        results["q_learning_steps_per_s"] = max(results["q_learning_steps_per_s"], steps[0] / duration)
+        steps[0] = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            Learning.monte_carlo(indices, simulator, duration, T, GAMMA, EPSILON, ALPHA, initial_state)
+        results["monte_carlo_episodes_per_s"] = max(results["monte_carlo_episodes_per_s"],
+                                                    steps[0] / (T + 1) / duration)
+
+    # boucle de batched_monte_carlo seule (génération, retours, mises à jour)
+    model.compile_samples(simulator)
+    n_envs = 64
+    q_function = np.zeros((len(model.states), Actions.N_ACTIONS))
+    policy = Learning.random_legal_actions(model.legal, generator.random(len(model.states)))
+    s_initial = model.position(codec.encode(initial_state))
+    episodes = [np.empty((T + 1, n_envs), dtype=np.int64), np.empty((T + 1, n_envs), dtype=np.int64),
+                np.empty((T + 1, n_envs)), np.empty((T + 1, n_envs))]
+
+    def batch():
+        states, actions, rewards, returns = episodes
+        Learning.generate_episodes(model, policy, EPSILON, s_initial, generator, states, actions, rewards)
+        Learning.discounted_returns(rewards, GAMMA, returns)
+        Learning.sequential_updates(q_function.reshape(-1), (states * Actions.N_ACTIONS + actions).T.ravel(),
+                                    returns.T.ravel(), ALPHA)
+    results["batched_monte_carlo_episodes_per_s"] = rate(batch, [()], duration) * n_envs
+    return results
+
+
+def startup():
+    """
+    Mesure REPEAT fois le démarrage de main.py (imports, arguments, simulateur) jusqu'au refus d'une méthode inconnue
+    :return: la meilleure durée en seconde
+    """
+    durations = []
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, main, "--headless", "--cache-dir", "None", "none"], stdout=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare des résultats à une référence
+    :param results: les résultats, dict configuration -> dict mesure -> valeur
+    :param baseline: la référence, même format
+    :param threshold: la variation relative tolérée (et pour les durées, au-delà de DURATION_TOLERANCE)
+    :return: la liste des régressions (configuration, mesure, référence, valeur)
+    """
+    regressions = []
+    for config, measures in sorted(results.items()):
+        for name, value in sorted(measures.items()):
+            reference = baseline.get(config, dict()).get(name)
+            if not reference:
+                continue
+            change = value / reference - 1
+            if name.endswith("_per_s"):
+                regression = change < -threshold
+            elif name.endswith("_s"):
+                regression = change > threshold and value - reference > DURATION_TOLERANCE
+            elif name.endswith("_bytes"):
+                regression = change > threshold
+            else:
+                continue
+            print("{:12} {:40} {:>14.4g} {:>14.4g} {:>+8.1%}{}".format(config, name, reference, value, change,
+                                                                     "  REGRESSION" if regression else ""))
+            if regression:
+                regressions.append((config, name, reference, value))
+    return regressions
+
+
+def parse_grid(text):
+    """
+    :param text: une taille de grille "3x2"
+    :return: le tuple (3, 2)
+    """
+    width, height = text.split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grids", default=",".join("{}x{}".format(*grid) for grid in GRIDS),
+                        help="tailles de grille, séparées par des virgules")
+    parser.add_argument("--batteries", default=",".join(str(battery) for battery in BATTERIES),
+                        help="niveaux de batterie maximaux, séparés par des virgules")
+    parser.add_argument("--duration", type=float, default=1., help="durée de chaque mesure de débit (s)")
+    parser.add_argument("--max-states", type=int, default=300000,
+                        help="taille maximale des espaces d'états énumérés")
+    parser.add_argument("--output", help="fichier json des résultats")
+    parser.add_argument("--compare", help="fichier json de référence")
+    parser.add_argument("--threshold", type=float, default=0.25, help="variation relative tolérée par --compare")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="nombre de répétitions de chaque mesure")
+    args = parser.parse_args()
+    REPEAT = args.repeat
+
+    results = {"startup": {"main_startup_s": startup()}}
+    for grid_size in [parse_grid(grid) for grid in args.grids.split(",")]:
+        for max_battery_level in [int(battery) for battery in args.batteries.split(",")]:
+            config = "{}x{}-b{}".format(grid_size[0], grid_size[1], max_battery_level)
+            print("benchmark", config, file=sys.stderr)
+            results[config] = benchmark(grid_size, max_battery_level, args.duration, args.max_states)
+
+    report = {
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                    "processor": platform.processor()},
+        "parameters": {"duration": args.duration, "max_states": args.max_states, "repeat": args.repeat},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        print(len(regressions), "régression(s)")
+        sys.exit(1 if regressions else 0)
@@ -1,10 +1,25 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import time
+startup = time.perf_counter()
 from Simulator import Simulator
-from State import *
+from State import Display
 from Learning import *
+from Parallel import parallel_q_learning, parallel_monte_carlo, decomposed_dynamic_programming
+from Model import Model
+from Symmetry import Symmetry, ReducedModel
+from Approximation import Features, LinearPolicy, linear_q_learning
+from Storage import Storage
+from Evaluation import evaluate_policy
+import Stats
+import Checkpoint
+import Metrics
+import Plots
+import argparse
 import signal
+import os
 import sys
+import numpy as np
 
 
 # ---------------- Constantes --------------- #
@@ -12,11 +27,31 @@ import sys
 GRID_SIZE = (2, 2)
 PRINT_COUNT = 2
 MAX_BATTERY_LEVEL = 10
-T = 2 ** (GRID_SIZE[0] * GRID_SIZE[1])
+T = None  # None pour 2 ** nombre de cases
 TIME_LIMIT = 6  # en second
 ALPHA = 0.01
 EPSILON = 0.1
 GAMMA = 0.95
+EVALUATION_SWEEPS = None  # policy_iteration: None pour l'évaluation exacte (système linéaire), sinon un nombre de
+                          # balayages par évaluation (modified policy iteration)
+N_ENVS = 64  # nombre d'épisodes générés en parallèle par batched_monte_carlo
+PLANNING_STEPS = 10  # dyna_q_learning: mises à jour de planification par pas réel
+BUFFER_SIZE = 100000  # dyna_q_learning: nombre de transitions gardées dans le tampon
+PRIORITIZED = False  # dyna_q_learning: rejouer les transitions proportionnellement à leur erreur TD
+N_WORKERS = os.cpu_count()  # nombre de processus de parallel_q_learning et parallel_monte_carlo
+TRANSITION_CACHE = "lazy"  # None, "lazy" ou "full"
+STATE_SPACE = "all"  # "all" ou "reachable" (seulement les états atteignables depuis l'état initial, l'affichage ne
+                     # peut alors pas redémarrer sur une autre configuration)
+SYMMETRY = False  # les méthodes de MODEL_METHODS résolvent le MDP réduit aux représentants des symétries de la grille
+DECOMPOSE = False  # DECOMPOSABLE_METHODS résolvent un sous-problème par position de la base, sur N_WORKERS processus
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")  # None pour désactiver le cache disque
+STATS_LOG = None  # fichier json lines des compteurs de l'algorithme (Stats), None pour ne pas les activer
+PROFILE = None  # None, "cprofile" ou "sampling": profile l'appel de l'algorithme
+PROFILE_OUTPUT = None  # fichier du rapport de profilage, sinon seulement affiché
+EVALUATION_EPISODES = 10000  # nombre d'épisodes simulés par ./main.py evaluate <méthode>
+EVALUATION_HORIZON = None  # nombre maximal de pas d'un épisode d'évaluation, None pour 10 * T
+EVALUATION_SEED = 0
+CHECKPOINT_INTERVAL = 60  # q_learning et monte_carlo: temps en seconde entre deux points de reprise, None pour aucun
 # Proba
 MOVING_PROBA = 1
 CLEANING_PROBA = 1
@@ -29,61 +64,459 @@ CHARGING_REWARD = 0
 
 # ------------------------------------------- #
 
-if __name__ == "__main__":
+USAGE = ("Vous devez passez en argument la méthode d'optimisation de votre choix:\n" +
+         "./main.py dynamic_programming\n" +
+         "./main.py vectorized_dynamic_programming\n" +
+         "./main.py ordered_dynamic_programming\n" +
+         "./main.py prioritized_sweeping\n" +
+         "./main.py policy_iteration\n" +
+         "./main.py monte_carlo\n" +
+         "./main.py batched_monte_carlo\n" +
+         "./main.py q_learning\n" +
+         "./main.py dyna_q_learning\n" +
+         "./main.py parallel_q_learning\n" +
+         "./main.py parallel_monte_carlo\n" +
+         "./main.py linear_q_learning\n" +
+         "ou afficher la dernière politique calculée avec ces constantes:\n" +
+         "./main.py display <méthode>\n" +
+         "ou l'évaluer sur EVALUATION_EPISODES épisodes, sans affichage:\n" +
+         "./main.py evaluate <méthode>\n" +
+         "ou reprendre q_learning ou monte_carlo depuis son dernier point de reprise:\n" +
+         "./main.py resume <méthode>\n" +
+         "Les constantes se changent en option, par exemple --grid-size 3x3 --max-battery-level 20, et --headless\n" +
+         "n'ouvre pas l'affichage tkinter")
 
-    if len(sys.argv) != 2:
-        print("Vous devez passez en argument la méthode d'optimisation de votre choix:\n" +
-              "./main.py dynamic_programming\n" +
-              "./main.py monte_carlo\n" +
-              "./main.py q_learning")
-        sys.exit(-1)
 
-    # Instantiate Simulator
-    simulator = Simulator(grid_size=GRID_SIZE,
-                          max_battery_level=MAX_BATTERY_LEVEL,
-                          moving_proba=MOVING_PROBA,
-                          cleaning_proba=CLEANING_PROBA,
-                          charging_proba=CHARGING_PROBA,
-                          moving_reward=MOVING_REWARD,
-                          goal_reward=GOAL_REWARD,
-                          dead_reward=DEAD_REWARD,
-                          charging_reward=CHARGING_REWARD,
+def grid_size(text):
+    """
+    :param text: une taille de grille "3x2"
+    :return: le tuple (3, 2)
+    """
+    width, height = text.split("x")
+    return int(width), int(height)
+
+
+def number(text):
+    """
+    :param text: un nombre
+    :return: un int si c'est un entier, sinon un float (les paramètres font partie des clés du cache disque)
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def boolean(text):
+    """
+    :param text: "True" ou "False"
+    :return: le booléen
+    """
+    if text not in ["True", "False"]:
+        raise argparse.ArgumentTypeError("True ou False attendu: " + text)
+    return text == "True"
+
+
+def optional(kind):
+    """
+    :param kind: la conversion d'une option
+    :return: la même conversion, "None" donnant None
+    """
+    return lambda text: None if text == "None" else kind(text)
+
+
+# constantes modifiables en ligne de commande (--max-battery-level pour MAX_BATTERY_LEVEL), et leur conversion
+OPTIONS = {
+    "GRID_SIZE": grid_size, "PRINT_COUNT": number, "MAX_BATTERY_LEVEL": int, "T": optional(int), "TIME_LIMIT": number,
+    "ALPHA": number, "EPSILON": number, "GAMMA": number, "EVALUATION_SWEEPS": optional(int), "N_ENVS": int,
+    "PLANNING_STEPS": int, "BUFFER_SIZE": int, "PRIORITIZED": boolean,
+    "N_WORKERS": int, "TRANSITION_CACHE": optional(str), "STATE_SPACE": str, "SYMMETRY": boolean,
+    "DECOMPOSE": boolean, "CACHE_DIR": optional(str), "STATS_LOG": optional(str), "PROFILE": optional(str),
+    "PROFILE_OUTPUT": optional(str), "EVALUATION_EPISODES": int,
+    "EVALUATION_HORIZON": optional(int), "EVALUATION_SEED": optional(int), "CHECKPOINT_INTERVAL": optional(number),
+    "MOVING_PROBA": number, "CLEANING_PROBA": number, "CHARGING_PROBA": number, "MOVING_REWARD": number,
+    "GOAL_REWARD": number, "DEAD_REWARD": number, "CHARGING_REWARD": number,
+}
+# valeurs possibles des options à choix, après conversion
+CHOICES = {"TRANSITION_CACHE": [None, "lazy", "full"], "STATE_SPACE": ["all", "reachable"],
+           "PROFILE": [None, "cprofile", "sampling"]}
+
+# méthodes qui travaillent sur le modèle compilé (Model), relu depuis le cache disque s'il y est
+MODEL_METHODS = ["vectorized_dynamic_programming", "ordered_dynamic_programming", "prioritized_sweeping",
+                 "policy_iteration", "batched_monte_carlo", "parallel_q_learning", "parallel_monte_carlo",
+                 "dyna_q_learning"]
+# méthodes sans table des états (approximation): ni ensemble d'états ni modèle, leurs poids sont mis en cache
+APPROXIMATE_METHODS = ["linear_q_learning"]
+# colonnes des courbes (Metrics.Recorder) enregistrées par les méthodes qui en ont, tracées après la résolution
+METRICS = {"dynamic_programming": DP_METRICS, "vectorized_dynamic_programming": DP_METRICS,
+           "q_learning": Q_LEARNING_METRICS, "dyna_q_learning": Q_LEARNING_METRICS,
+           "parallel_q_learning": Q_LEARNING_METRICS, "linear_q_learning": Q_LEARNING_METRICS,
+           "monte_carlo": MONTE_CARLO_METRICS, "batched_monte_carlo": MONTE_CARLO_METRICS,
+           "parallel_monte_carlo": MONTE_CARLO_METRICS}
+# méthodes dont le modèle se décompose en sous-problèmes indépendants (Parallel.decomposed_dynamic_programming)
+DECOMPOSABLE_METHODS = {"vectorized_dynamic_programming": vectorized_dynamic_programming,
+                        "ordered_dynamic_programming": ordered_dynamic_programming,
+                        "prioritized_sweeping": prioritized_sweeping, "policy_iteration": policy_iteration}
+
+
+def plot(method, constants, simulator, series):
+    """
+    Trace les courbes enregistrées par une méthode de METRICS pendant sa résolution
+    :param method: le nom de la méthode
+    :param constants: les constantes
+    :param simulator: le simulateur
+    :param series: les séries du Metrics.Recorder passé à solve
+    """
+    c = constants
+    if METRICS[method] is DP_METRICS:
+        Plots.plot_mean_values(series["iteration"], series["mean_value"], simulator, c["EPSILON"])
+    elif METRICS[method] is MONTE_CARLO_METRICS:
+        Plots.plot_monte_carlo(series["elapsed"], series["mean_reward"], series["v_s0"], simulator, c["T"],
+                               c["TIME_LIMIT"])
+    else:
+        Plots.plot_q_learning(series["elapsed"], series["q_value_s0"], simulator, c["TIME_LIMIT"])
+
+
+def parse_arguments(argv):
+    """
+    Lit la ligne de commande
+    :param argv: les arguments
+    :return args: la commande (["méthode"] ou ["display" | "evaluate" | "resume", "méthode"]), headless et une
+    valeur par constante de OPTIONS, la constante elle-même par défaut
+    """
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="*", help="[display | evaluate | resume] méthode")
+    parser.add_argument("--headless", action="store_true", help="ne pas ouvrir l'affichage tkinter")
+    for name, kind in OPTIONS.items():
+        parser.add_argument("--" + name.lower().replace("_", "-"), dest=name, type=kind, default=globals()[name],
+                            choices=CHOICES.get(name), help="défaut: " + str(globals()[name]))
+    return parser.parse_args(argv)
+
+# ------------------------------------------- #
+
+
+def load_model(storage, simulator, all_states, state_space, symmetry=None):
+    """
+    Relit le modèle compilé depuis le cache disque, ou le compile et l'y enregistre
+    :param storage: le cache disque (Storage), ou None
+    :param simulator: le simulateur
+    :param all_states: les index des états à compiler
+    :param state_space: ce qui détermine all_states (voir Storage.entry_path)
+    :param symmetry: si donné, les symétries (Symmetry) par lesquelles réduire le modèle (ReducedModel)
+    :return: le modèle
+    """
+    model = storage.load_model(state_space) if storage is not None else None
+    if model is not None and symmetry is not None:
+        model = ReducedModel.from_model(model, symmetry)
+    if model is None:
+        model = Model(simulator, all_states) if symmetry is None else ReducedModel(simulator, all_states, symmetry)
+        if storage is not None:
+            storage.save_model(model, state_space)
+    return model
+
+
+def complete(constants):
+    """
+    Remplace les constantes à None qui ont une valeur par défaut calculée (T, EVALUATION_HORIZON)
+    :param constants: un dict nom -> valeur des constantes de OPTIONS
+    :return: le même dict, modifié
+    """
+    if constants["T"] is None:
+        constants["T"] = 2 ** (constants["GRID_SIZE"][0] * constants["GRID_SIZE"][1])
+    if constants["EVALUATION_HORIZON"] is None:
+        constants["EVALUATION_HORIZON"] = 10 * constants["T"]
+    return constants
+
+
+def make_simulator(constants):
+    """
+    :param constants: les constantes (globals() de main.py ou une configuration de sweep.py)
+    :return: le simulateur, avec le cache de transitions de TRANSITION_CACHE
+    """
+    simulator = Simulator(grid_size=constants["GRID_SIZE"],
+                          max_battery_level=constants["MAX_BATTERY_LEVEL"],
+                          moving_proba=constants["MOVING_PROBA"],
+                          cleaning_proba=constants["CLEANING_PROBA"],
+                          charging_proba=constants["CHARGING_PROBA"],
+                          moving_reward=constants["MOVING_REWARD"],
+                          goal_reward=constants["GOAL_REWARD"],
+                          dead_reward=constants["DEAD_REWARD"],
+                          charging_reward=constants["CHARGING_REWARD"],
                           )
+    if constants["TRANSITION_CACHE"]:
+        simulator.enable_transition_cache(full=constants["TRANSITION_CACHE"] == "full")
+    return simulator
+
+
+def check_index_width(method, simulator):
+    """
+    Les méthodes tabulaires et l'évaluation de leurs politiques rangent les index des états dans des tableaux int64,
+    seules celles de APPROXIMATE_METHODS travaillent sans index
+    :return: le message d'erreur si les index du codec du simulateur dépassent int64 pour cette méthode, sinon None
+    """
+    if method not in APPROXIMATE_METHODS and simulator.codec.n_states > np.iinfo(np.int64).max:
+        return "les index des états d'une grille {}x{} dépassent int64, méthodes possibles: {}".format(
+            *simulator.grid_size, ", ".join(APPROXIMATE_METHODS))
+    return None
 
-    # Instantiate states list
-    all_states = get_all_states(MAX_BATTERY_LEVEL, GRID_SIZE)
-    print("GRID SIZE:", GRID_SIZE)
-    print("nombre d'états:", len(all_states))
-    print("Time limit:", TIME_LIMIT)
-    print("T:", T)
-    print("Battery Level:", MAX_BATTERY_LEVEL)
 
-    initial_state = {
+def make_initial_state(grid_size, max_battery_level):
+    """
+    :return: l'état initial, robot et base en (0, 0), batterie pleine et tout le reste sale
+    """
+    return {
         "base_pos": [0, 0],
         "robot_pos": [0, 0],
-        "dirty_cells": [[x, y] for x in range(GRID_SIZE[0]) for y in range(GRID_SIZE[1]) if [x, y] != [0, 0]],
-        "battery_level": MAX_BATTERY_LEVEL
+        "dirty_cells": [[x, y] for x in range(grid_size[0]) for y in range(grid_size[1]) if [x, y] != [0, 0]],
+        "battery_level": max_battery_level
     }
 
-    # Algo d'optimisation
-    signal.signal(signal.SIGINT, signal_handler)
 
-    if sys.argv[1] == "dynamic_programming":
-        title = "DP"
-        policy = dynamic_programming(all_states, simulator, GAMMA, EPSILON)
+def make_state_space(constants, simulator, initial_state):
+    """
+    L'ensemble d'états, et donc ce qui est mis en cache, dépend de STATE_SPACE, de l'état initial et de SYMMETRY
+    :return: un dict sérialisable en json (voir Storage.entry_path)
+    """
+    state_space = {"state_space": constants["STATE_SPACE"]}
+    if constants["STATE_SPACE"] == "reachable":
+        state_space["initial_state"] = simulator.codec.encode(initial_state)
+    if constants["SYMMETRY"]:
+        state_space["symmetry"] = True
+    return state_space
+
+
+def make_states(constants, simulator, initial_state):
+    """
+    :return: les index des états de STATE_SPACE, un range pour "all" (voir get_all_states)
+    """
+    if constants["STATE_SPACE"] == "reachable":
+        return get_reachable_indices(simulator, initial_state)
+    return get_all_states(constants["MAX_BATTERY_LEVEL"], constants["GRID_SIZE"])
+
+
+def make_hyperparameters(constants, state_space):
+    """
+    :return: un dict méthode -> les paramètres qui déterminent sa politique (clé du cache disque)
+    """
+    c = constants
+    hyperparameters = {
+        "dynamic_programming": {"gamma": c["GAMMA"], "epsilon": c["EPSILON"]},
+        "vectorized_dynamic_programming": {"gamma": c["GAMMA"], "epsilon": c["EPSILON"]},
+        "ordered_dynamic_programming": {"gamma": c["GAMMA"], "epsilon": c["EPSILON"]},
+        "prioritized_sweeping": {"gamma": c["GAMMA"], "epsilon": c["EPSILON"]},
+        "policy_iteration": {"gamma": c["GAMMA"], "epsilon": c["EPSILON"], "evaluation_sweeps": c["EVALUATION_SWEEPS"]},
+        "q_learning": {"time_limit": c["TIME_LIMIT"], "gamma": c["GAMMA"], "epsilon": c["EPSILON"],
+                       "alpha": c["ALPHA"]},
+        "dyna_q_learning": {"time_limit": c["TIME_LIMIT"], "gamma": c["GAMMA"], "epsilon": c["EPSILON"],
+                            "alpha": c["ALPHA"], "planning_steps": c["PLANNING_STEPS"],
+                            "buffer_size": c["BUFFER_SIZE"], "prioritized": c["PRIORITIZED"]},
+        "monte_carlo": {"time_limit": c["TIME_LIMIT"], "T": c["T"], "gamma": c["GAMMA"], "epsilon": c["EPSILON"],
+                        "alpha": c["ALPHA"]},
+        "batched_monte_carlo": {"time_limit": c["TIME_LIMIT"], "T": c["T"], "gamma": c["GAMMA"],
+                                "epsilon": c["EPSILON"], "alpha": c["ALPHA"], "n_envs": c["N_ENVS"]},
+        "parallel_q_learning": {"time_limit": c["TIME_LIMIT"], "gamma": c["GAMMA"], "epsilon": c["EPSILON"],
+                                "alpha": c["ALPHA"], "n_workers": c["N_WORKERS"]},
+        "parallel_monte_carlo": {"time_limit": c["TIME_LIMIT"], "T": c["T"], "gamma": c["GAMMA"],
+                                 "epsilon": c["EPSILON"], "alpha": c["ALPHA"], "n_envs": c["N_ENVS"],
+                                 "n_workers": c["N_WORKERS"]},
+        "linear_q_learning": {"time_limit": c["TIME_LIMIT"], "gamma": c["GAMMA"], "epsilon": c["EPSILON"],
+                              "alpha": c["ALPHA"]},
+    }
+    for parameters in hyperparameters.values():
+        parameters.update(state_space)
+    return hyperparameters
+
+
+def solve(method, constants, simulator, all_states, initial_state, model=None, tables=None, checkpointer=None,
+          resume=None, recorder=None):
+    """
+    Lance l'algorithme d'optimisation d'une méthode
+    :param method: le nom de la méthode
+    :param constants: les constantes (globals() de main.py ou une configuration de sweep.py)
+    :param model: le modèle compilé des méthodes de MODEL_METHODS
+    :param tables: voir Learning
+    :param checkpointer, resume: voir q_learning et monte_carlo
+    :param recorder: le Metrics.Recorder des courbes des méthodes de METRICS
+    :return: la politique, de tous les états de all_states avec un modèle réduit par symétrie (tables aussi étendues)
+    """
+    c = constants
+    if c["DECOMPOSE"] and method in DECOMPOSABLE_METHODS:
+        kwargs = {"evaluation_sweeps": c["EVALUATION_SWEEPS"]} if method == "policy_iteration" else dict()
+        policy = decomposed_dynamic_programming(DECOMPOSABLE_METHODS[method], all_states, simulator, c["GAMMA"],
+                                                c["EPSILON"], c["N_WORKERS"], model=model, tables=tables, **kwargs)
+    elif method == "dynamic_programming":
+        policy = dynamic_programming(all_states, simulator, c["GAMMA"], c["EPSILON"], tables=tables, recorder=recorder)
         # policy = our_dynamic_programming(all_states, simulator, T)
-    elif sys.argv[1] == "q_learning":
-        #policy = our_q_learning(all_states, simulator, T, TIME_LIMIT, ALPHA,)
-        title = "QL -> time_limit: " + str(TIME_LIMIT)
-        policy = q_learning(all_states, simulator, TIME_LIMIT, GAMMA, EPSILON, ALPHA, initial_state)
-    elif sys.argv[1] == "monte_carlo":
-        title = "MC -> T: " + str(T) + ", time_limit: " + str(TIME_LIMIT)
-        policy = monte_carlo(all_states, simulator, TIME_LIMIT, T, GAMMA, EPSILON, ALPHA, initial_state, step=PRINT_COUNT)
+    elif method == "vectorized_dynamic_programming":
+        policy = vectorized_dynamic_programming(all_states, simulator, c["GAMMA"], c["EPSILON"], model=model,
+                                                tables=tables, recorder=recorder)
+    elif method == "ordered_dynamic_programming":
+        policy = ordered_dynamic_programming(all_states, simulator, c["GAMMA"], c["EPSILON"], model=model,
+                                             tables=tables)
+    elif method == "prioritized_sweeping":
+        policy = prioritized_sweeping(all_states, simulator, c["GAMMA"], c["EPSILON"], model=model, tables=tables)
+    elif method == "policy_iteration":
+        policy = policy_iteration(all_states, simulator, c["GAMMA"], c["EPSILON"], c["EVALUATION_SWEEPS"], model=model,
+                                  tables=tables)
+    elif method == "q_learning":
+        # policy = our_q_learning(all_states, simulator, T, TIME_LIMIT, ALPHA,)
+        policy = q_learning(all_states, simulator, c["TIME_LIMIT"], c["GAMMA"], c["EPSILON"], c["ALPHA"], initial_state,
+                            tables=tables, checkpointer=checkpointer, resume=resume, recorder=recorder)
+    elif method == "dyna_q_learning":
+        policy = dyna_q_learning(all_states, simulator, c["TIME_LIMIT"], c["GAMMA"], c["EPSILON"], c["ALPHA"],
+                                 initial_state, c["PLANNING_STEPS"], c["BUFFER_SIZE"], c["PRIORITIZED"], model=model,
+                                 tables=tables, recorder=recorder)
+    elif method == "monte_carlo":
+        policy = monte_carlo(all_states, simulator, c["TIME_LIMIT"], c["T"], c["GAMMA"], c["EPSILON"], c["ALPHA"],
+                             initial_state, step=c["PRINT_COUNT"], tables=tables, checkpointer=checkpointer,
+                             resume=resume, recorder=recorder)
+    elif method == "batched_monte_carlo":
+        policy = batched_monte_carlo(all_states, simulator, c["TIME_LIMIT"], c["T"], c["GAMMA"], c["EPSILON"],
+                                     c["ALPHA"], initial_state, c["N_ENVS"], step=c["PRINT_COUNT"], model=model,
+                                     tables=tables, recorder=recorder)
+    elif method == "parallel_q_learning":
+        policy = parallel_q_learning(all_states, simulator, c["TIME_LIMIT"], c["GAMMA"], c["EPSILON"], c["ALPHA"],
+                                     initial_state, c["N_WORKERS"], model=model, tables=tables, recorder=recorder)
+    elif method == "parallel_monte_carlo":
+        policy = parallel_monte_carlo(all_states, simulator, c["TIME_LIMIT"], c["T"], c["GAMMA"], c["EPSILON"],
+                                      c["ALPHA"], initial_state, c["N_WORKERS"], c["N_ENVS"], step=c["PRINT_COUNT"],
+                                      model=model, tables=tables, recorder=recorder)
+    elif method == "linear_q_learning":
+        policy = linear_q_learning(simulator, c["TIME_LIMIT"], c["GAMMA"], c["EPSILON"], c["ALPHA"], initial_state,
+                                   tables=tables, recorder=recorder)
     else:
+        raise ValueError("méthode inconnue: " + method)
+    # seules les méthodes de MODEL_METHODS résolvent le modèle réduit, les autres ont déjà une politique complète
+    if method in MODEL_METHODS and isinstance(model, ReducedModel):
+        policy = model.expand(all_states, policy, tables)
+    return policy
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments(sys.argv[1:])
+    if len(args.command) != 1 and (len(args.command) != 2 or args.command[0] not in ["display", "evaluate", "resume"]):
+        print(USAGE)
+        sys.exit(-1)
+    mode = args.command[0] if len(args.command) == 2 else "train"
+    method = args.command[-1]
+    if args.headless and mode == "display":
+        print("display n'a pas de sens avec --headless")
+        sys.exit(-1)
+    globals().update(complete({name: getattr(args, name) for name in OPTIONS}))
+
+    # Instantiate Simulator
+    simulator = make_simulator(globals())
+    storage = Storage(simulator, CACHE_DIR) if CACHE_DIR else None
+    print("démarrage (imports, arguments, simulateur): {:.3f}s".format(time.perf_counter() - startup))
+
+    initial_state = make_initial_state(GRID_SIZE, MAX_BATTERY_LEVEL)
+    state_space = make_state_space(globals(), simulator, initial_state)
+    hyperparameters = make_hyperparameters(globals(), state_space)
+    titles = {
+        "dynamic_programming": "DP",
+        "vectorized_dynamic_programming": "DP",
+        "ordered_dynamic_programming": "DP",
+        "prioritized_sweeping": "DP",
+        "policy_iteration": "PI",
+        "q_learning": "QL -> time_limit: " + str(TIME_LIMIT),
+        "dyna_q_learning": "Dyna-Q -> time_limit: " + str(TIME_LIMIT) + ", planning_steps: " + str(PLANNING_STEPS),
+        "monte_carlo": "MC -> T: " + str(T) + ", time_limit: " + str(TIME_LIMIT),
+        "batched_monte_carlo": "MC -> T: " + str(T) + ", time_limit: " + str(TIME_LIMIT) + ", n_envs: " + str(N_ENVS),
+        "parallel_q_learning": "QL -> time_limit: " + str(TIME_LIMIT) + ", workers: " + str(N_WORKERS),
+        "parallel_monte_carlo": "MC -> T: " + str(T) + ", time_limit: " + str(TIME_LIMIT) + ", n_envs: " + str(N_ENVS) +
+                                ", workers: " + str(N_WORKERS),
+        "linear_q_learning": "QL linéaire -> time_limit: " + str(TIME_LIMIT),
+    }
+    if method not in hyperparameters:
         print("Argument invalide")
         sys.exit(-1)
+    if check_index_width(method, simulator):
+        print(check_index_width(method, simulator))
+        sys.exit(-1)
+    title = titles[method]
+    if DECOMPOSE and method not in DECOMPOSABLE_METHODS:
+        print("DECOMPOSE n'est possible qu'avec", ", ".join(DECOMPOSABLE_METHODS))
+        sys.exit(-1)
+    if mode == "resume" and method not in ["q_learning", "monte_carlo"]:
+        print("Seuls q_learning et monte_carlo ont des points de reprise")
+        sys.exit(-1)
+
+    # Les politiques déterministes (DP, PI) sont réutilisées, celles de MC et QL ne sont relues que pour l'affichage
+    policy = None
+    deterministic = ["dynamic_programming", "vectorized_dynamic_programming", "ordered_dynamic_programming",
+                     "prioritized_sweeping", "policy_iteration"]
+    if storage is not None and (mode in ["display", "evaluate"] or method in deterministic):
+        if method in APPROXIMATE_METHODS:
+            arrays = storage.load_arrays(method, ["weights"], hyperparameters[method])
+            if arrays is not None:
+                policy = LinearPolicy(simulator, Features(GRID_SIZE, MAX_BATTERY_LEVEL), arrays["weights"])
+        else:
+            policy = storage.load_policy(method, hyperparameters[method])
+        if policy is not None:
+            print("politique relue depuis", storage.entry_path(method, hyperparameters[method]))
+    if policy is None and mode in ["display", "evaluate"]:
+        print("Aucune politique en cache pour", method, "avec ces constantes")
+        sys.exit(-1)
+
+    if policy is None:
+        # Instantiate states list
+        all_states = [] if method in APPROXIMATE_METHODS else make_states(globals(), simulator, initial_state)
+        print("GRID SIZE:", GRID_SIZE)
+        if method not in APPROXIMATE_METHODS:
+            print("nombre d'états:", len(all_states))
+        print("Time limit:", TIME_LIMIT)
+        print("T:", T)
+        print("Battery Level:", MAX_BATTERY_LEVEL)
+
+        # Algo d'optimisation
+        signal.signal(signal.SIGINT, signal_handler)
+        tables = dict()
+        if STATS_LOG:
+            Stats.enable(STATS_LOG)
+        # les méthodes vectorisées travaillent sur le modèle compilé, relu depuis le cache disque s'il y est
+        model = None
+        if method in MODEL_METHODS:
+            model = load_model(storage, simulator, all_states, state_space,
+                               Symmetry(simulator) if SYMMETRY else None)
+        # points de reprise et courbes (metrics.csv, voir Plots.py) de q_learning et monte_carlo, dans le cache disque
+        checkpointer, resume, recorder = None, None, None
+        if storage is not None and method in ["q_learning", "monte_carlo"]:
+            checkpoint_path = storage.checkpoint_path(method, hyperparameters[method])
+            if CHECKPOINT_INTERVAL is not None:
+                checkpointer = Checkpoint.Checkpointer(checkpoint_path, CHECKPOINT_INTERVAL)
+            if mode == "resume":
+                resume = Checkpoint.load(checkpoint_path)
+                if resume is None:
+                    print("Aucun point de reprise pour", method, "avec ces constantes")
+                    sys.exit(-1)
+                print("reprise depuis", checkpoint_path, "après {:.0f}s".format(float(resume["elapsed"])))
+            metrics_path = os.path.join(os.path.dirname(checkpoint_path), "metrics.csv")
+            recorder = Metrics.Recorder(METRICS[method], path=metrics_path, append=resume is not None)
+        if recorder is None and method in METRICS:
+            recorder = Metrics.Recorder(METRICS[method])
+        with Stats.profiled(PROFILE, PROFILE_OUTPUT):
+            policy = solve(method, globals(), simulator, all_states, initial_state, model=model, tables=tables,
+                           checkpointer=checkpointer, resume=resume, recorder=recorder)
+        Stats.disable()
+        # les courbes sont tracées une fois l'algorithme terminé (rien n'est enregistré avec DECOMPOSE)
+        if recorder is not None:
+            recorder.close()
+            if recorder.count:
+                plot(method, globals(), simulator, recorder.series())
+        if storage is not None and method in APPROXIMATE_METHODS:
+            storage.save_arrays(method, hyperparameters[method], **tables)
+        elif storage is not None:
+            storage.save_policy(method, hyperparameters[method], policy, tables)
+
+    if mode == "evaluate":
+        evaluate_policy(simulator, policy, [simulator.codec.encode(initial_state)], EVALUATION_EPISODES,
+                        EVALUATION_HORIZON, seed=EVALUATION_SEED, n_workers=N_WORKERS)
+        sys.exit(0)
+
+    if args.headless:
+        sys.exit(0)
 
-    Debug()
     # Display
     display = Display(simulator, policy, GRID_SIZE, MAX_BATTERY_LEVEL, initial_state, title)
     display.run()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Balayage des constantes de main.py: chaque configuration, d'une grille (produit cartésien des --set) ou d'une liste
+(--configs, un fichier json de dicts constante -> valeur), est résolue par chacune des --methods, les tâches étant
+réparties sur un pool de processus, puis sa politique est évaluée (Evaluation). Une ligne par tâche dans un csv.
+
+    ./sweep.py --methods vectorized_dynamic_programming,q_learning --set GRID_SIZE=2x2,3x2 --set ALPHA=0.01,0.1
+    ./sweep.py --configs sweep.json --workers 8 --output sweep.csv
+
+Les configurations de même dynamique (Storage.simulator_parameters) et de même ensemble d'états partagent le
+simulateur et son cache de transitions, l'ensemble d'états et le modèle compilé: ils sont construits une fois par le
+processus principal avant la répartition (le modèle est relu du cache disque s'il y est) et hérités par les processus.
+Les constantes non balayées gardent la valeur de main.py.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+import numpy as np
+import main
+from Evaluation import evaluate_policy
+from Storage import Storage, simulator_parameters, parameters_hash
+from Symmetry import Symmetry
+
+# sans parallel_q_learning et parallel_monte_carlo, les processus du pool ne pouvant pas en créer d'autres
+METHODS = ["dynamic_programming", "vectorized_dynamic_programming", "ordered_dynamic_programming",
+           "prioritized_sweeping", "policy_iteration", "q_learning", "dyna_q_learning", "monte_carlo",
+           "batched_monte_carlo", "linear_q_learning"]
+STATISTICS = ["mean_return", "std_return", "success_rate", "death_rate", "mean_steps", "mean_steps_to_goal",
+              "mean_reward"]
+
+# simulateurs, états et modèles des groupes de configurations, hérités par les processus à leur création
+groups = None
+
+
+def parse_set(text):
+    """
+    :param text: "CONSTANTE=valeur,valeur..."
+    :return name, values: la constante et ses valeurs converties comme en option de main.py
+    """
+    name, _, values = text.partition("=")
+    name = name.upper().replace("-", "_")
+    if name not in main.OPTIONS:
+        raise argparse.ArgumentTypeError("constante inconnue: " + name)
+    values = [main.OPTIONS[name](value) for value in values.split(",")]
+    invalid = [value for value in values if name in main.CHOICES and value not in main.CHOICES[name]]
+    if invalid:
+        raise argparse.ArgumentTypeError("valeur invalide de {}: {} (parmi {})".format(
+            name, invalid[0], ", ".join(map(str, main.CHOICES[name]))))
+    return name, values
+
+
+def read_configs(path):
+    """
+    :param path: un fichier json, une liste de dicts constante -> valeur (les chaînes sont converties comme en option)
+    :return: la liste des configurations
+    """
+    with open(path) as f:
+        configs = json.load(f)
+    converted = []
+    for config in configs:
+        unknown = [name for name in config if name not in main.OPTIONS]
+        if unknown:
+            raise ValueError("constantes inconnues: " + ", ".join(unknown))
+        config = {name: main.OPTIONS[name](value) if isinstance(value, str) else
+                  tuple(value) if isinstance(value, list) else value for name, value in config.items()}
+        invalid = [name for name, value in config.items() if name in main.CHOICES and value not in main.CHOICES[name]]
+        if invalid:
+            raise ValueError("valeurs invalides: " + ", ".join(name + "=" + str(config[name]) for name in invalid))
+        converted.append(config)
+    return converted
+
+
+def make_configs(sets, configs):
+    """
+    :param sets: les listes (constante, valeurs) des --set
+    :param configs: les configurations de --configs, ou None
+    :return: les configurations, chacune croisée avec la grille des --set
+    """
+    names = [name for name, _ in sets]
+    grid = [dict(zip(names, values)) for values in itertools.product(*[values for _, values in sets])]
+    return [dict(config, **point) for config in (configs or [{}]) for point in grid]
+
+
+def constants(config):
+    """
+    :param config: les constantes modifiées
+    :return: toutes les constantes (celles de main.py par défaut), complétées par main.complete
+    """
+    values = {name: getattr(main, name) for name in main.OPTIONS}
+    values.update(config)
+    return main.complete(values)
+
+
+def prepare(jobs):
+    """
+    Construit une fois par groupe de même dynamique et même ensemble d'états le simulateur et, si une méthode du
+    groupe en a besoin, les états (pas pour main.APPROXIMATE_METHODS) et le modèle compilé
+    :param jobs: les tâches, (index, méthode, constantes, graine)
+    :return groups, keys: un dict clé -> (simulateur, états initial, états, modèle) et la clé de chaque tâche
+    """
+    groups, keys = dict(), []
+    for _, method, c, _ in jobs:
+        simulator = main.make_simulator(c)
+        initial_state = main.make_initial_state(c["GRID_SIZE"], c["MAX_BATTERY_LEVEL"])
+        state_space = main.make_state_space(c, simulator, initial_state)
+        key = parameters_hash(dict(simulator_parameters(simulator), transition_cache=c["TRANSITION_CACHE"],
+                                   **state_space))
+        if key not in groups:
+            groups[key] = [simulator, initial_state, None, None]
+        group = groups[key]
+        if method not in main.APPROXIMATE_METHODS and group[2] is None:
+            group[2] = main.make_states(c, simulator, initial_state)
+        if method in main.MODEL_METHODS and group[3] is None:
+            storage = Storage(group[0], c["CACHE_DIR"]) if c["CACHE_DIR"] else None
+            group[3] = main.load_model(storage, group[0], group[2], state_space,
+                                       Symmetry(group[0]) if c["SYMMETRY"] else None)
+        keys.append(key)
+    return groups, keys
+
+
+def initialize_worker(prepared, pool=True):
+    """
+    Initialisation d'un processus du pool, dont le Ctrl-C est laissé au processus principal
+    """
+    global groups
+    groups = prepared
+    if pool:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_job(job):
+    """
+    Résout une configuration par une méthode et évalue sa politique
+    :param job: (index, méthode, constantes, graine, clé du groupe)
+    :return index, row: l'index de la tâche et sa ligne de résultats
+    """
+    index, method, c, seed, key = job
+    # les processus du pool ne peuvent pas en créer d'autres (DECOMPOSE)
+    c = dict(c, N_WORKERS=1)
+    simulator, initial_state, all_states, model = groups[key]
+    random.seed(seed)
+    # les algorithmes affichent leur progression, inutile quand plusieurs tournent en même temps
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        # le modèle du groupe (réduit avec SYMMETRY) n'est donné qu'aux méthodes qui le résolvent
+        policy = main.solve(method, c, simulator, all_states or [], initial_state,
+                            model=model if method in main.MODEL_METHODS else None, tables=dict())
+        duration = time.perf_counter() - start
+        statistics = evaluate_policy(simulator, policy, [simulator.codec.encode(initial_state)],
+                                     c["EVALUATION_EPISODES"], c["EVALUATION_HORIZON"], seed=c["EVALUATION_SEED"])
+    row = {"method": method, "n_states": len(all_states) if all_states is not None else None,
+           "duration_s": duration}
+    row.update({name: statistics[name] for name in STATISTICS})
+    return index, row
+
+
+def sweep(configs, methods, n_workers, seed=0):
+    """
+    :param configs: les configurations, des dicts constante -> valeur
+    :param methods: les méthodes à lancer sur chaque configuration
+    :param n_workers: le nombre de processus
+    :param seed: la graine des tâches, chacune a la sienne (random.seed), indépendante de l'ordre d'exécution
+    :return: les lignes de résultats, dans l'ordre des configurations puis des méthodes
+    """
+    tasks = [(config, method) for config in configs for method in methods]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(tasks))]
+    jobs = [(index, method, constants(config), s) for index, ((config, method), s) in enumerate(zip(tasks, seeds))]
+    start = time.perf_counter()
+    prepared, keys = prepare(jobs)
+    print("{} tâches, {} groupes de dynamique préparés en {:.2f}s".format(len(jobs), len(prepared),
+                                                                      time.perf_counter() - start))
+    jobs = [job + (key,) for job, key in zip(jobs, keys)]
+
+    rows = [None] * len(jobs)
+    if n_workers > 1:
+        with multiprocessing.Pool(n_workers, initializer=initialize_worker, initargs=(prepared,)) as pool:
+            results = pool.imap_unordered(run_job, jobs)
+            for done, (index, row) in enumerate(results, 1):
+                rows[index] = dict(tasks[index][0], **row)
+                print("[{}/{}]".format(done, len(jobs)), format_row(rows[index]))
+    else:
+        initialize_worker(prepared, pool=False)
+        for done, job in enumerate(jobs, 1):
+            index, row = run_job(job)
+            rows[index] = dict(tasks[index][0], **row)
+            print("[{}/{}]".format(done, len(jobs)), format_row(rows[index]))
+    return rows
+
+
+def format_row(row):
+    """
+    :return: une ligne de résultats lisible
+    """
+    return " ".join("{}={}".format(name, "{:.4g}".format(value) if isinstance(value, float) else value)
+                    for name, value in row.items())
+
+
+def write_table(rows, path):
+    """
+    Ecrit les résultats en csv, une colonne par constante balayée
+    :param rows: les lignes de résultats
+    :param path: le fichier csv
+    """
+    columns = []
+    for row in rows:
+        columns += [name for name in row if name not in columns]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({name: "x".join(map(str, value)) if isinstance(value, (tuple, list)) else value
+                             for name, value in row.items()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--methods", default="vectorized_dynamic_programming",
+                        help="les méthodes, séparées par des virgules, parmi " + ", ".join(METHODS))
+    parser.add_argument("--set", dest="sets", type=parse_set, action="append", default=[],
+                        help="CONSTANTE=valeur,valeur... une dimension de la grille (GRID_SIZE=2x2,3x2)")
+    parser.add_argument("--configs", help="fichier json, une liste de dicts constante -> valeur")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="nombre de processus")
+    parser.add_argument("--seed", type=int, default=0, help="graine des tâches")
+    parser.add_argument("--output", default="sweep.csv", help="fichier csv des résultats")
+    args = parser.parse_args()
+
+    methods = args.methods.split(",")
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        print("Méthodes invalides:", ", ".join(unknown), "(parmi " + ", ".join(METHODS) + ")")
+        sys.exit(-1)
+    configs = make_configs(args.sets, read_configs(args.configs) if args.configs else None)
+    ignored = [method for method in methods if method not in main.DECOMPOSABLE_METHODS]
+    if ignored and any(constants(config)["DECOMPOSE"] for config in configs):
+        print("DECOMPOSE ignoré par", ", ".join(ignored))
+    errors = {main.check_index_width(method, main.make_simulator(constants(config)))
+              for config in configs for method in methods} - {None}
+    if errors:
+        print("\n".join(sorted(errors)))
+        sys.exit(-1)
+    try:
+        rows = sweep(configs, methods, args.workers, args.seed)
+    except KeyboardInterrupt:
+        print("interrompu")
+        sys.exit(-1)
+    write_table(rows, args.output)
+    print("résultats dans", args.output)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Balayage d'un groupe qui mélange une méthode de MODEL_METHODS et une méthode par échantillonnage avec SYMMETRY: le
+modèle réduit du groupe ne doit servir qu'à la première. A lancer avec pytest ou directement.
+"""
+import random
+import sweep
+
+
+def test_mixed_methods_with_symmetry():
+    random.seed(0)
+    configs = [{"SYMMETRY": True, "TIME_LIMIT": 1, "EVALUATION_EPISODES": 100, "EVALUATION_HORIZON": 50,
+                "CACHE_DIR": None}]
+    methods = ["vectorized_dynamic_programming", "q_learning", "dyna_q_learning"]
+    rows = sweep.sweep(configs, methods, n_workers=1)
+    assert [row["method"] for row in rows] == methods
+    # la politique de programmation dynamique, étendue du modèle réduit à tous les états, atteint le but
+    assert rows[0]["success_rate"] == 1.
+
+
+if __name__ == "__main__":
+    test_mixed_methods_with_symmetry()
+    print("ok")